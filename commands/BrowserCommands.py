@@ -39,7 +39,7 @@ class BrowserCommands(broker.CommandGroup):
 
         #infosets are only children
         if shape == r.INFOSET_PATH:
-            infoSet = InformationSet(path,r.symm_tree,False)
+            infoSet = InformationSet(path,r.symm_tree,r,False)
             console.writeline("\n" + " " * depth * 2 + "Information Set Contents:")
             console.writeline(" " * depth * 2 + "{} Reads {} Writes".format(infoSet.reads(),infoSet.writes()))
             console.writeline(" " * depth * 2 + "Average Strategy: " + str(infoSet.get_average_strategy()))
@@ -50,10 +50,14 @@ class BrowserCommands(broker.CommandGroup):
         #this is not an infoset, show the children
         else:
 
-            #list all the children of this node
-            for child in r.symm_tree.children(path):
+            #how many levels below this node we list (just the children by default)
+            levels = int(parameters[0]) if len(parameters) > 0 else 1
+
+            #walk the nodes below this one (indented by how far below us they are)
+            for (child, _, _) in r.symm_tree.walk(path, levels):
                 #get display name of the node
-                displayName = "{}:{} - {}".format(child[0],child[1],r.game_abstractor.unpack_regret_path([(child[0],child[1])])[0])
+                depth = len(child) - len(path) - 1
+                displayName = "{}:{} - {}".format(child[-1][0],child[-1][1],r.game_abstractor.unpack_regret_path([child[-1]])[0])
 
                 #print the node name and regrets
                 console.writeline(" " * depth * 2 + displayName + " Regrets ")
@@ -80,7 +84,7 @@ class BrowserCommands(broker.CommandGroup):
     def registerCommands(self):
 
         #add our commands to the broker
-        broker.registerCommand("ls",self.ls,0,"List regrets at path",[])
+        broker.registerCommand("ls",self.ls,0,"List regrets at path",["LS [DEPTH]","","DEPTH - how many levels below the path to list (default 1)"])
         broker.registerCommand("cd",self.cd,1,"Change path",[])
 
 #register our command group
@@ -5,6 +5,7 @@ import glob
 import os
 import games
 from engine.Regrets import RegretManager
+from engine.Planner import Planner
 
 #a sample command group with some sample commands
 class Regrets(broker.CommandGroup):
@@ -28,11 +29,29 @@ class Regrets(broker.CommandGroup):
         console.writeline("Training Review of Model:")
         console.writeline("Regret Nodes: {}".format(regrets))
         console.writeline("Strategy Nodes: {} | Trained: {}".format(strategy,trained))
+
+        #the reads and writes of every infoset while we last trained (counted even without infoset stats)
+        if r.aggregate_reads + r.aggregate_writes > 0:
+            console.writeline("Infoset Reads: {} | Writes: {}".format(r.aggregate_reads, r.aggregate_writes))
+
+        #how much walking regret-based pruning saved while we last trained
+        if r.aggregate_pruned > 0:
+            console.writeline("Actions Walked: {} | Pruned: {} ({:.2f}%)".format(r.aggregate_walked, r.aggregate_pruned, r.aggregate_pruned / (r.aggregate_walked + r.aggregate_pruned) * 100))
+
+        #if we are caching paths, show how well the cache is doing
+        (hits, misses, entries) = r.symm_tree.cache_stats()
+        if hits + misses > 0:
+            console.writeline("Path Cache: {} Hits | {} Misses | {:.2f}% Hit Rate | {} Entries".format(hits, misses, hits / (hits + misses) * 100, entries))
         console.writeline("")
 
         #get size info for the tree and print it out here
         size = r.symm_tree.size()        
         for sx in range(len(size)):
+            #levels above the infoset in a hash store are folded into its keys (and the stats level can be left out)
+            if size[sx]["total"] == 0:
+                console.writeline("LEVEL {}: {} wide, not stored (packed into hash keys, or without infoset stats)".format(str(sx).rjust(2), str(size[sx]["shape"]).rjust(4)))
+                continue
+
             #calculate level sparsity
             density = r.symm_tree.leveldensity(sx)
 
@@ -79,11 +98,17 @@ class Regrets(broker.CommandGroup):
         #get current or create new regret manager in broker state
         r = broker.state.setdefault("regretman",RegretManager())
 
+        #are we only reading the regrets
+        readonly = len(parameters) > 1 and parameters[1].lower() == "ro"
+
+        #which levels are we opening
+        profile = parameters[2].lower() if len(parameters) > 2 else "full"
+
         #open the specified file
         console.writeline("Configuring regrets {}...".format(parameters[0]))
         r.configure(format(parameters[0]),games.registeredGames)        
-        console.writeline("Opening regrets {}...".format(parameters[0]))
-        r.open(parameters[0])
+        console.writeline("Opening regrets {}{} ({} profile)...".format(parameters[0], " (read-only)" if readonly else "", profile))
+        r.open(parameters[0], readonly, profile)
         console.writeline("Ready to play {}".format(r.settings["game"]))
 
     #configure regrets using regretfile with whatever the defaults are (open or load)
@@ -95,7 +120,7 @@ class Regrets(broker.CommandGroup):
         console.writeline("Configuring regrets {}...".format(parameters[0]))
         r.configure(format(parameters[0]),games.registeredGames)
         console.writeline("Initializing regrets {}...".format(parameters[0]))
-        r.initialize()
+        r.initialize(profile = parameters[1].lower() if len(parameters) > 1 else "full")
         console.writeline("Ready to play {}".format(r.settings["game"]))
 
     #load regrets (into memory)
@@ -106,20 +131,148 @@ class Regrets(broker.CommandGroup):
         #open the specified file
         console.writeline("Configuring regrets {}...".format(parameters[0]))
         r.configure(format(parameters[0]),games.registeredGames)        
-        console.writeline("Loading regrets into memory from {}...".format(parameters[0]))
-        r.load(parameters[0])
+        profile = parameters[1].lower() if len(parameters) > 1 else "full"
+        console.writeline("Loading regrets into memory from {} ({} profile)...".format(parameters[0], profile))
+        r.load(parameters[0], profile)
         console.writeline("Ready to play {}".format(r.settings["game"]))
 
+    #save regrets (a full save of the regrets to the path)
+    def save(self, parameters):
+        #get current or create new regret manager in broker state
+        r = broker.state.setdefault("regretman",RegretManager())
+
+        #save to the specified file
+        console.writeline("Saving regrets to {}...".format(parameters[0]))
+        r.save(parameters[0])
+
+    #checkpoint regrets (only what changed since the last save or checkpoint to the path)
+    def checkpoint(self, parameters):
+        #get current or create new regret manager in broker state
+        r = broker.state.setdefault("regretman",RegretManager())
+
+        #checkpoint to the specified file
+        console.writeline("Checkpointing regrets to {}...".format(parameters[0]))
+        r.checkpoint(parameters[0])
+
+    #consolidate the checkpoints of saved regrets back into the full save
+    def consolidate(self, parameters):
+        #get current or create new regret manager in broker state
+        r = broker.state.setdefault("regretman",RegretManager())
+
+        #consolidate the specified file
+        console.writeline("Consolidating regrets at {}...".format(parameters[0]))
+        r.consolidate(parameters[0])
+
+    #compact regrets into a smaller save, dropping infosets that are rarely reached
+    def compact(self, parameters):
+        #get current or create new regret manager in broker state
+        r = broker.state.setdefault("regretman",RegretManager())
+
+        #compact into the specified file
+        min_reads = int(parameters[1]) if len(parameters) > 1 else 2
+        console.writeline("Compacting regrets into {} (dropping infosets with fewer than {} reads)...".format(parameters[0], min_reads))
+        levels = r.compact(parameters[0], min_reads)
+
+        #show how much each level shrank
+        for lx in range(len(levels)):
+            console.writeline("LEVEL {}: {} blocks -> {} blocks".format(str(lx).rjust(2), levels[lx][0], levels[lx][1]))
+
+    #export a frozen policy for playing
+    def export(self, parameters):
+        #get current or create new regret manager in broker state
+        r = broker.state.setdefault("regretman",RegretManager())
+
+        #export to the specified path
+        dtype = parameters[1].lower() if len(parameters) > 1 else "float32"
+        console.writeline("Exporting a {} policy to {}...".format(dtype, parameters[0]))
+        console.writeline("Exported {} infosets".format(r.export(parameters[0], dtype)))
+
+    #merge regrets trained separately (with the same shape) into the loaded regrets
+    def merge(self, parameters):
+        #get current or create new regret manager in broker state
+        r = broker.state.setdefault("regretman",RegretManager())
+
+        #merge the specified file
+        console.writeline("Merging regrets at {}...".format(parameters[0]))
+        levels = r.merge(parameters[0])
+
+        #show how many blocks of each level were summed
+        for lx in range(len(levels)):
+            if levels[lx] > 0: console.writeline("LEVEL {}: {} blocks summed".format(str(lx).rjust(2), levels[lx]))
+
+    #benchmark the symmetric tree against the hash store on the shape of a regret config
+    def benchmark(self, parameters):
+        #configure a regret manager of our own (so we don't disturb the loaded regrets)
+        r = RegretManager()
+        count = int(parameters[1]) if len(parameters) > 1 else 10000
+        console.writeline("Configuring regrets {}...".format(parameters[0]))
+        r.configure(format(parameters[0]),games.registeredGames)
+
+        #run the benchmark and show the results
+        console.writeline("Benchmarking {} random infoset paths...".format(count))
+        results = r.benchmark(count)
+        for store in results:
+            (created, found, infosets) = results[store]
+            console.writeline("{}: {} infosets | create {:.2f} us/infoset | find {:.2f} us/infoset".format(
+                store.upper().rjust(4), infosets, created / count * 1000000, found / count * 1000000))
+
+    #plan the size of each level of the symmetric tree of a regret config by sampling games with its path generator
+    def plan(self, parameters):
+        #configure a regret manager of our own (so we don't disturb the loaded regrets)
+        r = RegretManager()
+        console.writeline("Configuring regrets {}...".format(parameters[0]))
+        r.configure(format(parameters[0]),games.registeredGames)
+
+        #sample the games
+        count = int(parameters[1]) if len(parameters) > 1 else r.settings.get("planGames",1000)
+        console.writeline("Planning {} from {} sampled games...".format(parameters[0], count))
+        levels = Planner().plan(games.registeredGames[r.settings["game"]], r, r.settings, count)
+
+        #show what each level needs
+        console.writeline("")
+        for lx in range(len(levels)):
+            level = levels[lx]
+            console.writeline("LEVEL {} {}: {} wide, {} blocks measured ({} new in the last {:.0f}%) | {} declared | {} recommended ({} {}) -> {:.2f} MB{}".format(
+                str(lx).rjust(2),
+                level["name"].ljust(10),
+                str(level["shape"]).rjust(4),
+                level["measured"],
+                level["recent"],
+                Planner.RECENT * 100,
+                level["declared"],
+                level["blocks"],
+                level["size"],
+                level["multiplier"],
+                level["bytes"] / 1024 / 1024,
+                " | OVERFLOWS the index level pointing to it (use a wider index type)" if level["overflow"] else ""
+            ))
+        console.writeline("TOTAL: {:.2f} MB".format(sum(level["bytes"] for level in levels) / 1024 / 1024))
+
+        #and the shape to declare (levels still finding new blocks at the end of the sample may need more games or headroom)
+        lines = Planner.definition(r.settings, levels)
+        console.writeline("")
+        if len(lines) > 0: console.writeline("Recommended symmtree:")
+        for lx in range(len(lines)): console.writeline("    {}{}".format(lines[lx], "," if lx < len(lines) - 1 else ""))
+        console.writeline("Recommended hashInfosets: {}".format(levels[RegretManager.INFOSET_PATH]["blocks"]))
+
     #we implement a register method
     def registerCommands(self):
 
         #add our commands to the broker
-        broker.registerCommand("init",self.init,1,"Initializes regrets based on config file",["PATH","The regret path to configure"])
-        broker.registerCommand("open",self.open,1,"Opens regrets on disk",["PATH","The regret path to open"])
-        broker.registerCommand("load",self.load,1,"Loads regrets into shared memory from disk",["PATH","The regret path to load"])
+        broker.registerCommand("init",self.init,1,"Initializes regrets based on config file",["INIT PATH [PROFILE]","","PATH - the regret path to configure","PROFILE - the levels to load (see LOAD)"])
+        broker.registerCommand("open",self.open,1,"Opens regrets on disk",["OPEN PATH [MODE] [PROFILE]","","PATH - the regret path to open","MODE - rw to read and write (default), ro to open read-only and share clean pages with other readers","PROFILE - the levels to open (see LOAD)"])
+        broker.registerCommand("load",self.load,1,"Loads regrets into shared memory from disk",["LOAD PATH [PROFILE]","","PATH - the regret path to load","PROFILE - full to load every level (default), training to skip the stats when infosetStats is 0, inference to load only the paths and strategy sums (for nash and playing)","","regrets loaded without every level can't be saved, checkpointed or compacted"])
         broker.registerCommand("create", self.create, 1, "Creates regrets on disk",["PATH", "The regret path to open"])
         broker.registerCommand("eval",self.eval,0,"Evalulates currently loaded regrets")
         broker.registerCommand("kill",self.kill,1,"Kills regrets at path",["PATH","The regret path to kill"])
+        broker.registerCommand("save",self.save,1,"Saves all regrets to disk",["PATH","The regret path to save to"])
+        broker.registerCommand("checkpoint",self.checkpoint,1,"Saves only the regrets changed since the last save or checkpoint",["PATH","The regret path to checkpoint to"])
+        broker.registerCommand("compact",self.compact,1,"Saves a smaller copy of regrets without rarely reached infosets",["COMPACT PATH [READS]","","PATH - the regret path to save the compacted regrets to","READS - infosets read fewer times than this are dropped (default 2)"])
+        broker.registerCommand("export",self.export,1,"Exports a frozen policy (average strategies only) for playing",["EXPORT PATH [TYPE]","","PATH - the regret path to export the policy to (open it read-only to play from it)","TYPE - float32 (default) or float16 to halve the size of the policy"])
+        broker.registerCommand("merge",self.merge,1,"Merges regrets trained separately into the loaded regrets",["MERGE PATH","","PATH - the saved regret path to merge (trained with the same shape, consolidate any checkpoints first)","","infosets are matched by path and their regrets, strategy sums and stats are summed, save the loaded regrets to keep the merge"])
+        broker.registerCommand("benchmark",self.benchmark,1,"Times the symmetric tree against the hash store on the shape of a regret config",["BENCHMARK PATH [PATHS]","","PATH - the regret path with the config to benchmark","PATHS - how many random infoset paths to time (default 10000)"])
+        broker.registerCommand("plan",self.plan,1,"Sizes each level of the symmetric tree of a regret config from sampled games",["PLAN PATH [GAMES]","","PATH - the regret path with the config to plan","GAMES - how many games to sample (default planGames, or 1000)","","games are played with random actions and no regrets, the blocks each level needs are measured and","a size with headroom (planHeadroom times the measured blocks, default 2) is recommended for each level"])
+        broker.registerCommand("consolidate",self.consolidate,1,"Folds the checkpoints of saved regrets back into the full save",["PATH","The regret path to consolidate"])
 
 #register our command group
-broker.registerCommandGroup("Regrets", Regrets())
\ No newline at end of file
+broker.registerCommandGroup("Regrets", Regrets())
@@ -38,7 +38,7 @@ class TrainerCommands(broker.CommandGroup):
 
         #if we want to reset after this epoch, or reset every N epochs, do so
         console.writeline("Reseting Regrets...")
-        regretman.symm_tree._arrays[RegretManager.STRAT_PATH].fill(1/actionsets)
+        regretman.symm_tree.fill_level(RegretManager.STRAT_PATH, 1/actionsets)
 
 
     #run nash evaluation on a game
@@ -165,5 +165,8 @@ class Analyzer (Traceable):
         console.writeline("Edge: {:.2f}% Win Ratio, {:.2f} Utility".format( ( actual[3] - control[3]) * 100, actual[4] - control[4]))
         console.writeline("")
 
+        #return (games, wins, utility, win ratio, average utility) for the control and callidus simulations
+        return (control, actual)
+
 
 
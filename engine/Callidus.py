@@ -18,6 +18,10 @@ class Callidus(Player):
     #how many of the available actions will we consider when applying a weighted strategy
     weighted_strats = 2
 
+    #when sampling we play an action drawn from the current (regret matching) strategy instead of the average strategy
+    #(the other players of external sampling play this way while training)
+    sample = False
+
     #init player
     def __init__(self, name, game):
 
@@ -28,10 +32,11 @@ class Callidus(Player):
         self.use_argmax = True
 
     #we must connect to the regret manager to work
-    def configure(self, regretman, argmax = True):
+    def configure(self, regretman, argmax = True, sample = False):
 
         #get regretman and abstractor references
         self.use_argmax = argmax
+        self.sample = sample
         self.regret_man = regretman
         self.abstractor = regretman.game_abstractor
 
@@ -51,19 +56,27 @@ class Callidus(Player):
         #get infoset based on game state
         info_set = self.regret_man.get_information_set(game_state, self, False)
 
-        #get average strategy from that infoset
-        strat = info_set.get_average_strategy()
+        #get average strategy from that infoset (or the current strategy when sampling)
+        strat = info_set.get_current_strategy() if self.sample else info_set.get_average_strategy()
 
         #clear out invalid strategies and re-normalize
+        valid = np.ones(len(strat))
         for c in range(0,len(strat)):
-            if not self.game.validAction(game_state, valid_actions[c]): strat[c] = 0
+            if not self.game.validAction(game_state, valid_actions[c]): strat[c] = valid[c] = 0
 
         #renormalize the actually valid strategies
+        #(a current strategy may have nothing left on the valid actions, then each of them is as likely)
+        if self.sample and sum(strat) <= 0: strat = valid
         strat /= sum(strat)
 
         #pick best action
         #get the action from strategy
-        if self.use_argmax:
+        if self.sample:
+
+            #sample an action from the strategy
+            best_action_index = random.choices(range(len(strat)), weights=strat, k=1)[0]
+
+        elif self.use_argmax:
             #use argmax to pick an action from our strategy
             best_action_index = np.argmax(strat)
         else:
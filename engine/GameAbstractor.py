@@ -1,5 +1,6 @@
 #we have a fast deep copy implementation
 import engine.FastCopy as fastcopy
+from engine.SymmetricTree import SymmetricTree
 
 #a game abstractor is used by the regret manager
 #so that we can process regrets by any different type of game
@@ -67,6 +68,9 @@ class GameAbstractor:
 			#for anything not defined - assume 1
 			size *= multipliers.get(multiplier,1)
 
+			#the type can be given by name (like "uint16" or "float64") as well as by number
+			type = SymmetricTree.level_type(type)
+
 			#add this definition to our actual shape
 			shape += [[choices, type, size]]
 
@@ -74,6 +78,15 @@ class GameAbstractor:
 			self._base_levelnames[name] = c
 			c += 1
 
+		#levels can declare the levels their children are in (an optional 6th value) -> a level name or number,
+		#"next" for the level after it, or a list with one of those for each choice.  these levels don't need to store
+		#the level of every child, which saves memory
+		for c in range(len(self._base_shape_def)):
+			if len(self._base_shape_def[c]) > 5:
+				children = self._base_shape_def[c][5]
+				children = children if isinstance(children, list) else [children] * shape[c][0]
+				shape[c].append([c + 1 if child == "next" else self._base_levelnames.get(child, child) for child in children])
+
 		#return our shape built from the definition
 		return shape
 
@@ -0,0 +1,781 @@
+import os
+import numpy as np
+from multiprocessing import shared_memory as mem
+from engine.SymmetricTree import SymmetricTree
+from engine.NodeAllocator import NodeAllocator
+import engine.Kernels as kernels
+import console
+
+#the hash store is an alternative to the symmetric tree for holding regrets
+#instead of chasing a pointer per level of a path down to the infoset, the path above the infoset is packed into
+#a fixed width key (each path tuple is a digit made from its level and slot, using the level widths in the shape)
+#and one probe of an open addressing hash table finds the row of the infoset
+#the values of every infoset (regrets, strategy and stats) live in dense arrays (one per value level) indexed by that row
+#
+#the store answers the same infoset paths as the tree -> path above the infoset + [(slot, infoset level), (item, value level)]
+#so information sets, the trainer and saving / loading work the same with either one
+class HashStore:
+
+    #the header holds the tree shape (so shape() answers like a tree) followed by the store's own values
+    HEADER_SIZE = SymmetricTree.MAX_SHAPE_ARRAY_SIZE + 64
+    META_CAPACITY = SymmetricTree.MAX_SHAPE_ARRAY_SIZE + 0
+    META_USED = SymmetricTree.MAX_SHAPE_ARRAY_SIZE + 1
+    META_GENERATION = SymmetricTree.MAX_SHAPE_ARRAY_SIZE + 2
+    META_KEY_WORDS = SymmetricTree.MAX_SHAPE_ARRAY_SIZE + 3
+    META_INFOSET = SymmetricTree.MAX_SHAPE_ARRAY_SIZE + 4
+    META_LEAVES = SymmetricTree.MAX_SHAPE_ARRAY_SIZE + 5
+    META_LEAF = SymmetricTree.MAX_SHAPE_ARRAY_SIZE + 6
+
+    #new stores start with this many table slots (a power of 2)
+    #the table keeps 2 slots for every row of the value arrays, so it is never more than half full, and doubles when the rows run out
+    INITIAL_CAPACITY = 1024
+    SLOTS_PER_ROW = 2
+
+    #keys are hashed 64 bits at a time
+    HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+    HASH_MASK = 2**64 - 1
+
+    #initialize the store (the same ways a symmetric tree is initialized)
+    #infoset_level -> the level of the infoset in the shape, leaf_levels -> the value level of each infoset slot
+    #key_depth -> the longest path above the infoset we can key (defaults to the number of levels above the infoset)
+    def __init__(self, shape = None, namespace = None, filename = None, ondisk = False, infoset_level = None, leaf_levels = None, key_depth = None, capacity = INITIAL_CAPACITY, readonly = False, skip = (), reserve = SymmetricTree.SHARED_RESERVE):
+
+        #our arrays and their shared memory
+        self._header = None
+        self._header_shm = None
+        self._values = {}
+        self._managers = []
+        self._value_managers = {}
+        self._retired_managers = []
+        self._generation = 0
+        self.creator = False
+        self.namespace = None
+        self.filename = None
+        self.ondisk = ondisk
+
+        #read-only stores map every array read-only and never add infosets (the same as a read-only symmetric tree)
+        self.readonly = readonly
+
+        #value levels we skip (the same as a symmetric tree) -> they are never loaded, and read-only stores don't map them
+        #(a store we write to still maps them, since growing the store copies every level)
+        self.skip = set(skip)
+
+        #how we build the store when we create it
+        self.infoset_level = infoset_level
+        self.leaf_levels = leaf_levels
+        self.key_depth = key_depth
+        self.capacity = capacity
+
+        #in a namespace the value arrays reserve room for this many times the infosets planned (see _reserved_rows)
+        self.reserve = reserve
+
+        #the lock we insert under (created the first time we insert, once we know if we are shared)
+        #and the last path we found -> (path above the infoset, row)
+        self._lock = None
+        self._last = (None, None)
+
+        #load from file, attach to a namespace, open on disk or create (the same as a symmetric tree)
+        if filename != None and ondisk == False: self.load(filename, namespace)
+        elif shape is None and namespace != None: self._load_from_namespace(namespace)
+        elif shape is None and ondisk == True: self.open(filename)
+        elif shape is not None: self.create(shape, namespace, filename if ondisk else None)
+
+    #return our shape
+    def shape(self):
+        return self._shape
+
+    #get level information (shape, type, total, used) -> the infoset level and its value levels hold a block per row
+    #the levels above the infoset are folded into the keys, so they hold nothing
+    def levelinfo(self, level):
+        width = int(self._shape[level * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_SHAPE])
+        dtype = int(self._shape[level * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_TYPE])
+        if level != self.infoset_level and level not in self.leaf_levels: return (width, dtype, 0, 0)
+        return (width, dtype, self._rows_capacity() * width, int(self._header[HashStore.META_USED]))
+
+    #return detailed information about the sizes of each level (the same as a symmetric tree)
+    def size(self):
+        info = []
+        for level in range(int(self._shape[-1])):
+            (shape,dtype,total,used) = self.levelinfo(level)
+            info.append({"shape":shape, "type":dtype, "total":total // shape, "used":used, "available":total // shape - used})
+        return info
+
+    #how many rows each value array can hold
+    def _rows_capacity(self):
+        return int(self._header[HashStore.META_CAPACITY]) // HashStore.SLOTS_PER_ROW
+
+    #the used rows of a value level as a 2d view (one row per infoset)
+    def level_view(self, level):
+        self.refresh()
+        (width,_,_,used) = self.levelinfo(level)
+        return self._values[level][:used * width].reshape(-1, width)
+
+    #fill the used rows of a value level with a value (like resetting every strategy at once)
+    def fill_level(self, level, value):
+        self.level_view(level)[:] = value
+
+    #a frozen, local copy of the store as it is right now (other processes can keep adding to the live store)
+    #keys published after we read how many rows are used are dropped, along with any key whose row isn't set yet
+    def snapshot(self):
+        self.refresh()
+        header = np.array(self._header)
+
+        #the store may grow while we copy, so copy the generation we have mapped
+        header[HashStore.META_CAPACITY] = len(self._rows)
+        used = min(int(header[HashStore.META_USED]), len(self._rows) // HashStore.SLOTS_PER_ROW)
+        snap = HashStore()
+        snap.create(header)
+        snap._keys[:] = self._keys
+        snap._rows[:] = self._rows
+        stale = (snap._rows > used) | (snap._rows == 0)
+        snap._keys[stale] = 0
+        snap._rows[stale] = 0
+        for level in self.leaf_levels:
+            if level in self.skip: continue
+            snap._values[level][:used * self._widths[level]] = self._values[level][:used * self._widths[level]]
+        snap._header[HashStore.META_USED] = used
+        snap.readonly = True
+        snap.skip = set(self.skip)
+        return snap
+
+    #the store has no path cache -> (hits, misses, entries)
+    def cache_stats(self):
+        return (0, 0, 0)
+
+    #unlink - release global shared memory
+    def unload(self):
+
+        #close (and if we created them, unlink) every array
+        for shm in self._managers + list(self._value_managers.values()):
+            self._close_manager(shm, unlink = self.creator)
+        for shm in self._retired_managers:
+            self._close_manager(shm)
+        if self._header_shm != None:
+            self._shape = None
+            self._header = None
+            self._close_manager(self._header_shm, unlink = self.creator)
+            self._header_shm = None
+
+        #we no longer have arrays, a namespace etc
+        self._managers = []
+        self._value_managers = {}
+        self._retired_managers = []
+        self.namespace = None
+        self.creator = False
+        if self._lock != None: self._lock.close()
+        self._lock = None
+
+    #close a shared memory manager
+    def _close_manager(self, shm, unlink = False):
+        if unlink:
+            try: shm.unlink()
+            except FileNotFoundError: pass
+        try: shm.close()
+        except BufferError: pass
+
+    #create a new store from a tree shape (a list of levels, or a saved shape / header array)
+    def create(self, shape, namespace = None, filename = None):
+
+        #if we currently have a namespace
+        if self.namespace != None: self.unload()
+        self.namespace = namespace
+        self.filename = filename
+        self.creator = True
+
+        #allocate our header in shared memory, on disk or locally
+        if namespace != None:
+            try:
+                self._header_shm = mem.SharedMemory(create=True, size=HashStore.HEADER_SIZE * np.dtype(SymmetricTree.SHAPE_DTYPE).itemsize, name="{}_h".format(namespace))
+                console.writeline("Created Hash Store Namespace " + namespace)
+            except FileExistsError:
+
+                #the namespace already exists, so attach to it instead
+                console.writeline("Attached to Hash Store Namespace " + namespace)
+                self.namespace = None
+                self.creator = False
+                self._load_from_namespace(namespace)
+                return
+            self._header = np.ndarray((HashStore.HEADER_SIZE,), dtype=SymmetricTree.SHAPE_DTYPE, buffer=self._header_shm.buf)
+        elif filename != None:
+            self._header = np.lib.format.open_memmap("{}.hash.npy".format(filename), mode="w+", dtype=SymmetricTree.SHAPE_DTYPE, shape=(HashStore.HEADER_SIZE,))
+        else:
+            self._header = np.zeros((HashStore.HEADER_SIZE,), dtype=SymmetricTree.SHAPE_DTYPE)
+        self._shape = self._header[:SymmetricTree.MAX_SHAPE_ARRAY_SIZE]
+
+        #a saved header already describes the store
+        if isinstance(shape, np.ndarray) and len(shape) == HashStore.HEADER_SIZE:
+            self._header[:] = shape[:]
+            self._header[HashStore.META_USED] = 0
+            self._header[HashStore.META_GENERATION] = 0
+
+        else:
+
+            #copy in the tree shape -> either a saved shape array or the list of levels (width, type, blocks)
+            if isinstance(shape, np.ndarray): self._shape[:] = shape[:SymmetricTree.MAX_SHAPE_ARRAY_SIZE]
+            else:
+                self._shape[-1] = len(shape)
+                for c in range(len(shape)):
+                    self._shape[c * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_SHAPE] = shape[c][0]
+                    self._shape[c * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_TYPE] = SymmetricTree.level_type(shape[c][1])
+                    self._shape[c * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_TOTAL] = shape[c][2] * shape[c][0]
+
+            #the levels we hold, and how wide our keys are
+            assert self.infoset_level != None and self.leaf_levels != None, "A hash store needs its infoset level and value levels"
+            depth = self.key_depth if self.key_depth != None else self.infoset_level
+            self._header[HashStore.META_INFOSET] = self.infoset_level
+            self._header[HashStore.META_LEAVES] = len(self.leaf_levels)
+            self._header[HashStore.META_LEAF:HashStore.META_LEAF + len(self.leaf_levels)] = self.leaf_levels
+            self._header[HashStore.META_KEY_WORDS] = -(-depth // self._digits_per_word())
+
+            #start the table at the requested size (rounded up to a power of 2)
+            self._header[HashStore.META_CAPACITY] = 1 << max(1, int(self.capacity) - 1).bit_length()
+            self._header[HashStore.META_USED] = 0
+            self._header[HashStore.META_GENERATION] = 0
+
+        #now create our arrays (new value arrays, not grown from any we had before)
+        self._last = (None, None)
+        self._read_header()
+        self._values = {}
+        self._map_arrays(create = True)
+
+    #attach to a store in a shared memory namespace
+    def _load_from_namespace(self, namespace):
+
+        #if we currently have a namespace release it
+        if self.namespace != None: self.unload()
+        self.namespace = namespace
+        self.creator = False
+
+        #attach to the header and our arrays
+        self._header_shm = mem.SharedMemory(name = "{}_h".format(namespace))
+        self._header = np.ndarray((HashStore.HEADER_SIZE,), dtype=SymmetricTree.SHAPE_DTYPE, buffer=self._header_shm.buf)
+        self._header.flags.writeable = not self.readonly
+        self._shape = self._header[:SymmetricTree.MAX_SHAPE_ARRAY_SIZE]
+        self._last = (None, None)
+        self._read_header()
+        self._map_arrays(create = False)
+
+    #open a store on disk (memory mapped arrays) for RW operations, or read-only
+    def open(self, filename, verbose = False, readonly = None):
+        if readonly != None: self.readonly = readonly
+        self.filename = filename
+        self._last = (None, None)
+        self._header = np.load("{}.hash.npy".format(filename), mmap_mode = "r" if self.readonly else "r+", allow_pickle = False, fix_imports = False)
+        self._shape = self._header[:SymmetricTree.MAX_SHAPE_ARRAY_SIZE]
+        self._read_header()
+        self._map_arrays(create = False)
+
+        #a save only holds the rows in use, so give the value arrays back their room to grow
+        if not self.readonly and any(len(self._values[level]) < self._rows_capacity() * self._widths[level] for level in self.leaf_levels):
+            self._locked(self._resize, len(self._keys))
+
+    #load a saved store (optionally into a namespace)
+    def load(self, filename = None, namespace = None, verbose = False):
+
+        #attaching to a namespace
+        if filename == None: return self._load_from_namespace(namespace)
+
+        #create a store as large as the saved one (in our namespace if we have one)
+        header = np.load("{}.hash.npy".format(filename), allow_pickle = False, fix_imports = False)
+        self.create(header, namespace if namespace != None else self.namespace)
+
+        #read the table and the used rows of each value array
+        #(a store flushed from disk keeps its files at their full size, with a flat key table)
+        used = int(header[HashStore.META_USED])
+        self._keys[:] = np.load("{}.hk.npy".format(filename), allow_pickle = False, fix_imports = False).reshape(self._keys.shape)
+        self._rows[:] = np.load("{}.hr.npy".format(filename), allow_pickle = False, fix_imports = False)
+        for level in self.leaf_levels:
+            if level in self.skip: continue
+            self._values[level][:used * self._widths[level]] = np.load("{}.h{}.npy".format(filename, level), mmap_mode = "r", allow_pickle = False, fix_imports = False)[:used * self._widths[level]]
+        self._header[HashStore.META_USED] = used
+        if verbose: console.writeline("Loaded {} infosets from {}".format(used, filename))
+
+    #save to file
+    def save(self, filename, verbose = False):
+
+        #a store missing levels would save over them with nothing
+        self._check_complete()
+
+        #make sure we are saving the current generation
+        self.refresh()
+        used = int(self._header[HashStore.META_USED])
+        np.save("{}.hash".format(filename), self._header, False, False)
+        np.save("{}.hk".format(filename), self._keys, False, False)
+        np.save("{}.hr".format(filename), self._rows, False, False)
+        for level in self.leaf_levels:
+            np.save("{}.h{}".format(filename, level), self._values[level][:used * self._widths[level]], False, False)
+        if verbose: console.writeline("Saved {} infosets to {}".format(used, filename))
+
+    #the store does not track changed regions, so a checkpoint is a full save
+    #(a store opened on disk is its own save, so at its own files it just writes its maps back)
+    def checkpoint(self, filename):
+        if self.filename != None and SymmetricTree._same_file(filename, self.filename): return self.flush()
+        self.save(filename)
+
+    #write every change of a store opened on disk back to its files
+    def flush(self):
+        if self.readonly or self.filename == None: return
+        for array in [self._header, self._keys, self._rows] + list(self._values.values()):
+            if isinstance(array, np.memmap): array.flush()
+
+    #rows are counted as they are added, so there is never anything to publish
+    def publish(self):
+        pass
+
+    #there are never checkpoints to fold back into a save
+    def consolidate(self, filename):
+        pass
+
+    #save a copy of the store at filename without the dropped rows
+    #drop -> {infoset level: a mask of the rows to drop}, returns (rows before, rows after) for each level like a tree
+    def compact(self, filename, drop = {}):
+        self._check_complete()
+
+        #the rows we keep
+        self.refresh()
+        used = int(self._header[HashStore.META_USED])
+        keep = np.ones((used,), dtype=bool)
+        if self.infoset_level in drop: keep[:] = ~np.asarray(drop[self.infoset_level][:used], dtype=bool)
+        rows = np.flatnonzero(keep)
+
+        #number the rows we keep from zero (zero stays empty in the table)
+        renumber = np.zeros((used + 1,), dtype=np.int64)
+        renumber[rows + 1] = np.arange(1, len(rows) + 1)
+
+        #build the compacted store locally (with a table just large enough for the rows we keep) and save it
+        header = np.array(self._header)
+        header[HashStore.META_CAPACITY] = 1 << (max(HashStore.INITIAL_CAPACITY, len(rows) * HashStore.SLOTS_PER_ROW) - 1).bit_length()
+        compacted = HashStore()
+        compacted.create(header)
+        slots = np.flatnonzero(self._keys[:,0])
+        slots = slots[keep[self._rows[slots] - 1]]
+        compacted._place(compacted._keys, compacted._rows, self._keys[slots], renumber[self._rows[slots]])
+        for level in self.leaf_levels:
+            compacted._values[level][:len(rows) * self._widths[level]] = self._values[level][:used * self._widths[level]].reshape(-1, self._widths[level])[rows].ravel()
+        compacted._header[HashStore.META_USED] = len(rows)
+        compacted.save(filename)
+
+        #report how many rows each level held before and after
+        return [(used, len(rows)) if level == self.infoset_level or level in self.leaf_levels else (0, 0) for level in range(int(self._shape[-1]))]
+
+    #freeze a saved store (at filename) for playing -> the rows of a value level (like the strategy sums) become normalized
+    #rows stored as dtype, and the dropped value levels are removed (the same as a tree) -> returns how many rows were frozen
+    def freeze(self, filename, level, drop = [], dtype = np.float32):
+
+        #normalize the rows of the level (rows that sum to nothing are uniform)
+        header = np.load("{}.hash.npy".format(filename), allow_pickle = False, fix_imports = False)
+        width = int(header[level * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_SHAPE])
+        rows = np.load("{}.h{}.npy".format(filename, level), allow_pickle = False, fix_imports = False).reshape(-1, width).astype(np.float64)
+        policy = kernels.normalize_rows(rows).astype(dtype).ravel()
+
+        #the level takes the new type, and the dropped levels keep their slots (as -1) but lose their values
+        header[level * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_TYPE] = SymmetricTree.level_type(np.dtype(dtype).name)
+        for slot in range(int(header[HashStore.META_LEAVES])):
+            if header[HashStore.META_LEAF + slot] in drop:
+                os.remove("{}.h{}.npy".format(filename, header[HashStore.META_LEAF + slot]))
+                header[HashStore.META_LEAF + slot] = -1
+
+        #write the new files beside the old ones and move them into place
+        for (array, name) in [(policy, "{}.h{}".format(filename, level)), (header, "{}.hash".format(filename))]:
+            np.save(name + ".frozen", array, False, False)
+            os.replace(name + ".frozen.npy", name + ".npy")
+        return len(rows)
+
+    #merge another store with the same shape into this one, matching infosets by their key (the path above them)
+    #infosets only in the other store are added to ours, and the rows of the leaf levels are summed
+    #the other store is read a chunk at a time, so it can be opened on disk and never loaded
+    #returns how many rows of each level were summed (like a tree)
+    def merge(self, other, leaves = None):
+
+        #the stores must have the same shape and keys
+        if other._widths != self._widths or other._key_words != self._key_words:
+            raise ValueError("Cannot merge hash stores with different shapes")
+        if self.readonly: raise ValueError("Cannot merge into a read-only hash store")
+        self._check_complete()
+        leaves = [level for level in self.leaf_levels if leaves == None or level in leaves]
+
+        #step through their keys a chunk at a time
+        slots = np.flatnonzero(other._keys[:,0])
+        for start in range(0, len(slots), SymmetricTree.FRONTIER_CHUNK):
+            chunk = slots[start:start + SymmetricTree.FRONTIER_CHUNK]
+
+            #find all of their keys in our table at once, and add the ones we don't have together (under one lock)
+            self.refresh()
+            keys = other._keys[chunk]
+            (_, ours) = self._probe_many(keys)
+            missing = np.flatnonzero(ours < 0)
+            if len(missing) > 0: ours[missing] = self._locked(self._insert_many, keys[missing])
+
+            #and sum their rows into ours
+            theirs = other._rows[chunk] - 1
+            for level in leaves:
+                self.level_view(level)[ours] += other.level_view(level)[theirs]
+
+        #return how many rows we summed
+        return [len(slots) if level in leaves else 0 for level in range(int(self._shape[-1]))]
+
+    #raise if we skipped any levels
+    def _check_complete(self):
+        if len(self.skip) > 0: raise ValueError("Levels {} were not loaded, so the hash store can't be written".format(sorted(self.skip)))
+
+    #read the layout of the store from our header
+    def _read_header(self):
+        self.infoset_level = int(self._header[HashStore.META_INFOSET])
+        #the value level of each infoset slot -> a frozen store keeps the slots of the levels it dropped (as -1) so the rest line up
+        self._slot_levels = [int(l) for l in self._header[HashStore.META_LEAF:HashStore.META_LEAF + int(self._header[HashStore.META_LEAVES])]]
+        self.leaf_levels = [l for l in self._slot_levels if l >= 0]
+        self._key_words = int(self._header[HashStore.META_KEY_WORDS])
+        self._widths = {level: int(self._shape[level * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_SHAPE]) for level in range(int(self._shape[-1]))}
+
+        #every path tuple is a digit -> the offset of its level plus its slot plus one (so zero is never a digit)
+        #and as many digits as fit are packed into each 64 bit word of the key
+        self._offsets = np.cumsum([0] + [self._widths[level] for level in range(int(self._shape[-1]))]).tolist()
+        self._radix = self._offsets[-1] + 1
+        self._digits = self._digits_per_word()
+
+    #how many path digits fit in a 64 bit word
+    def _digits_per_word(self):
+        widths = [int(self._shape[level * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_SHAPE]) for level in range(int(self._shape[-1]))]
+        radix = sum(widths) + 1
+        digits = 1
+        while radix ** (digits + 1) <= HashStore.HASH_MASK: digits += 1
+        return digits
+
+    #the name of one of our arrays in shared memory or on disk
+    def _array_name(self, suffix, generation):
+        if self.namespace != None: return "{}_h{}".format(self.namespace, suffix) + ("g{}".format(generation) if generation > 0 else "")
+        return "{}.h{}.npy".format(self.filename, suffix)
+
+    #create or attach to one of our arrays -> returns (array, manager)
+    #when attaching the length comes from the array itself, since the header may already describe a newer generation
+    def _map_array(self, suffix, dtype, length, create, generation):
+
+        #in a shared memory namespace
+        if self.namespace != None:
+            name = self._array_name(suffix, generation)
+            if create: shm = mem.SharedMemory(create=True, size=max(1, length * np.dtype(dtype).itemsize), name=name)
+            else:
+                shm = mem.SharedMemory(name=name)
+                length = shm.size // np.dtype(dtype).itemsize
+            array = np.ndarray((length,), dtype=dtype, buffer=shm.buf)
+            array.flags.writeable = not self.readonly
+            return (array, shm)
+
+        #on disk as a memory mapped file (a new generation is written beside the old one and moved into place)
+        if self.filename != None:
+            name = self._array_name(suffix, generation)
+            if create:
+                array = np.lib.format.open_memmap(name + ".tmp", mode="w+", dtype=dtype, shape=(length,))
+                os.replace(name + ".tmp", name)
+                return (array, None)
+            return (np.load(name, mmap_mode="r" if self.readonly else "r+", allow_pickle=False, fix_imports=False), None)
+
+        #otherwise we are local
+        return (np.zeros((length,), dtype=dtype), None)
+
+    #how many rows the value arrays reserve in a namespace -> the infosets planned times our reserve
+    #(the infosets declared in the shape or the rows the store starts with, whichever is more)
+    def _reserved_rows(self):
+        loc = self.infoset_level * SymmetricTree.SHAPE_SIZE
+        declared = int(self._shape[loc + SymmetricTree.LOC_TOTAL]) // max(1, int(self._shape[loc + SymmetricTree.LOC_SHAPE]))
+        return int(max(declared, self._rows_capacity()) * self.reserve)
+
+    #create, attach to or grow the value array of a level to length entries -> returns (array, manager)
+    #the table is rehashed into new arrays as the store grows, but value arrays never move (infoset views, and other processes
+    #writing through them, would miss the move).  in a namespace a value array reserves room for the rows planned
+    #up front (only the pages in use take memory), and on disk its file grows in place.  only a local store is copied
+    def _map_values(self, level, length, create):
+        dtype = SymmetricTree.level_dtype(self._shape[level * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_TYPE])
+        current = self._values.get(level)
+
+        #in a namespace, a view of the part of the reservation in use
+        if self.namespace != None:
+            shm = self._value_managers.get(level)
+            if shm == None and create:
+                reserved = self._reserved_rows() * self._widths[level]
+                shm = mem.SharedMemory(create=True, size=max(1, reserved * np.dtype(dtype).itemsize), name=self._array_name(str(level), 0))
+            elif shm == None: shm = mem.SharedMemory(name=self._array_name(str(level), 0))
+            array = np.ndarray((shm.size // np.dtype(dtype).itemsize,), dtype=dtype, buffer=shm.buf)
+            assert length <= len(array), "Cannot grow the hash store past the {} rows it reserved (declare more infosets or raise the reserve)".format(len(array) // self._widths[level])
+            array.flags.writeable = not self.readonly
+            return (array[:length], shm)
+
+        #on disk, the file grown in place (or a new file when we create the store)
+        if self.filename != None:
+            name = self._array_name(str(level), 0)
+            if create and current is None: return (np.lib.format.open_memmap(name, mode="w+", dtype=dtype, shape=(length,)), None)
+            if create and length > len(current): SymmetricTree._grow_file(name, len(current), length)
+            return (np.load(name, mmap_mode="r" if self.readonly else "r+", allow_pickle=False, fix_imports=False), None)
+
+        #otherwise we are local, and copy what we have into a larger array
+        array = np.zeros((length,), dtype=dtype)
+        if current is not None: array[:len(current)] = current
+        return (array, None)
+
+    #create or attach to every array of the current generation -> the key table, the row of each key and the value arrays
+    def _map_arrays(self, create, generation = None):
+
+        #the generation we are mapping
+        generation = int(self._header[HashStore.META_GENERATION]) if generation == None else generation
+        capacity = int(self._header[HashStore.META_CAPACITY])
+
+        #map the table and the value array of each value level
+        (keys, keys_shm) = self._map_array("k", np.uint64, capacity * self._key_words, create, generation)
+        (rows, rows_shm) = self._map_array("r", np.int64, capacity, create, generation)
+        values = {}
+        managers = [keys_shm, rows_shm]
+        for level in self.leaf_levels:
+            if level in self.skip and self.readonly and not create:
+                values[level] = np.zeros((0,), dtype=SymmetricTree.level_dtype(self._shape[level * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_TYPE]))
+                continue
+            (values[level], shm) = self._map_values(level, (len(rows) // HashStore.SLOTS_PER_ROW) * self._widths[level], create)
+            if shm != None: self._value_managers[level] = shm
+
+        #swap them in -> readers may still be probing the old table, so keep it mapped until we unload
+        self._retired_managers += [shm for shm in self._managers if shm != None]
+        self._managers = [shm for shm in managers if shm != None]
+        self._keys = keys.reshape(-1, self._key_words)
+        self._rows = rows
+        self._values = values
+        self._generation = generation
+
+    #re-attach if another process has grown the store since we mapped it
+    def refresh(self):
+        if self._header[HashStore.META_GENERATION] != self._generation: self._map_arrays(create = False)
+
+    #run a function holding the store lock (shared by every process using the store)
+    def _locked(self, function, *args):
+        if self._lock == None: self._lock = NodeAllocator(self, self.namespace if self.namespace != None else os.path.abspath(self.filename) if self.filename != None else None)
+        return self._lock.locked(function, *args)
+
+    #pack the path above an infoset into the words of its key
+    def _key(self, prefix):
+        if len(prefix) > self._key_words * self._digits:
+            raise ValueError("Path {} is deeper than the {} levels the hash store keys".format(prefix, self._key_words * self._digits))
+        words = [0] * self._key_words
+        for px in range(len(prefix)):
+            (slot, level) = prefix[px]
+            words[px // self._digits] = words[px // self._digits] * self._radix + self._offsets[level] + slot + 1
+        return words
+
+    #hash the words of a key
+    def _hash(self, words):
+        h = 0
+        for w in words:
+            h = ((h ^ w) * HashStore.HASH_MULTIPLIER) & HashStore.HASH_MASK
+            h ^= h >> 29
+        return h
+
+    #hash many keys at once (the same hash as _hash)
+    def _hash_many(self, keys):
+        h = np.zeros((len(keys),), dtype=np.uint64)
+        for c in range(keys.shape[1]):
+            h = (h ^ keys[:,c]) * np.uint64(HashStore.HASH_MULTIPLIER)
+            h ^= h >> np.uint64(29)
+        return h
+
+    #probe the table for a key -> returns (slot, row) with a row of -1 (and the empty slot it would go in) if it isn't there
+    def _probe(self, words):
+        keys = self._keys
+        mask = len(keys) - 1
+        slot = self._hash(words) & mask
+        while True:
+            first = int(keys[slot,0])
+            if first == 0: return (slot, -1)
+            if first == words[0] and (self._key_words == 1 or keys[slot].tolist() == words): return (slot, int(self._rows[slot]) - 1)
+            slot = (slot + 1) & mask
+
+    #probe the table for many keys at once (the same probing as _probe)
+    #returns (slots, rows) with a row of -1 (and the empty slot it would go in) for each key that isn't there
+    def _probe_many(self, keys):
+        table = self._keys
+        mask = len(table) - 1
+        slots = (self._hash_many(keys) & np.uint64(mask)).astype(np.int64)
+        rows = np.full((len(keys),), -1, dtype=np.int64)
+        pending = np.arange(len(keys))
+        while len(pending) > 0:
+
+            #keys on an empty slot aren't there, keys on their own slot are found
+            found = table[slots[pending]]
+            empty = found[:,0] == 0
+            match = ~empty & (found == keys[pending]).all(axis = 1)
+            rows[pending[match]] = self._rows[slots[pending[match]]] - 1
+
+            #everything else moves on to its next slot
+            pending = pending[~(empty | match)]
+            slots[pending] = (slots[pending] + 1) & mask
+        return (slots, rows)
+
+    #find the row of the infoset at a path, adding it if we are creating -> None if it doesn't exist
+    def _find(self, prefix, create):
+        return self._lookup(prefix, create)[0]
+
+    #find the row of the infoset at a path, adding it if we are creating -> (row or None if it doesn't exist, True if we added it)
+    #rows never move, so we remember the last row found (an infoset reads all its values one after another)
+    def _lookup(self, prefix, create):
+        self.refresh()
+        prefix = tuple(prefix)
+        if prefix == self._last[0]: return (self._last[1], False)
+        words = self._key(prefix)
+        (slot, row) = self._probe(words)
+        added = False
+        if row < 0 and not create: return (None, False)
+        if row < 0 and self.readonly: raise ValueError("Cannot add infosets to a read-only hash store")
+        if row < 0: (row, added) = self._locked(self._insert, words)
+        self._last = (prefix, row)
+        return (row, added)
+
+    #add a key to the table and give it the next row (must be called while locked)
+    #returns (row, True if we added it) -> another process may have added it first
+    def _insert(self, words):
+
+        #another process may have grown the store or added this key since we looked
+        self.refresh()
+        (slot, row) = self._probe(words)
+        if row >= 0: return (row, False)
+
+        #grow when the value arrays are full (the table is then half full)
+        used = int(self._header[HashStore.META_USED])
+        if used >= self._rows_capacity():
+            self._resize(2 * len(self._keys))
+            (slot, _) = self._probe(words)
+
+        #take the next row, and publish the key (its first word last, since that is what marks the slot as used)
+        self._header[HashStore.META_USED] = used + 1
+        self._rows[slot] = used + 1
+        self._keys[slot,1:] = words[1:]
+        self._keys[slot,0] = words[0]
+        return (used, True)
+
+    #add many keys to the table at once and give each the next row (must be called while locked)
+    #the keys must all be different -> returns the row of every key (another process may have added some of them first)
+    def _insert_many(self, keys):
+
+        #another process may have grown the store or added some of these keys since we looked
+        self.refresh()
+        (_, rows) = self._probe_many(keys)
+        missing = np.flatnonzero(rows < 0)
+        if len(missing) == 0: return rows
+
+        #grow until the value arrays hold every new row (the table then stays at most half full)
+        used = int(self._header[HashStore.META_USED])
+        capacity = len(self._keys)
+        while capacity // HashStore.SLOTS_PER_ROW < used + len(missing): capacity *= 2
+        if capacity > len(self._keys): self._resize(capacity)
+
+        #take the next rows, and place the keys in the table
+        rows[missing] = used + np.arange(len(missing))
+        self._header[HashStore.META_USED] = used + len(missing)
+        self._place(self._keys, self._rows, keys[missing], rows[missing] + 1)
+        return rows
+
+    #place keys (and their rows) into the free slots of a table with numpy
+    #keys that land on the same slot are placed in turn, by linear probing like a single insert
+    def _place(self, table, table_rows, keys, rows):
+        mask = len(table) - 1
+        slots = (self._hash_many(keys) & np.uint64(mask)).astype(np.int64)
+        pending = np.arange(len(keys))
+        while len(pending) > 0:
+
+            #the first pending key on each free slot takes it
+            free = pending[table[slots[pending],0] == 0]
+            (_, first) = np.unique(slots[free], return_index = True)
+            placed = free[first]
+            #(the first word of a key last, since that is what marks the slot as used)
+            table_rows[slots[placed]] = rows[placed]
+            table[slots[placed],1:] = keys[placed,1:]
+            table[slots[placed],0] = keys[placed,0]
+
+            #everything else moves on to its next slot
+            pending = np.setdiff1d(pending, placed, assume_unique = True)
+            slots[pending] = (slots[pending] + 1) & mask
+
+    #move the table to a new capacity and grow the value arrays to match (must be called while locked)
+    #the keys are rehashed into a new generation of arrays, and every other process re-attaches when it sees the new generation
+    #the value arrays grow where they are (see _map_values), so rows written while we grow are never lost
+    def _resize(self, capacity):
+
+        #in a namespace the value arrays can only grow within their reservation (checked before we touch the table)
+        for (level, shm) in self._value_managers.items():
+            rows = shm.size // np.dtype(self._values[level].dtype).itemsize // max(1, self._widths[level])
+            assert capacity // HashStore.SLOTS_PER_ROW <= rows, "Cannot grow the hash store past the {} rows it reserved (declare more infosets or raise the reserve)".format(rows)
+
+        #the old table
+        (keys, rows) = (self._keys, self._rows)
+
+        #map a new generation of the new size
+        generation = int(self._header[HashStore.META_GENERATION]) + 1
+        self._header[HashStore.META_CAPACITY] = capacity
+        old = list(self._managers)
+        self._map_arrays(create = True, generation = generation)
+
+        #rehash every key into the new table
+        slots = np.flatnonzero(keys[:,0])
+        self._place(self._keys, self._rows, keys[slots], rows[slots])
+
+        #publish the new generation, then nobody else can attach to the old one
+        self._header[HashStore.META_GENERATION] = generation
+        for shm in old:
+            try: shm.unlink()
+            except FileNotFoundError: pass
+        console.writeline("Grew hash store to {} keys".format(len(self._keys)))
+
+    #split an infoset path into (path above the infoset, value level, entry in the value array)
+    def _split(self, path):
+        if len(path) < 2 or path[-2][1] != self.infoset_level:
+            raise ValueError("Path {} does not end at an infoset value - the hash store only holds infosets".format(path))
+        level = self._slot_levels[path[-2][0]]
+        if level < 0 or level in self.skip: return (path[:-2], None, path[-1][0])
+        if path[-1][1] != level:
+            raise ValueError("Infoset slot {} holds level {} but the path expects level {}".format(path[-2][0], level, path[-1][1]))
+        return (path[:-2], level, path[-1][0])
+
+    #get a path - return a single item or range, or default.  optionally set the default value if not found
+    #(the same as a symmetric tree, but only for paths to infoset values)
+    def get(self, path, default=None, items=1, set_default = False, include_type = False):
+
+        #find the row of the infoset
+        (prefix, level, item) = self._split(path)
+        row = self._find(prefix, create = set_default and default is not None) if level != None else None
+        if row == None: return (default, 0) if include_type else default
+
+        #the value(s) of the row
+        arr = self._values[level]
+        index = row * self._widths[level] + item
+        if items > 1: return arr[index:index+items]
+        return (arr[index], level) if include_type else arr[index]
+
+    #resolve the leaf blocks (value rows) of an infoset with a single probe (the same as a symmetric tree)
+    #path is the path above the infoset, level the infoset level and leaves the (slot, value level) of each row we want
+    def resolve_leaves(self, path, level, leaves, create = False):
+        if level != self.infoset_level: raise ValueError("Level {} is not the infoset level of this hash store".format(level))
+
+        #find (or add) the row of the infoset
+        (row, added) = self._lookup(path, create)
+        if row == None: return ([None] * len(leaves), [False] * len(leaves))
+
+        #a view of the row of each value level (levels we skipped or dropped have none)
+        #every value of a row is added with it, so either all of them are new or none are
+        views = []
+        for (slot, leaf) in leaves:
+            if self._slot_levels[slot] != leaf or leaf in self.skip: views.append(None)
+            else: views.append(self._values[leaf][row * self._widths[leaf]:(row + 1) * self._widths[leaf]])
+        return (views, [added and view is not None for view in views])
+
+    #set a path (the same as a symmetric tree, but only for paths to infoset values)
+    def set(self, path, value = None, mathop = None):
+
+        #find (or add) the row of the infoset
+        (prefix, level, item) = self._split(path)
+        if level == None: raise ValueError("Path {} is in a level skipped by (or dropped from) this hash store".format(path))
+        row = self._find(prefix, create = True)
+        index = row * self._widths[level] + item
+        count = len(value) if type(value) in (list,np.ndarray) else 1
+        view = self._values[level][index:index+count]
+
+        #handle different math operators
+        if mathop == None: view[:] = value
+        elif mathop == SymmetricTree.MATH_ADD: view += value
+        elif mathop == SymmetricTree.MATH_MULT: view *= value
+        elif mathop == SymmetricTree.MATH_DIV: view /= value
+        elif mathop == SymmetricTree.MATH_SUB: view -= value
@@ -0,0 +1,91 @@
+import numpy as np
+
+#kernels do the cfr math of a node (regret matching, strategy sums, average strategies and regret updates) in place
+#every node of every iteration runs them, so they write into arrays we already have (or a scratch buffer reused
+#by every node with the same number of actions) instead of building new arrays for each step
+#
+#the batched variants (*_rows) do the same math for the rows of many infosets at once (like a whole strategy level)
+
+#scratch buffers by (actions, name) -> only valid until the next kernel that uses the same buffer (each process has its own)
+_scratch = {}
+
+#a scratch buffer of n floats (reused, so callers must be done with it before asking for it again)
+def scratch(n, name = "strategy"):
+    buffer = _scratch.get((n, name))
+    if buffer is None: buffer = _scratch[(n, name)] = np.empty(n)
+    return buffer
+
+#normalize values in place so they sum to one -> if they sum to nothing they become uniform (or are left alone without uniform)
+def normalize(values, uniform = True):
+    total = values.sum()
+    if total > 0: values /= total
+    elif uniform: values.fill(1.0 / len(values))
+    return values
+
+#regret matching -> the positive regrets normalized into out (uniform when no regret is positive)
+def regret_match(regrets, out):
+    np.maximum(regrets, 0, out=out)
+    return normalize(out)
+
+#add a strategy weighted by its reach to a strategy sum (the strategy is used as scratch, so it is overwritten)
+def accumulate(sums, strategy, reach):
+    np.multiply(strategy, reach, out=strategy)
+    np.add(sums, strategy, out=sums, casting="unsafe")
+    return sums
+
+#the average strategy of a strategy sum -> normalized into out (uniform before anything is summed)
+def average_strategy(sums, out):
+    out[:] = sums
+    return normalize(out)
+
+#the value of a node -> each action's counterfactual value weighted by the strategy
+#(the strategy is normalized in place when it sums to something, otherwise the actions are weighted evenly without touching it)
+def expected_value(values, strategy):
+    total = strategy.sum()
+    if total <= 0: return values.sum() / len(values)
+    strategy /= total
+    return values.dot(strategy)
+
+#the regret of each action at a node reached with reach -> how much better each action did than the node did
+#(actions the strategy never played get no regret) written into out
+def regret_delta(values, value, reach, strategy, out):
+    np.subtract(values, value, out=out)
+    out *= reach
+    out[strategy <= 0] = 0
+    return out
+
+#the cumulative log discounts of each dcfr exponent -> entry k sums the log of i^exponent / (i^exponent + 1) for i up to k
+_discounts = {}
+
+#the dcfr discount of iterations start through end-1 -> the product of k^exponent / (k^exponent + 1) over those iterations
+#(read from a table of cumulative logs, so an infoset untouched for many iterations catches up in one step)
+def discount(exponent, start, end):
+    table = _discounts.get(exponent)
+    if table is None or len(table) < end:
+        k = np.arange(1, max(end, 2 * len(table) if table is not None else 1024), dtype=np.float64)
+        table = _discounts[exponent] = np.concatenate(([0.0], np.cumsum(-np.log1p(k ** -exponent))))
+    return float(np.exp(table[end - 1] - table[start - 1]))
+
+#discount regrets in place -> positive regrets by positive and negative regrets by negative
+def discount_regrets(regrets, positive, negative):
+    regrets[regrets > 0] *= positive
+    regrets[regrets < 0] *= negative
+    return regrets
+
+#normalize every row in place (rows that sum to nothing become uniform, or are left alone without uniform)
+def normalize_rows(rows, uniform = True):
+    sums = rows.sum(axis=1, keepdims=True)
+    positive = sums[:,0] > 0
+    rows[positive] /= sums[positive]
+    if uniform: rows[~positive] = 1.0 / rows.shape[1]
+    return rows
+
+#regret matching for every row of regrets at once into out
+def regret_match_rows(regrets, out):
+    np.maximum(regrets, 0, out=out)
+    return normalize_rows(out)
+
+#the average strategy of every row of strategy sums at once into out
+def average_strategy_rows(sums, out):
+    out[:] = sums
+    return normalize_rows(out)
@@ -0,0 +1,173 @@
+import os
+import tempfile
+import numpy as np
+
+#file locks are only available on posix systems
+#without them we fall back to unlocked (single process) allocation
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+#the node allocator hands out new blocks for the levels of a symmetric tree
+#the used count of each level lives in the tree's shape array, which is shared by every process attached to the tree
+#so changing it must be done under a lock that every process agrees on (a file lock named after the tree)
+#to keep that lock off the hot path each process reserves a chunk of blocks per level at a time
+#and hands them out locally, so the shared counters are only touched once per chunk
+#
+#the shape keeps two counts for each level -> the blocks reserved by every chunk so far (where the next chunk starts)
+#and the used count, which only covers blocks actually handed out.  a process publishes the blocks it handed out
+#to the used count whenever it takes the lock (and when asked to, like at the end of a training epoch)
+#
+#linking a new block into a slot takes a lock of its own (one of LINK_STRIPES byte range locks of the same file)
+#so two processes never link the same slot, without every link in the tree waiting on the same lock
+class NodeAllocator:
+
+    #the most blocks a process will reserve from a level at once
+    DEFAULT_CHUNK = 64
+
+    #a process never reserves more than this fraction of a level at once
+    #so small levels (a handful of blocks) are not all reserved by the first process to touch them
+    CHUNK_FRACTION = 256
+
+    #how many locks slots are spread over when linking (byte ranges after the allocation lock at byte zero)
+    LINK_STRIPES = 4096
+
+    #initialize the allocator for a tree
+    #name -> a unique name for the tree (its namespace or full filename) used to name the lock file, None if not shared
+    def __init__(self, tree, name = None, chunk = DEFAULT_CHUNK):
+
+        #save our tree reference
+        self.tree = tree
+
+        #our locally reserved blocks for each level -> level: [next block, end block]
+        #and the last block we handed out of each level that the used count may not cover yet
+        self._reserved = {}
+        self._handed = {}
+
+        #how deep we are in locked calls of each lock (the lock is taken by the outermost one only)
+        self._depth = {}
+
+        #if we are not shared with other processes (or can't lock) we allocate one block at a time with no lock
+        self._lockfile = None
+        self.chunk = 1
+        if name != None and fcntl != None:
+
+            #open (or create) the lock file for this tree
+            lockname = "symmtree_{}.lock".format(name.replace(os.sep,"_").replace(":","_"))
+            self._lockfile = open(os.path.join(tempfile.gettempdir(), lockname), "a+")
+            self.chunk = max(1, chunk)
+
+    #close our lock file (publish first, or the blocks we handed out since the last publish are not counted)
+    def close(self):
+
+        #release our lock file and forget any blocks we reserved
+        if self._lockfile != None: self._lockfile.close()
+        self._lockfile = None
+        self._reserved = {}
+        self._handed = {}
+
+    #run a function while holding a lock of the tree -> stripe None is the allocation lock, otherwise a link lock
+    #(a stripe of -1 takes every link lock at once)
+    #calls nest (like allocating while linking), so only the outermost call of each lock takes and releases it
+    def locked(self, function, *args, stripe = None):
+
+        #no lock (or we already hold it) - just run the function
+        if self._lockfile == None or self._depth.get(stripe, 0) > 0: return function(*args)
+
+        #the byte range of the lock
+        (start, length) = (0, 1) if stripe == None else (1, NodeAllocator.LINK_STRIPES) if stripe < 0 else (1 + stripe % NodeAllocator.LINK_STRIPES, 1)
+
+        #take the lock, run the function, and always release the lock
+        fcntl.lockf(self._lockfile.fileno(), fcntl.LOCK_EX, length, start)
+        self._depth[stripe] = 1
+        try:
+            return function(*args)
+        finally:
+            self._depth[stripe] = 0
+            fcntl.lockf(self._lockfile.fileno(), fcntl.LOCK_UN, length, start)
+
+    #run a function while holding the link lock of a slot of a level
+    def linking(self, level, slot, function, *args):
+        return self.locked(function, *args, stripe = (level * 7919 + int(slot)) % NodeAllocator.LINK_STRIPES)
+
+    #allocate a run of blocks in a level and return the first (1 based) block index
+    def alloc(self, level, count = 1):
+
+        #if we have enough blocks reserved locally, hand them out without touching the shared counters
+        reserved = self._reserved.get(level)
+        if reserved != None and reserved[1] - reserved[0] >= count:
+            start = reserved[0]
+            reserved[0] += count
+            self._hand_out(level, start + count - 1)
+            return start
+
+        #otherwise reserve a new chunk (any blocks left in the old chunk are never handed out)
+        (start, end) = self.locked(self._reserve, level, count)
+        self._reserved[level] = [start + count, end]
+        self._hand_out(level, start + count - 1)
+
+        #return the first block of the chunk
+        return start
+
+    #remember the last block we handed out of a level
+    #without other processes there is nothing to lock, so the used count is simply kept up to date
+    def _hand_out(self, level, block):
+        if self._lockfile == None: self._set_used(level, block)
+        else: self._handed[level] = max(self._handed.get(level, 0), block)
+
+    #count the blocks we handed out in the used counts of their levels
+    #and give back what is left of our chunks when nobody has reserved past them (so they don't become empty blocks)
+    def publish(self):
+        if len(self._handed) > 0 or len(self._reserved) > 0: self.locked(self._release)
+
+    #publish and give back the rest of our chunks (must be called while locked)
+    def _release(self):
+        self._publish()
+        for (level, (start, end)) in self._reserved.items():
+            if self.tree._reserved_blocks(level) == end - 1: self.tree._set_reserved_blocks(level, start - 1)
+        self._reserved = {}
+
+    #count the blocks we handed out in the used counts (must be called while locked)
+    def _publish(self):
+        for (level, block) in self._handed.items(): self._set_used(level, block)
+        self._handed = {}
+
+    #raise the used count of a level to cover a block (must be called while locked when shared)
+    def _set_used(self, level, block):
+        loc = level * self.tree.SHAPE_SIZE + self.tree.LOC_USED
+        if block > self.tree._shape[loc]: self.tree._shape[loc] = block
+
+    #reserve a chunk of blocks from a level (must be called while locked)
+    #if the level is full it is grown first, so levels only ever hold the blocks actually reserved
+    #returns the range of blocks reserved as (start, end)
+    def _reserve(self, level, count):
+
+        #another process may have grown a level since we last looked
+        self.tree.refresh()
+
+        #we hold the lock anyway, so count what we handed out so far
+        self._publish()
+
+        #get level info -> chunks start after every block reserved (or used, for a tree that has not reserved any yet)
+        (shape,_,total,used) = self.tree.levelinfo(level)
+        reserved = max(int(used), self.tree._reserved_blocks(level))
+        blocks = int(total) // int(shape)
+
+        #if the level can't hold the blocks we need, grow it
+        if reserved + count > blocks:
+            self.tree._grow_level(level, reserved + count)
+            blocks = int(self.tree.levelinfo(level)[2]) // int(shape)
+
+        #reserve a chunk, but never more than a fraction of the level, and never less than we need
+        chunk = min(self.chunk, max(1, blocks // NodeAllocator.CHUNK_FRACTION))
+        chunk = max(count, min(chunk, blocks - reserved))
+
+        #is this new path going to overflow the storage value in our shape array?
+        assert reserved + chunk <= np.iinfo(self.tree._shape.dtype).max, "Cannot allocate {} blocks in level {} - new size value {}+{} will overflow maxint".format(count, level, reserved, chunk)
+
+        #bump the shared reserved count for everyone
+        self.tree._set_reserved_blocks(level, reserved + chunk)
+
+        #return the range we reserved
+        return (reserved + 1, reserved + chunk + 1)
@@ -0,0 +1,140 @@
+import console
+import numpy as np
+import pyjson5 as json
+from games import Game
+from engine.Regrets import RegretManager
+from engine.SymmetricTree import SymmetricTree
+from engine.Trainee import Trainee
+
+#a planning player plays randomly (like a trainee) but shows the planner the regret path of every decision it makes
+class PlanningPlayer(Trainee):
+
+    #the planner we report our paths to
+    planner = None
+
+    #declare a random action, after reporting the path we would train it at
+    def declare_action(self, actions, round_state, game_state):
+        self.planner.record(self.abstractor.gen_regret_path(game_state, self))
+        return super().declare_action(actions, round_state, game_state)
+
+#the planner sizes the levels of a symmetric tree before training -> it plays sampled games with the path generator
+#of the game (random actions, no regrets are read or updated) and counts the distinct blocks each level needs
+#then recommends a size for each level with headroom for the paths the sample missed
+class Planner:
+
+    #recommend this many times the blocks we measured (unless settings say otherwise)
+    DEFAULT_HEADROOM = 2.0
+
+    #blocks first seen in this last part of the sampled games tell us if a level is still growing
+    RECENT = 0.1
+
+    #the multipliers of the symmtree definition (largest first) -> see GameAbstractor.gen_symmtree_shape
+    MULTIPLIERS = [("b", 1000000000), ("hm", 100000000), ("tm", 10000000), ("m", 1000000), ("ht", 100000), ("tt", 10000), ("t", 1000), ("h", 100), ("o", 1)]
+
+    #start a plan
+    def __init__(self):
+        self.reset()
+
+    #forget every path we have seen -> the blocks of each level, those seen recently and the levels pointing to each level
+    def reset(self):
+        self.nodes = {}
+        self.recent = {}
+        self.parents = {}
+        self.recording = False
+
+    #remember the blocks a regret path needs -> the block of each level is found by the path leading to it
+    def record(self, path):
+        path = tuple((int(slot), int(level)) for (slot, level) in path)
+        for px in range(len(path)):
+            self._see(path[px][1], path[:px], path[px-1][1] if px > 0 else None)
+
+        #and the infoset block at the end of the path
+        self._see(RegretManager.INFOSET_PATH, path, path[-1][1] if len(path) > 0 else None)
+
+    #count a block of a level the first time we see it
+    def _see(self, level, key, parent):
+        nodes = self.nodes.setdefault(level, set())
+        if key in nodes: return
+        nodes.add(key)
+        if self.recording: self.recent[level] = self.recent.get(level, 0) + 1
+        if parent != None: self.parents.setdefault(level, set()).add(parent)
+
+    #play games with the path generator of our game and plan every level of the shape
+    #returns a dict for each level -> name, shape, type, measured (blocks), recent (of those, first seen in the last games),
+    #declared (blocks), blocks (recommended), bytes (memory of the recommended blocks), size and multiplier (of the recommendation)
+    #and overflow (set if the recommended blocks don't fit in an index level pointing to the level)
+    #levels no sampled path reached keep their declared size
+    def plan(self, game:Game, regretman:RegretManager, settings:dict, count = None, headroom = None):
+        count = count if count != None else settings.get("planGames", 1000)
+        headroom = headroom if headroom != None else settings.get("planHeadroom", Planner.DEFAULT_HEADROOM)
+        self.reset()
+
+        #our players play every seat
+        players = [PlanningPlayer("p{}".format(p), game) for p in range(0, game.seats)]
+        for player in players:
+            player.configure(regretman)
+            player.planner = self
+
+        #play the games (the same way the analyzer does)
+        gameState = game.setup(players)
+        for step in range(1, count + 1):
+            console.progress("Planning", step, count)
+            self.recording = step > count * (1 - Planner.RECENT)
+            gameState = game.reset(gameState)
+            while not game.finished(gameState):
+                gameState = game.step(gameState)
+                if game.roundFinished(gameState): gameState = game.step(gameState)
+        console.writeline("")
+
+        #every infoset has a block in each of its value levels (stats are only kept if we keep infoset stats)
+        infosets = len(self.nodes.get(RegretManager.INFOSET_PATH, ()))
+        recent = self.recent.get(RegretManager.INFOSET_PATH, 0)
+        for level in (RegretManager.REGRET_PATH, RegretManager.STRAT_PATH, RegretManager.STAT_PATH):
+            if level == RegretManager.STAT_PATH and regretman.stats_every == 0: continue
+            self.nodes[level] = range(infosets)
+            self.recent[level] = recent
+            self.parents[level] = {RegretManager.INFOSET_PATH}
+
+        #plan each level
+        names = {level: name for (name, level) in regretman.game_abstractor.path_names().items()}
+        shape = regretman.symmtree_shape
+        levels = []
+        for level in range(len(shape)):
+            (width, type) = (int(shape[level][0]), SymmetricTree.level_type(shape[level][1]))
+            measured = len(self.nodes.get(level, ()))
+            blocks = int(np.ceil(measured * headroom)) if measured > 0 else int(shape[level][2])
+            (size, multiplier) = Planner.size(blocks)
+
+            #index levels that keep the level of every child hold a type array too
+            derived = len(shape[level]) > 3 and shape[level][3] != None
+            entry = SymmetricTree.level_dtype(type)().itemsize + (1 if SymmetricTree.is_index(type) and not derived else 0)
+            levels.append({
+                "name": names.get(level, str(level)), "shape": width, "type": type, "measured": measured, "recent": self.recent.get(level, 0),
+                "declared": int(shape[level][2]), "blocks": size * dict(Planner.MULTIPLIERS)[multiplier], "size": size, "multiplier": multiplier,
+                "bytes": size * dict(Planner.MULTIPLIERS)[multiplier] * width * entry, "overflow": False
+            })
+
+        #blocks are numbered from 1, so every index level pointing into a level must hold its last block
+        for level in range(len(levels)):
+            for parent in self.parents.get(level, ()):
+                if levels[level]["blocks"] > np.iinfo(SymmetricTree.level_dtype(levels[parent]["type"])).max: levels[level]["overflow"] = True
+
+        #return our plan
+        return levels
+
+    #the size and multiplier to declare at least this many blocks with (rounding up within the largest multiplier that fits)
+    @staticmethod
+    def size(blocks):
+        for (multiplier, count) in Planner.MULTIPLIERS:
+            if blocks >= count: return (-(-blocks // count), multiplier)
+        return (0, "o")
+
+    #the symmtree definition of settings with the sizes of a plan (one line for each level)
+    @staticmethod
+    def definition(settings, levels):
+        lines = []
+        for level in range(len(settings.get("symmtree", []))):
+            definition = list(settings["symmtree"][level])
+            definition[3:5] = [levels[level]["size"], levels[level]["multiplier"]]
+            lines.append("[ " + ", ".join(json.dumps(value) for value in definition) + " ]")
+        return lines
@@ -1,9 +1,18 @@
 from typing import Dict
 from engine.SymmetricTree import SymmetricTree
+from engine.HashStore import HashStore
+from engine.ShardedTree import ShardedTree
+from engine.NodeAllocator import NodeAllocator
 from engine.GameAbstractor import GameAbstractor
 import engine.FastCopy as fastcopy
+import engine.Kernels as kernels
 import numpy as np
 import pyjson5 as json
+import random
+import os
+import shutil
+import copy
+import time
 
 #this is required for shared memory accessed between processes
 from multiprocessing import shared_memory as mem
@@ -11,50 +20,49 @@ from multiprocessing import shared_memory as mem
 #an information set is the lowest level of regrets - representing leaf nodes
 class InformationSet():
 
-    #internals
-    path:list = None
-    symm:SymmetricTree = None
-    create:bool = True
+    #an infoset is made for every node we train, so it only holds its own slots (no per-instance dict)
+    #path, symm and create are our internals, regretman is the regret manager whose settings decide how we are updated
+    #and refreg, refstrat and refstat are direct references to our shared numpy array slices (so we don't have to continually locate their paths)
+    __slots__ = ("path", "symm", "create", "regretman", "num_actions", "refreg", "refstrat", "refstat")
 
-    #direct references to our shared numpy array slices (so we don't have to continually locate their paths
-    refreg:np.array = None
-    refstrat:np.array = None
-    refstat:np.array = None
+    #the sampling of reads and writes has its own random numbers, so it never shifts the random numbers the games deal from
+    STATS_RANDOM = random.Random()
+
+    #the reads and writes made in this process (over every infoset) -> aggregate counts that never touch the tree
+    reads_made = 0
+    writes_made = 0
+
+    #the iteration we are training (the games each core has trained since training started) -> set by the trainer before every game
+    iteration = 1
 
     #initialize a new infoset
-    def __init__(self, path:list, symm:SymmetricTree, create:bool = True):
+    #regretman -> the regret manager our regrets belong to (how we count stats, update and prune comes from its settings)
+    def __init__(self, path:list, symm:SymmetricTree, regretman, create:bool = True):
 
         #save a reference to the symm tree and path
         self.path = path
         self.symm = symm
         self.create = create
-
-        #get shape array reference
-        shape = symm.shape()
-
-        #if the last item in our path is an action (not a hand profile)
-        #then let's add a fake hand profile to store the infoset
-        #this keeping the shape symmetric but allowing non-leaf infosets
-        #if path[-1][1] == 1: path += [(shape[2]-1,2)]
+        self.regretman = regretman
 
         #the # of actions is stored at the leaf level of infosets
-        self.num_actions = shape[RegretManager.REGRET_PATH * SymmetricTree.SHAPE_SIZE]
-
-        #if this is a new infoset, set everything up for it
-        if self.create:
-            if self.symm.get(self.path + RegretManager.PATH_STAT_LOC_READS, default=0, set_default = True) == 0:
+        self.num_actions = symm.shape()[RegretManager.REGRET_PATH * SymmetricTree.SHAPE_SIZE]
 
-                #write default regrets and strategy (using get / default options -> allows us to write
-                self.symm.set( self.path + RegretManager.PATH_INFOSET_REGRETS, np.zeros(self.num_actions) )
-                self.symm.set( self.path + RegretManager.PATH_INFOSET_STRAT, self.get_default_strategy() )
+        #walk to our infoset block once and take the regrets, strategy and stats blocks from it (read-only regrets never create infosets)
+        #(levels skipped by our load profile are never found, so their references are None, and so are stats we don't keep)
+        (leaves, created) = symm.resolve_leaves(path, RegretManager.INFOSET_PATH, regretman.infoset_leaves, create and not symm.readonly)
+        self.refreg = leaves[0]
+        self.refstrat = leaves[1]
+        self.refstat = leaves[2] if len(leaves) > 2 else None
 
-                #we have now read once and written once
-                self.symm.set(self.path + RegretManager.PATH_INFOSET_STAT,[1,1])
+        #write defaults into the blocks we just created (an infoset trained before it kept stats only gains a stats block)
+        if created[0]: self.refreg[:] = 0
+        if created[1]: self.refstrat[:] = self.get_default_strategy()
 
-        #now, store references back to our internal array slices, so don't have to keep calculating them
-        self.refreg = self.symm.get( self.path + RegretManager.PATH_INFOSET_REGRETS, items=self.num_actions )
-        self.refstrat = self.symm.get( self.path + RegretManager.PATH_INFOSET_STRAT, items=self.num_actions )
-        self.refstat = self.symm.get(self.path + RegretManager.PATH_INFOSET_STAT, items=2)
+        #we have now read once and written once (and are discounted up to this iteration)
+        if len(created) > 2 and created[2]:
+            self.refstat[:] = 1
+            if len(self.refstat) > RegretManager.STAT_LOC_TOUCHED: self.refstat[RegretManager.STAT_LOC_TOUCHED] = InformationSet.iteration
 
     #return our reads
     def reads(self):
@@ -63,6 +71,7 @@ class InformationSet():
         #return self.symm.get( self.path + RegretManager.PATH_STAT_LOC_READS,0 )
 
         #JBC 09/23/21 -> no longer finding the path, use referenced array directly
+        if self.refstat is None: return 0
         return self.refstat[RegretManager.PATH_STAT_LOC_READS[-1][0]]
 
     #return our writes
@@ -72,6 +81,7 @@ class InformationSet():
         #return self.symm.get( self.path + RegretManager.PATH_STAT_LOC_WRITES,0 )
 
         #JBC 09/23/21 -> no longer finding the path, use referenced array directly
+        if self.refstat is None: return 0
         return self.refstat[RegretManager.PATH_STAT_LOC_WRITES[-1][0]]
 
 
@@ -90,6 +100,10 @@ class InformationSet():
         #return those raw regrets
         return regrets
 
+    #return the current (regret matching) strategy, without adding it to the strategy sum
+    def get_current_strategy(self) -> np.array:
+        return kernels.regret_match(self.regrets(), np.empty(self.num_actions))
+
     #return our strategy
     def strategy(self):
         #get our strategy
@@ -110,19 +124,14 @@ class InformationSet():
     def actions(self):
         return self.num_actions
 
-    #normalize a strategy
+    #normalize a strategy (in place). If there are no positive regrets,
+    #use a uniform random strategy
     def normalize(self, strategy: np.array) -> np.array:
-        #normalize a strategy. If there are no positive regrets,
-        #use a uniform random strategy
-        if sum(strategy) > 0:
-            strategy /= sum(strategy)
-        else:
-            strategy = self.get_default_strategy()
-        return strategy
+        return kernels.normalize(strategy)
 
     #return the default strategy
     def get_default_strategy(self):
-        return np.array([1.0 / self.num_actions] * self.num_actions)
+        return np.full(self.num_actions, 1.0 / self.num_actions)
 
     def get_strategy(self, reach_probability: float) -> np.array:
 
@@ -138,19 +147,25 @@ class InformationSet():
             #BE SURE TO MAKE A COPY OF REGRETS SO WE DON'T OVERWRITE THEM!!!
             #JBC 09/22/21 -> moved this within the reach probably check since we don't need to get regrets if reach probably is zero
             #JBC 09/22/21 -> removed np.copy() operation within np.maximum call, since np.maximum definition states it makes a copy
-            strategy = self.normalize(np.maximum(0, self.regrets()))
+            #(regret matching now writes into a scratch buffer, so no copy of the regrets is made at all)
+            if self.regretman.rule == "dcfr": self.discount()
+            strategy = kernels.regret_match(self.regrets(), kernels.scratch(self.num_actions))
 
             #update strategy sum with new strategy
             #self.symm.set( self.path + RegretManager.PATH_INFOSET_STRAT, reach_probability * strategy, SymmetricTree.MATH_ADD)
 
             #JBC 09/23/21 -> no longer re-finding the regret array, updating our reference
-            self.refstrat += reach_probability * strategy
+            #(linear cfr and cfr+ weigh the strategy of each iteration by its number)
+            weight = InformationSet.iteration if self.regretman.rule in ("linear", "cfr+") else 1
+            kernels.accumulate(self.refstrat, strategy, reach_probability * weight)
 
             #there is one more read
             #self.symm.set( self.path + RegretManager.PATH_STAT_LOC_READS,1,SymmetricTree.MATH_ADD)
 
             #JBC 09/23/21 -> no longer refinding the stats array, update reference directly
-            self.refstat[RegretManager.PATH_STAT_LOC_READS[-1][0]] += 1
+            InformationSet.reads_made += 1
+            if self.refstat is not None and self.count_stat():
+                self.refstat[RegretManager.PATH_STAT_LOC_READS[-1][0]] += self.regretman.stats_every
             
 
         #now that we have updated strategy, return normalized strategy sum (i.e. average strategy)
@@ -162,7 +177,9 @@ class InformationSet():
         #self.symm.set( self.path + RegretManager.PATH_STAT_LOC_WRITES,1,SymmetricTree.MATH_ADD)
 
         #JBC 09/23/21 -> no longer finding the stat path, update directly
-        self.refstat[RegretManager.PATH_STAT_LOC_WRITES[-1][0]] += 1
+        InformationSet.writes_made += 1
+        if self.refstat is not None and self.count_stat():
+            self.refstat[RegretManager.PATH_STAT_LOC_WRITES[-1][0]] += self.regretman.stats_every
 
         #update regret if we were able to call this value
         #JBC: 9/11/20 - added this to prevent negative regret for actions not taken, does this work?
@@ -173,7 +190,51 @@ class InformationSet():
         #self.symm.set(self.path + RegretManager.PATH_INFOSET_REGRETS,counterfactual_values,SymmetricTree.MATH_ADD)
 
         #JBC 09/23/21 -> no longer refinding regrets, using reference
-        self.refreg += counterfactual_values
+        #(linear cfr weighs the regrets of each iteration by its number, and cfr+ floors regrets at zero)
+        rule = self.regretman.rule
+        if rule == "dcfr": self.discount()
+        if self.refreg is None: return
+        if rule == "linear": kernels.accumulate(self.refreg, counterfactual_values, InformationSet.iteration)
+        else: self.refreg += counterfactual_values
+        if rule == "cfr+": np.maximum(self.refreg, 0, out=self.refreg)
+
+    #regret-based pruning -> the actions to skip this iteration (None to walk every action)
+    #an infoset's actions with regret below prune_below (of the regret manager) are skipped until the iteration kept in its stats, then every action is
+    #walked once to re-check them, and they are skipped again for as many iterations as the best of them needs to climb back to zero
+    #(skipped actions aren't updated, so their regret holds until they are re-checked)
+    def prune(self):
+        prune_below = self.regretman.prune_below
+        if prune_below >= 0 or self.refreg is None or self.refstat is None or len(self.refstat) <= RegretManager.STAT_LOC_PRUNED: return None
+
+        #we never prune every action
+        below = self.refreg < prune_below
+        if not below.any() or below.all(): return None
+        if InformationSet.iteration < self.refstat[RegretManager.STAT_LOC_PRUNED]: return below
+
+        #time to re-check -> walk every action now, and skip the ones still below until they could climb back
+        until = InformationSet.iteration + max(1, int(-self.refreg[below].max() / self.regretman.prune_gain))
+        self.refstat[RegretManager.STAT_LOC_PRUNED] = min(until, np.iinfo(self.refstat.dtype).max) if self.refstat.dtype.kind in "iu" else until
+        return None
+
+    #dcfr discounts our regrets and strategy sums after every iteration -> we do it lazily, catching up on every iteration
+    #since we were last touched (kept in our stats) the first time we are touched in an iteration
+    #(regrets created before we used dcfr have no room for the iteration, so they are never discounted)
+    def discount(self):
+        if self.refstat is None or len(self.refstat) <= RegretManager.STAT_LOC_TOUCHED: return
+        (touched, now) = (int(self.refstat[RegretManager.STAT_LOC_TOUCHED]), InformationSet.iteration)
+        if now <= touched: return
+
+        #infosets from before we discounted (or from an earlier training) start being discounted now
+        if touched > 0:
+            (alpha, beta, gamma) = self.regretman.discounts
+            if self.refreg is not None: kernels.discount_regrets(self.refreg, kernels.discount(alpha, touched, now), kernels.discount(beta, touched, now))
+            if self.refstrat is not None: self.refstrat *= (touched / now) ** gamma
+        self.refstat[RegretManager.STAT_LOC_TOUCHED] = now
+
+    #should this read or write be counted in the stats of the infoset
+    def count_stat(self):
+        every = self.regretman.stats_every
+        return every == 1 or (every > 1 and InformationSet.STATS_RANDOM.random() * every < 1)
 
     #return the average strategy (no updating here)
     #if for some reason the strategy is not found we return default
@@ -182,7 +243,9 @@ class InformationSet():
         #return our strategy, but normalized
         #JBC 09/22/21 -> replace .copy with np.copy()
         #JBC 09/23/21 -> remove np.copy since self.strategy() already calls it
-        return self.normalize(self.strategy())
+        #(the average is normalized straight into a new array, since callers change what we return)
+        if self.refstrat is None: return self.get_default_strategy()
+        return kernels.average_strategy(self.refstrat, np.empty(self.num_actions))
 
     #return current regrets
     def get_regrets(self) -> np.array:
@@ -201,15 +264,10 @@ class StrategyManager():
         self.strategy = strategy
         self.counterfactual_values = np.zeros(action_sets)
 
-    #normalize a strategy
+    #normalize a strategy (in place). If there are no positive regrets,
+    #use a uniform random strategy
     def normalize(self, strategy: np.array) -> np.array:
-        #normalize a strategy. If there are no positive regrets,
-        #use a uniform random strategy
-        if sum(strategy) > 0:
-            strategy /= sum(strategy)
-        else:
-            strategy = np.array([1.0 / len(strategy)] * len(strategy))
-        return strategy
+        return kernels.normalize(strategy)
 
     #record a counterfactual value for a given action (index)
     def set_counterfactual_value(self,action: int, value: float):
@@ -220,19 +278,15 @@ class StrategyManager():
 
         #our counterfactual values can be negative, adjust for that
         strategy = self.counterfactual_values.copy()
-        strategy += max(abs(strategy))
+        strategy += np.abs(strategy).max()
 
         #now normalize them
-        stratsum = sum(strategy)
-        if stratsum == 0:
-            strategy[:] = 1 / len(strategy)
-        else:
-            strategy /= stratsum
+        kernels.normalize(strategy)
 
         #2021-08-27 - renormalize again by the current strategy
         #this will remove strategies that can't be called (zeroed out by iteration)
         strategy *= self.strategy
-        strategy /= sum(strategy)
+        kernels.normalize(strategy, uniform = False)
 
         #return that strategy
         return strategy
@@ -247,7 +301,8 @@ class StrategyManager():
         #so the strategy looks like [0,.5,0] -> selling returns 7K regret, but weighted that returns [0,3.5k,0] so
         #the likelyhood of taking this path is reduced for prior steps in our iterate method
 
-        return self.counterfactual_values.dot(self.normalize(self.strategy))
+        #(the strategy is normalized in place, as it always was, unless it is all zeros)
+        return kernels.expected_value(self.counterfactual_values, self.strategy)
 
     #update info set regrets given reach probability
     def update_regrets(self, info_set: InformationSet, reach_probability: float):
@@ -277,7 +332,8 @@ class StrategyManager():
         #JBC 11/9/20 -> do not adjust strategies that were not used (strategy is ZERO)
         #this concept works fine as long as we are not normalizing remaining startegies
         #which tilts our training too quickly to the paths that are available to take
-        adjusted_regrets = reach_probability * (self.counterfactual_values - current_regret) * np.where(self.strategy > 0, 1, self.strategy)
+        #(computed into a scratch buffer the infoset adds straight into its regrets)
+        adjusted_regrets = kernels.regret_delta(self.counterfactual_values, current_regret, reach_probability, self.strategy, kernels.scratch(len(self.strategy), "regrets"))
 
         #update infoset with regret
         info_set.update_regrets(adjusted_regrets)
@@ -318,6 +374,15 @@ class RegretManager():
     # definitions of statistic values -> these don't change regardless of overall symmtree shape
     STAT_LOC_READS = 0
     STAT_LOC_WRITES = 1
+    STAT_LOC_TOUCHED = 2
+    STAT_LOC_PRUNED = 3
+
+    # how regrets and strategy sums are updated
+    # cfr -> cumulative regrets, with strategies averaged by reach
+    # cfr+ -> regrets are floored at zero, and the strategy of each iteration is weighted by its number
+    # linear -> the regrets and strategy of each iteration are weighted by its number
+    # dcfr -> regrets and strategy sums are discounted after every iteration (lazily, when an infoset is next touched)
+    UPDATE_RULES = ("cfr", "cfr+", "linear", "dcfr")
 
     # predefine some common paths for statistics
     PATH_STAT_LOC_READS = []
@@ -328,6 +393,36 @@ class RegretManager():
     PATH_INFOSET_STRAT = []
     PATH_INFOSET_STAT = [(STAT_LOC, INFOSET_PATH), (0, STAT_PATH)]
 
+    # how the infosets of our regrets are updated (set from our settings when we are configured, see InformationSet)
+    # stats_every -> how reads and writes are counted in the stats of each infoset
+    #   1 -> every read and write, N -> a sample of 1 in N (counting N each time), 0 -> never (there is no stats level)
+    # rule -> how regrets and strategy sums are updated (see UPDATE_RULES)
+    # discounts -> the dcfr discounts (alpha for positive regrets, beta for negative regrets, gamma for strategy sums)
+    # prune_below and prune_gain -> regret-based pruning skips actions with regret below prune_below (zero or more never prunes)
+    #   and prune_gain is the most regret an action can gain in one iteration
+    # infoset_leaves -> the (slot, level) of the regrets, strategy and stats blocks of an infoset (an infoset resolves them in one walk)
+    stats_every = 1
+    rule = "cfr"
+    discounts = (1.5, 0.0, 2.0)
+    prune_below = 0
+    prune_gain = 1.0
+    infoset_leaves = []
+
+    # load profiles decide which levels of the regrets we load, open or attach to
+    # full -> every level, training -> every level training writes (everything but the stats when infoset stats are off)
+    # inference -> only the paths and strategy sums (for nash and play)
+    # the levels a profile leaves out are never read and stay empty, so regrets loaded with one can't be saved
+    # (training keeps the stats whenever it counts them, so what it trains can always be saved and checkpointed)
+    PROFILES = ("full", "training", "inference")
+    profile = "full"
+
+    # the reads and writes made over every infoset by the processes of our last training (see InformationSet.reads_made)
+    # and the actions they walked and pruned (see Trainer.walked)
+    aggregate_reads = 0
+    aggregate_writes = 0
+    aggregate_walked = 0
+    aggregate_pruned = 0
+
     # our settings
     settings = {}
 
@@ -347,6 +442,76 @@ class RegretManager():
         # initialize shared identity logic for regret locks
         self.shared_identity = None
 
+    #the class that holds our regrets -> a symmetric tree, or a hash store keyed by packed paths
+    #(split into shards of either one by the start of each path when there is more than one shard)
+    def store_class(self, store = None):
+        if store == None and self.settings.get("shards",1) > 1: return ShardedTree
+        return HashStore if (store or self.settings.get("store","tree")) == "hash" else SymmetricTree
+
+    #the levels a load profile skips
+    def profile_levels(self, profile):
+        if profile == "full": return []
+        if profile == "training": return [RegretManager.STAT_PATH] if self.stats_every == 0 else []
+        if profile == "inference": return [RegretManager.REGRET_PATH, RegretManager.STAT_PATH]
+        raise ValueError("Unknown load profile {} (use {})".format(profile, ", ".join(RegretManager.PROFILES)))
+
+    #how many stats values each infoset keeps -> its reads and writes, then the iteration dcfr last discounted it for
+    #and the iteration regret-based pruning re-checks it at (when we use them)
+    def stats_width(self):
+        if self.prune_below < 0: return RegretManager.STAT_LOC_PRUNED + 1
+        if self.rule == "dcfr": return RegretManager.STAT_LOC_TOUCHED + 1
+        return RegretManager.STAT_LOC_WRITES + 1
+
+    #options passed to every symmetric tree (or hash store) we create, open or attach to
+    def tree_options(self, store = None):
+
+        #every shard is a symmetric tree (or hash store) with the usual options
+        if self.store_class(store) == ShardedTree: return {
+            "shards": self.settings.get("shards",1),
+
+            #how many tuples at the start of a path decide its shard
+            "shard_depth": self.settings.get("shardDepth",1),
+            "store": self.store_class(self.settings.get("store","tree")),
+            **self.tree_options(self.settings.get("store","tree"))
+        }
+
+        #a hash store needs to know where the infoset and its values are in the shape
+        if self.store_class(store) == HashStore: return {
+            "infoset_level": RegretManager.INFOSET_PATH,
+            #(without infoset stats their slot is kept, but holds nothing)
+            "leaf_levels": [RegretManager.REGRET_PATH, RegretManager.STRAT_PATH, RegretManager.STAT_PATH if self.stats_every > 0 else -1],
+
+            #the longest path above an infoset (defaults to one tuple per level above the infoset)
+            "key_depth": self.settings.get("hashKeyDepth",None),
+
+            #how many infosets the store starts with room for (it doubles as it fills)
+            "capacity": HashStore.SLOTS_PER_ROW * self.settings.get("hashInfosets",HashStore.INITIAL_CAPACITY // HashStore.SLOTS_PER_ROW),
+
+            #how many times the infosets planned the store reserves room for in a namespace
+            "reserve": self.settings.get("sharedReserve",SymmetricTree.SHARED_RESERVE),
+
+            #the levels our load profile skips
+            "skip": self.profile_levels(self.profile)
+        }
+
+        return {
+
+            #how many resolved paths each process caches in its symmetric tree (zero disables the cache)
+            "cache_size": self.settings.get("pathCache",0),
+
+            #how many blocks each process reserves from a level at a time when allocating new nodes
+            "alloc_chunk": self.settings.get("allocChunk",NodeAllocator.DEFAULT_CHUNK),
+
+            #sparse storage only commits the part of each level in use, growing levels as they fill
+            "sparse": self.settings.get("storage","full") == "sparse",
+
+            #how many times its planned size each level reserves in a namespace (levels can't grow past it)
+            "reserve": self.settings.get("sharedReserve",SymmetricTree.SHARED_RESERVE),
+
+            #the levels our load profile skips
+            "skip": self.profile_levels(self.profile)
+        }
+
     #has our symm tree been initialized (loaded or opened) already either on disk or otherwise)
     def initialized(self):
         return (self.symm_tree != None)
@@ -365,7 +530,7 @@ class RegretManager():
             regret_path = self.game_abstractor.gen_regret_path(game_state, player)
 
         #return an infoset reference for this path
-        return InformationSet(path=regret_path, symm=self.symm_tree, create=save_set)
+        return InformationSet(path=regret_path, symm=self.symm_tree, regretman=self, create=save_set)
 
     #get the training of a regret node
     def eval_training(self, quick=False):
@@ -376,8 +541,8 @@ class RegretManager():
 
         #if we have time, calculate trained nodes:
         if not quick:
-            #reshape the array as 2d
-            view = self.symm_tree._arrays[RegretManager.STRAT_PATH][0:strategy_nodes * strategy_size].reshape(-1,strategy_size)
+            #the strategies in use as a 2d array (one row per infoset)
+            view = self.symm_tree.level_view(RegretManager.STRAT_PATH)
 
             #trained nodes are those where at least 1 action has pulled away from average strategy
             #if all strategies are closly aligned, the node is really not trained yet
@@ -452,26 +617,60 @@ class RegretManager():
         RegretManager.PATH_INFOSET_STRAT = [(RegretManager.STRAT_LOC, RegretManager.INFOSET_PATH), (0, RegretManager.STRAT_PATH)]
         RegretManager.PATH_INFOSET_STAT = [(RegretManager.STAT_LOC, RegretManager.INFOSET_PATH), (0, RegretManager.STAT_PATH)]
 
+        ##### THE REST ARE OUR OWN (INSTANCE) VALUES, PASSED TO EVERY INFOSET WE MAKE ######
+
+        # how the reads and writes of each infoset are counted (see stats_every)
+        # without stats the stats level stays in our shape (so every path is the same) but holds nothing
+        self.stats_every = self.settings.get("infosetStats",1)
+        if self.stats_every == 0:
+            self.symmtree_shape = [list(level) for level in self.symmtree_shape]
+            self.symmtree_shape[RegretManager.STAT_PATH][2] = 0
+
+        # the (slot, level) of the regrets, strategy and stats blocks of an infoset (an infoset resolves them in one walk)
+        self.infoset_leaves = [(RegretManager.REGRET_LOC, RegretManager.REGRET_PATH), (RegretManager.STRAT_LOC, RegretManager.STRAT_PATH)]
+        if self.stats_every > 0: self.infoset_leaves.append((RegretManager.STAT_LOC, RegretManager.STAT_PATH))
+
+        # how regrets and strategy sums are updated (see UPDATE_RULES) and how deeply negative regrets are pruned
+        self.rule = self.settings.get("regretUpdate","cfr")
+        self.discounts = (self.settings.get("dcfrAlpha",1.5), self.settings.get("dcfrBeta",0.0), self.settings.get("dcfrGamma",2.0))
+        self.prune_below = self.settings.get("pruneBelow",0)
+        self.prune_gain = self.settings.get("pruneGain",1.0)
+        if self.rule not in RegretManager.UPDATE_RULES:
+            raise ValueError("Unknown regret update {} (use {})".format(self.rule, ", ".join(RegretManager.UPDATE_RULES)))
+
+        # dcfr and pruning keep iterations in the stats of each infoset, so the stats get a value for each
+        if self.stats_width() > RegretManager.STAT_LOC_WRITES + 1 and self.stats_every == 0:
+            raise ValueError("The dcfr regret update and regret-based pruning keep iterations in the stats of each infoset (infosetStats can't be 0)")
+        if self.symmtree_shape[RegretManager.STAT_PATH][0] < self.stats_width():
+            self.symmtree_shape = [list(level) for level in self.symmtree_shape]
+            self.symmtree_shape[RegretManager.STAT_PATH][0] = self.stats_width()
+
     #create regrets on disk
     def create(self, filename = None):
 
+        #new regrets always have every level
+        self.profile = "full"
+
         #create a new symmetric tree on disk if file provided
         if filename != None:
-            self.symm_tree = SymmetricTree(shape=self.symmtree_shape,filename="{}/regrets".format(filename), ondisk=True)
+            self.symm_tree = self.store_class()(shape=self.symmtree_shape,filename="{}/regrets".format(filename), ondisk=True, **self.tree_options())
             self.on_disk = True
             self.shared_memory = False
             self.shared_space = filename
         else:
-            self.symm_tree = SymmetricTree(shape=self.symmtree_shape,namespace=self.namespace)
+            self.symm_tree = self.store_class()(shape=self.symmtree_shape,namespace=self.namespace, **self.tree_options())
             self.on_disk = False
             self.shared_memory = True
             self.shared_space = self.namesapce
 
     #open regrets on disk
-    def open(self, filename):
+    #read-only regrets map their files read-only, so every process evaluating them shares the same clean pages
+    #profile -> the load profile (see PROFILES), or None to keep ours
+    def open(self, filename, readonly=False, profile=None):
+        if profile != None: self.profile = profile
 
         #create a new symmetric tree on disk
-        self.symm_tree = SymmetricTree(filename="{}/regrets".format(filename), ondisk=True)
+        self.symm_tree = self.store_class()(filename="{}/regrets".format(filename), ondisk=True, readonly=readonly, **self.tree_options())
         self.shared_space = filename
 
         #we are on disk
@@ -488,11 +687,90 @@ class RegretManager():
         #save our symmetric tree
         self.symm_tree.save(filename="{}/regrets".format(filename), verbose=verbose)
 
-    #attach regrets to memory
-    def attach(self):
+    #checkpoint regrets to a file (only writing what changed since the last save or checkpoint)
+    def checkpoint(self, filename):
+        self.symm_tree.checkpoint(filename="{}/regrets".format(filename))
+
+    #fold the checkpoints of a saved regret file back into the full save
+    def consolidate(self, filename):
+        self.symm_tree.consolidate(filename="{}/regrets".format(filename))
+
+    #a frozen, point-in-time copy of our regrets (local to this process) that can be evaluated while training
+    #keeps writing to the live regrets -> returns a regret manager using the copy
+    def snapshot(self):
+        snapshot = copy.copy(self)
+        snapshot.symm_tree = self.symm_tree.snapshot()
+        return snapshot
+
+    #compact regrets into a smaller save at filename, dropping every infoset (and the paths leading only to it)
+    #that has been read fewer than min_reads times -> returns (blocks before, blocks after) for each level of the tree
+    def compact(self, filename, min_reads):
+
+        #sharded regrets compact each shard on its own
+        tree = self.symm_tree
+        if isinstance(tree, ShardedTree): return tree.compact("{}/regrets".format(filename), [{RegretManager.INFOSET_PATH: self.rarely_read(shard, min_reads)} for shard in tree.shards()])
+
+        #drop the infosets read too few times
+        return tree.compact("{}/regrets".format(filename), {RegretManager.INFOSET_PATH: self.rarely_read(tree, min_reads)})
+
+    #a mask of the infosets (in the order of the infoset level) of a tree or hash store read fewer than min_reads times
+    #without infoset stats, the reads are estimated from the strategy sums (each read adds its reach probability)
+    def rarely_read(self, tree, min_reads):
+
+        #a hash store keeps the stats (and strategy sums) of each infoset in the same row as the infoset
+        if isinstance(tree, HashStore) and self.stats_every == 0: reads = np.rint(tree.level_view(RegretManager.STRAT_PATH).sum(axis=1))
+        elif isinstance(tree, HashStore): reads = tree.level_view(RegretManager.STAT_PATH)[:,RegretManager.STAT_LOC_READS]
+
+        elif self.stats_every == 0:
+
+            #get the strategy block of every infoset in use, and add up its strategy sums
+            strategies = tree.level_view(RegretManager.INFOSET_PATH)[:,RegretManager.STRAT_LOC].astype(np.int64)
+            reads = np.zeros(len(strategies))
+            reads[strategies > 0] = np.rint(tree.level_view(RegretManager.STRAT_PATH)[strategies[strategies > 0] - 1].sum(axis=1))
+
+        else:
+
+            #get the stat block of every infoset in use
+            stats = tree.level_view(RegretManager.INFOSET_PATH)[:,RegretManager.STAT_LOC].astype(np.int64)
+
+            #read the reads of every infoset (infosets without stats have never been read)
+            reads = np.zeros(len(stats))
+            reads[stats > 0] = tree.level_view(RegretManager.STAT_PATH)[stats[stats > 0] - 1, RegretManager.STAT_LOC_READS]
+
+        #return the infosets read too few times
+        return reads < min_reads
+
+    #export a frozen policy for playing to filename -> only the infosets that were reached, with one normalized average
+    #strategy row each (optionally quantized to a narrower float like float16), and no regrets or stats
+    #the export is a regret path like any other (our settings are copied with it), so open it read-only to play from it
+    #returns how many infosets were exported
+    def export(self, filename, dtype = "float32"):
+
+        #compact into the export, then freeze the strategy sums into the policy
+        os.makedirs(filename, exist_ok = True)
+        self.compact(filename, 1)
+        infosets = self.symm_tree.freeze("{}/regrets".format(filename), RegretManager.STRAT_PATH, [RegretManager.REGRET_PATH, RegretManager.STAT_PATH], np.dtype(dtype))
+
+        #copy our settings with it
+        settings = "{}/settings.json".format(self.filename)
+        if os.path.exists(settings) and not os.path.exists("{}/settings.json".format(filename)): shutil.copy(settings, filename)
+        return infosets
+
+    #merge the regrets saved at filename (trained separately with the same shape) into ours
+    #infosets are matched by their path, and their regrets, strategy sums and stats are summed
+    #the saved regrets are opened read-only on disk, so they are never loaded into memory
+    #returns how many blocks of each level were summed
+    def merge(self, filename):
+        other = self.store_class()(filename="{}/regrets".format(filename), ondisk=True, readonly=True, **dict(self.tree_options(), skip=[]))
+        try: return self.symm_tree.merge(other, [RegretManager.REGRET_PATH, RegretManager.STRAT_PATH, RegretManager.STAT_PATH])
+        finally: other.unload()
+
+    #attach regrets to memory (optionally read-only, and with a load profile)
+    def attach(self, readonly=False, profile=None):
+        if profile != None: self.profile = profile
 
         #create a new symmetric tree
-        self.symm_tree = SymmetricTree(namespace=self.namespace)
+        self.symm_tree = self.store_class()(namespace=self.namespace, readonly=readonly, **self.tree_options())
 
         #we are lodaed to shared memory
         self.shared_memory = True
@@ -502,11 +780,12 @@ class RegretManager():
         #update settings dictionary as well (to match what we just forced, in case those tsettings are used elsewhere)
         self.settings["ondisk"] = False
 
-    # load all regrets at once from disk
-    def load(self, filename):
+    # load all regrets at once from disk (or only the levels of a load profile)
+    def load(self, filename, profile=None):
+        if profile != None: self.profile = profile
 
         # create a new symmetric tree
-        self.symm_tree = SymmetricTree(shape=self.symmtree_shape, namespace=self.namespace)
+        self.symm_tree = self.store_class()(shape=self.symmtree_shape, namespace=self.namespace, **self.tree_options())
 
         # we are lodaed to shared memory
         self.shared_memory = True
@@ -520,7 +799,10 @@ class RegretManager():
         self.symm_tree.load(filename="{}/regrets".format(filename), verbose=True)
 
     #initialize regretman -> will load/open/attach as appropriate
-    def initialize(self, reopen=False):
+    #readonly -> open or attach read-only (for playing and evaluating regrets without changing them)
+    #profile -> the load profile (see PROFILES), or None to keep ours
+    def initialize(self, reopen=False, readonly=False, profile=None):
+        if profile != None: self.profile = profile
 
         #if we are initialized, or reopening
         if not self.initialized() or reopen:
@@ -529,14 +811,59 @@ class RegretManager():
             if self.on_disk: 
                 
                 #open on disk
-                self.open(self.filename)
+                self.open(self.filename, readonly)
 
             else:
 
                 #try to attach to the namespace, otherwise load
                 try:
                     print("attaching to namespace {}".format(self.namespace))
-                    self.attach()
+                    self.attach(readonly)
                 except:
                     print("loading namespace {}".format(self.namespace))
-                    self.load(self.filename)
\ No newline at end of file
+                    self.load(self.filename)
+
+                    #we had to load the regrets ourselves, but we still only read them
+                    self.symm_tree.readonly = readonly
+
+    #a random infoset path that follows our shape (each level leads to the level its children are declared in, or the next level)
+    def random_path(self, rng):
+        path = []
+        level = 0
+        while level != RegretManager.INFOSET_PATH:
+            definition = self.symmtree_shape[level]
+            slot = rng.randrange(definition[0])
+            path.append((slot, level))
+            if len(definition) > 3 and definition[3] != None: level = definition[3][slot] if isinstance(definition[3], list) else definition[3]
+            else: level += 1
+        return path
+
+    #time the symmetric tree against the hash store on count random infoset paths of our shape
+    #each store is created locally, then every infoset is created once and found again
+    #returns {store: (seconds to create, seconds to find, infosets)}
+    def benchmark(self, count, seed = 1):
+
+        #the same paths for both stores (paths can repeat, which is fine since both see the same ones)
+        rng = random.Random(seed)
+        paths = [self.random_path(rng) for _ in range(count)]
+
+        #time each store
+        results = {}
+        for store in ("tree", "hash"):
+            options = dict(self.tree_options(store), skip = [])
+            if store == "tree": options["sparse"] = True
+            regrets = self.store_class(store)(shape=self.symmtree_shape, **options)
+
+            #create every infoset, then find them all again
+            start = time.perf_counter()
+            for path in paths: InformationSet(path, regrets, self, True)
+            created = time.perf_counter() - start
+            start = time.perf_counter()
+            for path in paths: InformationSet(path, regrets, self, False)
+            found = time.perf_counter() - start
+
+            #save the results
+            results[store] = (created, found, regrets.levelinfo(RegretManager.INFOSET_PATH)[3])
+
+        #return our timings
+        return results
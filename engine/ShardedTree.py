@@ -0,0 +1,223 @@
+import numpy as np
+from engine.SymmetricTree import SymmetricTree
+
+#a sharded tree splits the regrets across several stores (symmetric trees or hash stores) with the same shape
+#every path is routed to a shard by its first tuples (like the seat in kuhn, or lastround / step in commodity)
+#so each shard holds every infoset below the prefixes routed to it and can be saved, loaded and compacted on its own
+#
+#each shard lives in its own namespace ({namespace}_shard{n}) or its own files ({filename}.shard{n}) so shards
+#can later live on different hosts.  when attaching or opening, a shard is only mapped the first time a path reaches it
+#so a process only maps the shards it actually uses
+class ShardedTree:
+
+    #initialize the sharded tree (the same ways a symmetric tree is initialized)
+    #shards -> how many shards, shard_depth -> how many tuples at the start of a path decide its shard
+    #store -> the class of every shard, options -> passed to every shard
+    def __init__(self, shape = None, namespace = None, filename = None, ondisk = False, readonly = False, shards = 2, shard_depth = 1, store = SymmetricTree, **options):
+
+        #our shards (None until they are mapped) and how to make them
+        self.stores = [None] * shards
+        self.shard_depth = shard_depth
+        self.store = store
+        self.options = options
+        self.namespace = namespace
+        self.filename = None
+        self.ondisk = ondisk
+        self.readonly = readonly
+        self._attach = None
+
+        #the levels every shard skips (see the skip of the shard store)
+        self.skip = set(options.get("skip", ()))
+
+        #load from file, attach to a namespace, open on disk or create (the same as a symmetric tree)
+        if filename != None and ondisk == False: self.load(filename, namespace)
+        elif shape is None and namespace != None: self._load_from_namespace(namespace)
+        elif shape is None and ondisk == True: self.open(filename)
+        elif shape is not None: self.create(shape, namespace, filename if ondisk else None)
+
+    #the namespace and file name of a shard
+    def _shard_namespace(self, namespace, shard):
+        return "{}_shard{}".format(namespace, shard) if namespace != None else None
+
+    def _shard_filename(self, filename, shard):
+        return "{}.shard{}".format(filename, shard) if filename != None else None
+
+    #get a shard, mapping it the first time it is used
+    def shard(self, shard):
+        if self.stores[shard] == None: self.stores[shard] = self._attach(shard)
+        return self.stores[shard]
+
+    #every shard (mapping any we haven't used yet)
+    def shards(self):
+        return [self.shard(s) for s in range(len(self.stores))]
+
+    #the shard a path is routed to -> None if the path is too short to route
+    def route(self, path):
+        if len(path) < self.shard_depth: return None
+        key = 0
+        for (slot, _) in path[:self.shard_depth]: key = key * 31 + int(slot)
+        return key % len(self.stores)
+
+    #create every shard
+    def create(self, shape, namespace = None, filename = None):
+        self.namespace = namespace
+        self.filename = filename
+        self.stores = [self.store(shape=shape, namespace=self._shard_namespace(namespace, s), filename=self._shard_filename(filename, s),
+                                  ondisk=filename != None, **self.options) for s in range(len(self.stores))]
+
+    #attach to the shards in a namespace (as they are used)
+    def _load_from_namespace(self, namespace):
+        self.namespace = namespace
+        self.stores = [None] * len(self.stores)
+        self._attach = lambda s: self.store(namespace=self._shard_namespace(namespace, s), readonly=self.readonly, **self.options)
+
+        #map the first shard now, so we fail (like a tree) when the namespace doesn't exist
+        self.shard(0)
+
+    #open the shards on disk (as they are used)
+    def open(self, filename, verbose = False, readonly = None):
+        if readonly != None: self.readonly = readonly
+        self.filename = filename
+        self.stores = [None] * len(self.stores)
+        self._attach = lambda s: self.store(filename=self._shard_filename(filename, s), ondisk=True, readonly=self.readonly, **self.options)
+        self.shard(0)
+
+    #load every shard (optionally into a namespace)
+    def load(self, filename = None, namespace = None, verbose = False):
+        if filename == None: return self._load_from_namespace(namespace)
+        if namespace != None: self.namespace = namespace
+        for s in range(len(self.stores)):
+            if self.stores[s] != None: self.stores[s].load(self._shard_filename(filename, s), verbose=verbose)
+            else: self.stores[s] = self.store(filename=self._shard_filename(filename, s), namespace=self._shard_namespace(self.namespace, s), **self.options)
+
+    #save, checkpoint and consolidate every shard to its own files
+    def save(self, filename, verbose = False):
+        for s in range(len(self.stores)): self.shard(s).save(self._shard_filename(filename, s), verbose=verbose)
+
+    def checkpoint(self, filename):
+        for s in range(len(self.stores)): self.shard(s).checkpoint(self._shard_filename(filename, s))
+
+    def consolidate(self, filename):
+        for s in range(len(self.stores)): self.shard(s).consolidate(self._shard_filename(filename, s))
+
+    #write every change of shards opened on disk back to their files
+    def flush(self):
+        for store in self.stores:
+            if store != None: store.flush()
+
+    #count the blocks we handed out in every shard we attached to
+    def publish(self):
+        for store in self.stores:
+            if store != None: store.publish()
+
+    #compact every shard into its own files -> drops has the drop masks of each shard (see the compact of the shard store)
+    #returns (blocks before, blocks after) for each level summed over the shards
+    def compact(self, filename, drops):
+        levels = [self.shard(s).compact(self._shard_filename(filename, s), drops[s]) for s in range(len(self.stores))]
+        return [tuple(int(sum(v)) for v in zip(*level)) for level in zip(*levels)]
+
+    #freeze every saved shard for playing (see the freeze of the shard store) -> returns how many rows were frozen
+    def freeze(self, filename, level, drop = [], dtype = np.float32):
+        return sum(self.shard(s).freeze(self._shard_filename(filename, s), level, drop, dtype) for s in range(len(self.stores)))
+
+    #merge another sharded tree (sharded the same way) into this one shard by shard
+    def merge(self, other, leaves = None):
+        if not isinstance(other, ShardedTree) or len(other.stores) != len(self.stores) or other.shard_depth != self.shard_depth:
+            raise ValueError("Cannot merge trees that are not sharded the same way")
+        merged = [self.shard(s).merge(other.shard(s), leaves) for s in range(len(self.stores))]
+        return [int(sum(level)) for level in zip(*merged)]
+
+    #a frozen, local copy of every shard
+    def snapshot(self):
+        snap = ShardedTree(shards = len(self.stores), shard_depth = self.shard_depth, store = self.store, readonly = True, **self.options)
+        snap.stores = [store.snapshot() for store in self.shards()]
+        return snap
+
+    #release every shard we have mapped
+    def unload(self):
+        for store in self.stores:
+            if store != None: store.unload()
+        self.stores = [None] * len(self.stores)
+        self.namespace = None
+        self._attach = None
+
+    #re-attach any shard levels grown by other processes
+    def refresh(self):
+        for store in self.stores:
+            if store != None: store.refresh()
+
+    #every shard has the same shape
+    def shape(self):
+        return self.shard(0).shape()
+
+    #level information (shape, type, total, used) summed over the shards
+    def levelinfo(self, level):
+        info = [store.levelinfo(level) for store in self.shards()]
+        return (info[0][0], info[0][1], sum(int(i[2]) for i in info), sum(int(i[3]) for i in info))
+
+    #detailed information about the sizes of each level summed over the shards
+    def size(self):
+        sizes = [store.size() for store in self.shards()]
+        return [dict(level[0], **{key: sum(l[key] for l in level) for key in ("total","used","available")}) for level in zip(*sizes)]
+
+    #how many entries of each slot of a level are set (and in total) summed over the shards
+    def leveldensity(self, level):
+        return [sum(d) for d in zip(*[store.leveldensity(level) for store in self.shards()])]
+
+    #the used blocks of a level in every shard one after another (a copy, not a view, since the shards are separate)
+    def level_view(self, level):
+        return np.concatenate([store.level_view(level) for store in self.shards()])
+
+    #fill the used part of a level in every shard
+    def fill_level(self, level, value):
+        for store in self.shards(): store.fill_level(level, value)
+
+    #path cache statistics summed over the shards we have mapped
+    def cache_stats(self):
+        stats = [store.cache_stats() for store in self.stores if store != None]
+        return tuple(sum(s) for s in zip(*stats)) if len(stats) > 0 else (0, 0, 0)
+
+    #get a path from the shard it is routed to
+    #paths too short to route are read from the first shard that has them
+    def get(self, path, default=None, items=1, set_default = False, include_type = False):
+        shard = self.route(path)
+        if shard != None: return self.shard(shard).get(path, default, items, set_default, include_type)
+        for store in self.shards():
+            found = store.get(path, None, items, False, include_type)
+            if (found[0] if include_type else found) is not None: return found
+        return (default, 0) if include_type else default
+
+    #resolve the leaf blocks of a block in the shard its path is routed to
+    def resolve_leaves(self, path, level, leaves, create = False):
+        shard = self.route(path)
+        if shard == None: raise ValueError("Path {} is too short to route to a shard".format(path))
+        return self.shard(shard).resolve_leaves(path, level, leaves, create)
+
+    #set a path in the shard it is routed to
+    def set(self, path, value = None, mathop = None):
+        shard = self.route(path)
+        if shard == None: raise ValueError("Path {} is too short to route to a shard".format(path))
+        return self.shard(shard).set(path, value, mathop)
+
+    #the children of a node -> below the routing depth every shard holds some of them, so each slot is listed once
+    #(blocks are blocks of the shard holding the node)
+    def children(self, path = []):
+        shard = self.route(path)
+        if shard != None: return self.shard(shard).children(path)
+        seen = {}
+        for store in self.shards():
+            for child in store.children(path): seen.setdefault(child[0], child)
+        return [seen[slot] for slot in sorted(seen)]
+
+    #walk the nodes below a path -> above the routing depth we walk the children of every shard ourselves
+    #and below it the shard holding the node walks the rest
+    def walk(self, path = [], depth = None):
+        shard = self.route(path)
+        if shard != None:
+            yield from self.shard(shard).walk(path, depth)
+            return
+        if depth != None and depth <= 0: return
+        for (slot, level, block, _, _, child_level) in self.children(path):
+            child = list(path) + [(slot, level)]
+            yield (child, child_level, block)
+            yield from self.walk(child, None if depth == None else depth - 1)
@@ -1,5 +1,12 @@
+import io
+import os
+import glob
 import numpy as np
 from multiprocessing import shared_memory as mem
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from engine.NodeAllocator import NodeAllocator
+import engine.Kernels as kernels
 import pickle
 import console
 
@@ -25,26 +32,106 @@ class SymmetricTree:
     #shape can only be 1000 items long
     MAX_SHAPE_ARRAY_SIZE = 1000
 
-    NP_DATUM_SIZE = 4 #32 bit unsigned integer
+    #the end of the shape array holds the number of levels, the tree generation (bumped every time a level grows)
+    #and then the generation of each level counting backwards from the end
+    #followed by the blocks reserved from each level by the node allocators of every process (see NodeAllocator)
+    LOC_LEVELS = -1
+    LOC_GENERATION = -2
+    LOC_LEVEL_GENERATION = -3
 
-    #max individual array size is limited only by size of NP_DATUM_SIZE
+    #the shape array is 64 bit so level sizes are not limited to 32 bits
+    #(trees saved or shared before this used a 32 bit unsigned shape, which we still read)
+    SHAPE_DTYPE = np.int64
+
+    #max individual array size (for trees with 32 bit index levels)
     #MAX_INDIVIDUAL_ARRAY_SIZE = 256**4 - 2 #1024 * 1024 * 1000 // 4 - 2
     MAX_INDIVIDUAL_ARRAY_SIZE = 1024 * 1024 * 1000 - 2
 
+    #trees with 64 bit index levels can grow their levels much larger
+    MAX_WIDE_ARRAY_SIZE = 2**40
+
+    #levels in a shared memory namespace reserve room for this many times their planned size up front (or their max size if smaller)
+    #-> the size declared in the shape when created, or the size saved when loaded.  only the pages a level actually uses take memory
+    #and growing a level just extends the part of its reservation in use, so the memory other processes (and views like infoset
+    #regret references) are writing to never moves.  a level can't grow past its reservation
+    SHARED_RESERVE = 4
+
+    #the type of each level (stored in the shape) -> type: (name, numpy dtype)
+    #index levels hold child pointers (and a type array of the level each pointer lands in), the rest hold values
+    #types 0 and 1 are the original 32 bit index and float levels
+    TYPE_INDEX = 0
+    TYPE_FLOAT = 1
+    LEVEL_TYPES = {
+        0: ("uint32", np.uint32),
+        1: ("float32", np.float32),
+        2: ("uint16", np.uint16),
+        3: ("uint64", np.uint64),
+        4: ("float16", np.float16),
+        5: ("float64", np.float64),
+        6: ("int32", np.int32),
+        7: ("int64", np.int64)
+    }
+    INDEX_TYPES = (0, 2, 3)
+
+    #an index level whose child levels are derived from the shape (flagged in its type)
+    #keeps one child level per slot position in the child map of the shape array, instead of a type array the size of the level
+    TYPE_DERIVED = 256
+    LOC_CHILD_MAP = 500
+
+    #sparse trees start every level at this many blocks (or its declared size if smaller) and grow as blocks are used
+    SPARSE_INITIAL_BLOCKS = 1024
+
+    #loading reads level files straight into the tree in chunks of this many bytes, this many levels at a time
+    LOAD_CHUNK_SIZE = 64 * 1024 * 1024
+    LOAD_THREADS = 4
+
+    #changes to each level are tracked in regions of this many entries, so checkpoints only write the regions that changed
+    DIRTY_REGION_SIZE = 4096
+
+    #walking a subtree by frontier reads at most this many blocks of a level at once
+    FRONTIER_CHUNK = 65536
+
     #initialize the tree
-    def __init__( self, shape = None, namespace = None, filename = None, ondisk = False):
+    def __init__( self, shape = None, namespace = None, filename = None, ondisk = False, cache_size = 0, alloc_chunk = NodeAllocator.DEFAULT_CHUNK, sparse = False, readonly = False, skip = (), reserve = SHARED_RESERVE):
 
         #references to our internal numpy arrays
-        self._arrays = []
-        self._types = []
-        self._managers = []
-        self._type_managers = []
+        self._clear_levels()
+        self._generation = 0
         self._shape = None
         self._shape_shm = None
         self.creator = False
         self.namespace = None
         self.ondisk = ondisk
 
+        #sparse trees treat the declared size of each level as a capacity, not an allocation
+        #storage is only committed for the blocks in use (plus geometric growth room)
+        self.sparse = sparse
+        self.filename = None
+
+        #how many times its planned size each level reserves in a namespace, and the planned size of each level we created
+        self.reserve = reserve
+        self._planned = []
+
+        #the save our dirty maps track changes from (the one we loaded, opened or last saved)
+        #checkpoints are deltas on top of it, so they can't be written against any other save
+        self.base = None
+
+        #read-only trees map every array read-only (on disk the pages stay clean, so every reader shares the page cache)
+        #and never allocate nodes, so reading a path that doesn't exist just returns the default
+        self.readonly = readonly
+
+        #levels we skip when loading, opening or attaching (like the regrets and stats when only playing)
+        #skipped levels are left empty (or not mapped at all), so paths into them are never found and can't be set
+        #and a tree missing levels can't be saved over a full one
+        self.skip = set(skip)
+
+        #our node allocator is created the first time we allocate (once we know if we are shared)
+        self._allocator = None
+        self._alloc_chunk = alloc_chunk
+
+        #optional LRU cache of resolved paths (see enable_cache)
+        self.enable_cache(cache_size)
+
         #load from file if a file is provided
         #obviously if we are loading from a file
         #we are not creating new, and we are not attaching to a namespace
@@ -77,25 +164,163 @@ class SymmetricTree:
     def shape(self):
         return self._shape
 
+    #get the type of a level from its type or its name (like "uint16" or "float64")
+    @staticmethod
+    def level_type(type):
+
+        #already a type
+        if not isinstance(type, str): return int(type)
+
+        #look up the type by name
+        for code in SymmetricTree.LEVEL_TYPES:
+            if SymmetricTree.LEVEL_TYPES[code][0] == type.lower(): return code
+        raise ValueError("Unknown symmetric tree level type {}".format(type))
+
+    #does a level type hold child pointers (an index level) or values
+    @staticmethod
+    def is_index(type):
+        return int(type) % SymmetricTree.TYPE_DERIVED in SymmetricTree.INDEX_TYPES
+
+    #does a level type derive its child levels from the shape (instead of storing them per slot)
+    @staticmethod
+    def is_derived(type):
+        return int(type) >= SymmetricTree.TYPE_DERIVED
+
+    #does a level type keep a type array (the level of every child pointer) beside it
+    @staticmethod
+    def has_types(type):
+        return SymmetricTree.is_index(type) and not SymmetricTree.is_derived(type)
+
+    #the numpy dtype of a level type
+    @staticmethod
+    def level_dtype(type):
+        return SymmetricTree.LEVEL_TYPES[int(type) % SymmetricTree.TYPE_DERIVED][1]
+
+    #the child map of a derived level -> a view of the shape array with the child level of each slot position
+    def _child_map(self, level):
+
+        #derived levels keep their child maps one after another in level order
+        offset = SymmetricTree.LOC_CHILD_MAP
+        for l in range(level):
+            if SymmetricTree.is_derived(self._shape[l * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_TYPE]):
+                offset += int(self._shape[l * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_SHAPE])
+
+        #return a view of this level's part of the map
+        return self._shape[offset:offset + int(self._shape[level * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_SHAPE])]
+
+    #enable (or disable with a size of zero) the resolved path cache
+    #nodes are append-only, so once a path prefix resolves to a block it resolves to that block forever
+    #this lets us remember the block each path prefix points to and skip walking the tree from the root
+    def enable_cache(self, size):
+
+        #save the size and reset the cache and its counters
+        self.cache_size = size
+        self._cache = OrderedDict() if size > 0 else None
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    #clear the resolved path cache (when the blocks in our arrays are replaced)
+    def clear_cache(self):
+        if self._cache != None: self._cache.clear()
+
+    #return our node allocator, creating it if needed
+    #trees in a namespace or on disk can be attached by many processes, so their allocations are locked
+    def allocator(self):
+
+        #we can't add nodes to a read-only tree
+        if self.readonly: raise ValueError("Cannot allocate nodes in a read-only symmetric tree")
+
+        #create the allocator the first time it is needed
+        #(every process attached to a namespace agrees on its name, but a file may be opened from any working directory)
+        if self._allocator == None:
+            name = self.namespace if self.namespace != None else os.path.abspath(self.filename) if self.filename != None else None
+            self._allocator = NodeAllocator(self, name, self._alloc_chunk)
+
+        #return that allocator
+        return self._allocator
+
+    #release our node allocator (any blocks it reserved but did not hand out remain empty)
+    def _release_allocator(self):
+        if self._allocator != None: self._allocator.close()
+        self._allocator = None
+
+    #count the blocks we handed out in the used counts of their levels
+    #each process hands out blocks from its own chunks, and only counts them when it takes the allocation lock
+    #so a process that allocated should publish before another process reads the used counts (like at the end of an epoch)
+    def publish(self):
+        if self._allocator != None: self._allocator.publish()
+
+    #the blocks reserved from a level by every chunk so far (zero for a tree that has not reserved any)
+    def _reserved_blocks(self, sx):
+        return int(self._shape[SymmetricTree.LOC_LEVEL_GENERATION - int(self._shape[-1]) - sx])
+
+    #set the blocks reserved from a level (must be called while holding the allocator lock)
+    def _set_reserved_blocks(self, sx, blocks):
+        self._shape[SymmetricTree.LOC_LEVEL_GENERATION - int(self._shape[-1]) - sx] = blocks
+
+    #forget every reserved block (a tree we just created or loaded has no chunks handed to any process)
+    def _clear_reserved_blocks(self):
+        levels = int(self._shape[-1])
+        self._shape[SymmetricTree.MAX_SHAPE_ARRAY_SIZE + SymmetricTree.LOC_LEVEL_GENERATION - 2 * levels + 1:SymmetricTree.MAX_SHAPE_ARRAY_SIZE + SymmetricTree.LOC_LEVEL_GENERATION - levels + 1] = 0
+
+    #return cache statistics -> (hits, misses, entries)
+    def cache_stats(self):
+        return (self.cache_hits, self.cache_misses, len(self._cache) if self._cache != None else 0)
+
+    #look up the block a path prefix points to in the cache -> returns (index, index_shape) or None
+    def _cache_lookup(self, key):
+
+        #get the cached block (if any)
+        block = self._cache.get(key)
+
+        #track hits and misses, and keep hits at the recent end of our LRU
+        if block == None:
+            self.cache_misses += 1
+        else:
+            self.cache_hits += 1
+            self._cache.move_to_end(key)
+
+        #return that block
+        return block
+
+    #save the block a path prefix points to in the cache, dropping the least recently used prefix if full
+    def _cache_store(self, key, index, index_shape):
+        self._cache[key] = (int(index), int(index_shape))
+        if len(self._cache) > self.cache_size: self._cache.popitem(last=False)
+
     #unlink - release global shared memory
     def unload(self):
 
+        #count the blocks we handed out before we let go of the tree
+        if self._shape is not None and not self.readonly: self.publish()
+
+        #if another process grew any of our levels, make sure we release the current ones
+        if self._shape_shm != None: self.refresh()
+
+        #run through all managers (data and type arrays) and close them
+        #the creator also unlinks them
+        for shm in self._managers + self._type_managers + self._dirty_managers:
+            if shm != None: self._close_manager(shm, unlink = self.creator)
+
+        #and the managers of levels we have since grown (already unlinked)
+        for shm in self._retired_managers: self._close_manager(shm)
+
         #unlink and close the shape array
         #if it is defined
         if self._shape_shm != None:
-            if self.creator: self._shape_shm.unlink()
-            self._shape_shm.close()
-
-        #run through all managers and close and pop them
-        while len(self._managers) > 0:
-            shm = self._managers.pop()
-            if self.creator: shm.unlink()
-            shm.close()
+            self._shape = None
+            self._close_manager(self._shape_shm, unlink = self.creator)
+            self._shape_shm = None
 
         #we no longer have managers, a namespace etc
+        self._clear_levels()
         self.namespace = None
         self.creator = False
 
+        #any cached paths pointed into those arrays
+        self.clear_cache()
+        self._release_allocator()
+
     #get level information from shape array
     def levelinfo(self, level):
         """levelinfo Function
@@ -124,6 +349,83 @@ class SymmetricTree:
         available = total - used
         return (total,used,available)
 
+    #fill the used portion of a level with a value (like resetting every strategy at once)
+    def fill_level(self, level, value):
+
+        #make sure we fill the current generation of the level
+        self.refresh()
+
+        #get level info and fill only the blocks in use
+        (shape,_,_,used) = self.levelinfo(level)
+        self._arrays[level][:int(shape) * int(used)] = value
+        self._mark_dirty(level, 0, int(shape) * int(used))
+
+    #the used blocks of a level as a 2d view (one row per block)
+    def level_view(self, level):
+
+        #make sure we look at the current generation of the level
+        self.refresh()
+        (shape,_,_,used) = self.levelinfo(level)
+        return self._arrays[level][:int(shape) * int(used)].reshape(-1, int(shape))
+
+    #a frozen, local copy of the tree as it is right now (other processes can keep writing to the live tree)
+    #only the used blocks of each level are copied, and since levels are copied one at a time while training goes on
+    #pointers to blocks allocated after their level was copied are dropped, so every path in the copy is complete
+    def snapshot(self):
+
+        #the copy starts with our shape and never allocates
+        self.publish()
+        self.refresh()
+        snap = SymmetricTree(readonly = True, skip = self.skip)
+        snap._shape = np.array(self._shape)
+        levels = int(self._shape[-1])
+
+        #copy the used blocks of every level (the root block is at the end of the first level)
+        for sx in range(levels):
+            self.refresh()
+            (width,dtype,_,used) = self.levelinfo(sx)
+            (width,used) = (int(width),int(used))
+            arr = self._arrays[sx]
+            count = min(used * width, len(arr))
+            tail = len(arr) - width if sx == 0 else len(arr)
+            array = np.concatenate((arr[:count], arr[tail:]))
+
+            #and the types of its children (derived levels read theirs from the copied shape)
+            if SymmetricTree.has_types(dtype): types = np.concatenate((self._types[sx][:count], self._types[sx][tail:]))
+            elif SymmetricTree.is_derived(dtype): types = snap._child_map(sx)
+            else: types = []
+
+            #the copy holds just what we copied
+            snap._shape[sx * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_TOTAL] = len(array)
+            snap._shape[sx * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_USED] = count // width
+            regions = -(-len(array) // SymmetricTree.DIRTY_REGION_SIZE)
+            snap._add_level(array, types, np.zeros((regions,), dtype=np.uint8), None, None, None)
+        snap._sync_generations()
+
+        #drop pointers past the blocks we copied of the level they point into
+        #(values stored directly in an index level, like counters, have no type since nothing points back to the root level, so they stay)
+        used = snap._shape[SymmetricTree.LOC_USED:levels * SymmetricTree.SHAPE_SIZE:SymmetricTree.SHAPE_SIZE]
+        for sx in range(levels):
+            (width,dtype,_,_) = snap.levelinfo(sx)
+            if not SymmetricTree.is_index(dtype): continue
+            arr = snap._arrays[sx]
+            children = np.asarray(snap._types[sx], dtype=np.int64)
+            if SymmetricTree.is_derived(dtype): children = np.tile(children, len(arr) // int(width))
+            arr[(arr > used[children]) & (children != 0)] = 0
+
+        #return the frozen copy
+        return snap
+
+    #mark a range of entries in a level as changed since our last save or checkpoint
+    def _mark_dirty(self, level, start, count = 1):
+
+        #read-only trees never change
+        if self.readonly: return
+
+        #the root block is addressed from index zero, so its entries have negative (wrapped) indexes
+        if start < 0: start += len(self._arrays[level])
+        self._dirty[level][start // SymmetricTree.DIRTY_REGION_SIZE:(start + count - 1) // SymmetricTree.DIRTY_REGION_SIZE + 1] = 1
+
     #return fill of individual level
     def leveldensity(self, level):
 
@@ -173,9 +475,25 @@ class SymmetricTree:
     #save to file
     def save(self, filename, verbose=False):
 
+        #a tree missing levels would save over them with nothing (and the used counts must cover what we handed out)
+        self._check_complete()
+        self.publish()
+
         #start a progress bar
         console.progress("Saving " + filename,0,len(self._arrays)+1)
 
+        #make sure we are saving the current generation of every level
+        if self._shape_shm != None: self.refresh()
+
+        #this is a new full snapshot, so later checkpoints only need what changes from here
+        #(we clear the dirty maps first so changes made while we save are picked up by the next checkpoint)
+        self._clear_dirty()
+        for (number, delta) in self._delta_files(filename): os.remove(delta)
+
+        #later checkpoints build on this save (a tree on disk stays on its own files, since other processes
+        #write to them too and our dirty maps only see our own changes)
+        if self.filename == None: self.base = filename
+
         #save shape array
         np.save(filename + ".shape",self._shape,False,False)
 
@@ -185,20 +503,11 @@ class SymmetricTree:
             #read level info
             (shape,dtype,total,entries) = self.levelinfo(ax)
 
-            #get array, size and length
-            a = self._arrays[ax]
+            #get array and length
+            #a numpy array view pointed back to original array for only the used portion of the array
+            #(for shared memory this re-uses the same underlying memory buffer as the original array)
             length = shape * entries
-            size = length * SymmetricTree.NP_DATUM_SIZE
-
-            #if we are using shared memory we can re-use the memory block
-            #if we are NOT using shared memory, we have to create a new array
-            if self.namespace != None:
-                #create a new smaller array using the same underlying memory buffer as original array
-                new_a = np.ndarray((length,), dtype=a.dtype, buffer=self._managers[ax].buf)
-
-            else:
-                #create a numpy array view pointed back to original array for only the used portion of the array
-                new_a = a[:length]
+            new_a = self._arrays[ax][:length]
 
             #progress bar
             console.progress("Saving " + filename,2+ax,len(self._arrays)+1)
@@ -207,18 +516,298 @@ class SymmetricTree:
             np.save("{}.{}".format(filename,ax),new_a,False,False)
 
             #now do all the same steps for the type array if this array can hold indexes
-            if dtype == 0 and self._type_managers[ax] != None:
-
-                #get our type array reference
-                t = self._types[ax]
+            #(levels that derive their child levels from the shape don't have one)
+            if SymmetricTree.has_types(dtype):
 
                 #get a smaller array view of only where we've stored data
-                if self.namespace != None: new_t = np.ndarray((length,), dtype=t.dtype, buffer=self._type_managers[ax].buf)
-                else: new_t = t[:length]
-
-                #save the type array to file
+                #and save the type array to file
+                new_t = self._types[ax][:length]
                 np.save("{}.{}t".format(filename,ax),new_t,False,False)
 
+    #save only the regions of each level that changed since the last save or checkpoint
+    #the changes are written as a numbered delta file next to the last full save (which must be at the same filename)
+    #and are replayed on top of that save when it is loaded (see consolidate to fold them back in)
+    def checkpoint(self, filename):
+        self._check_complete()
+        self.publish()
+
+        #a tree opened on disk is its own save, so writing its maps back is the checkpoint
+        #(its dirty maps only see our own changes, so a delta would replay stale values over what other processes wrote)
+        if self.filename != None and SymmetricTree._same_file(filename, self.filename): return self.flush()
+
+        #without a full save to build on, a checkpoint is just a full save
+        if not os.path.exists(filename + ".shape.npy"): return self.save(filename)
+
+        #a delta only holds what changed since our base, so replaying it on any other save would mix the two
+        if self.base == None or not SymmetricTree._same_file(filename, self.base):
+            raise ValueError("Can't checkpoint to {}, the tree was not loaded from (or saved to) it".format(filename))
+
+        #make sure we are checkpointing the current generation of every level
+        self.refresh()
+
+        #the number of this delta (one after the last one)
+        deltas = self._delta_files(filename)
+        number = deltas[-1][0] + 1 if len(deltas) > 0 else 1
+
+        #the shape goes with every delta, since it holds how much of each level is used
+        contents = {"shape": np.array(self._shape)}
+        changed = 0
+
+        #step through each level and gather its changed regions
+        for ax in range(len(self._arrays)):
+
+            #how many entries of this level are in use
+            (shape,dtype,total,used) = self.levelinfo(ax)
+            limit = int(shape) * int(used)
+
+            #find the changed regions (in use) and clear them first
+            #so any change made while we gather is picked up by the next checkpoint
+            regions = np.flatnonzero(self._dirty[ax][:-(-limit // SymmetricTree.DIRTY_REGION_SIZE)])
+            self._dirty[ax][regions] = 0
+            changed += len(regions)
+
+            #gather whole regions (the last region in use may run past what is used, so it is clipped)
+            index = np.minimum(regions[:,None] * SymmetricTree.DIRTY_REGION_SIZE + np.arange(SymmetricTree.DIRTY_REGION_SIZE), max(limit - 1, 0))
+            contents["{}r".format(ax)] = regions
+            contents["{}".format(ax)] = self._arrays[ax][index]
+            if SymmetricTree.has_types(dtype): contents["{}t".format(ax)] = self._types[ax][index]
+
+        #write the delta to a temporary file and move it into place, so a crash never leaves half a delta behind
+        np.savez("{}.delta.tmp.npz".format(filename), **contents)
+        os.replace("{}.delta.tmp.npz".format(filename), "{}.delta.{}.npz".format(filename, number))
+        console.writeline("Checkpoint {} of {}: {} changed regions".format(number, filename, changed))
+
+    #write every change of a tree opened on disk back to its files
+    def flush(self):
+        if self.readonly or self.filename == None: return
+        for array in [self._shape] + self._arrays + self._types:
+            if isinstance(array, np.memmap): array.flush()
+        self._clear_dirty()
+
+    #do two filenames name the same save
+    @staticmethod
+    def _same_file(a, b):
+        return os.path.abspath(a) == os.path.abspath(b)
+
+    #fold all the checkpoint deltas of a save back into its full save files
+    def consolidate(self, filename):
+
+        #step through each delta in order
+        deltas = self._delta_files(filename)
+        for (number, delta) in deltas:
+            with np.load(delta, allow_pickle = False) as d:
+
+                #apply the delta to every level file (and type file) of the save
+                shape = d["shape"]
+                for ax in range(shape[-1]):
+                    limit = int(shape[ax * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_SHAPE]) * int(shape[ax * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_USED])
+                    for suffix in ("", "t") if SymmetricTree.has_types(shape[ax * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_TYPE]) else ("",):
+
+                        #grow the file if the level has grown since the save
+                        name = "{}.{}{}.npy".format(filename, ax, suffix)
+                        (_, length, _) = self._read_array_header(name)
+                        if limit > length: self._grow_file(name, length, limit)
+
+                        #write the changed regions into the file
+                        array = np.load(name, mmap_mode = "r+", allow_pickle = False, fix_imports = False)
+                        self._apply_regions(array, d["{}r".format(ax)], d["{}{}".format(ax, suffix)], limit)
+                        array.flush()
+                        del array
+
+                #the save now has the shape of this delta
+                np.save(filename + ".shape", shape, False, False)
+
+        #the deltas are now part of the full save
+        for (number, delta) in deltas: os.remove(delta)
+        console.writeline("Consolidated {} checkpoints into {}".format(len(deltas), filename))
+
+    #list the checkpoint deltas of a save in order -> [(number, filename)]
+    def _delta_files(self, filename):
+        deltas = []
+        for delta in glob.glob(glob.escape(filename) + ".delta.*.npz"):
+            number = delta[len(filename) + len(".delta."):-len(".npz")]
+            if number.isdigit(): deltas.append((int(number), delta))
+        return sorted(deltas)
+
+    #write the regions of a checkpoint delta into an array, up to the limit (the entries in use) of the level
+    def _apply_regions(self, array, regions, values, limit):
+        index = regions[:,None] * SymmetricTree.DIRTY_REGION_SIZE + np.arange(SymmetricTree.DIRTY_REGION_SIZE)
+        mask = index < limit
+        array[index[mask]] = values[mask]
+
+    #clear the dirty maps of every level
+    def _clear_dirty(self):
+        if self.readonly: return
+        for dirty in self._dirty: dirty[:] = 0
+
+    #compact the tree into a smaller saved tree at filename (the tree itself is not changed)
+    #drop is a dictionary of level: boolean array with one entry per block in use, marking blocks to remove
+    #removing a block removes its whole subtree, and any block left with no children once its subtrees are removed
+    #is removed too.  the surviving blocks of each level are renumbered densely and written as a normal save
+    #returns a list of (blocks before, blocks after) for each level
+    def compact(self, filename, drop = {}):
+        self._check_complete()
+        self.publish()
+
+        #make sure we are compacting the current generation of every level
+        self.refresh()
+
+        #a 2d view of the blocks in use in every level (and their types for index levels)
+        levels = range(self._shape[-1])
+        info = [self.levelinfo(l) for l in levels]
+        blocks = [self._arrays[l][:int(info[l][0]) * int(info[l][3])].reshape(-1, int(info[l][0])) for l in levels]
+        types = [self._types[l][:int(info[l][0]) * int(info[l][3])].reshape(-1, int(info[l][0])) if SymmetricTree.has_types(info[l][1]) else None for l in levels]
+        for l in levels:
+            if SymmetricTree.is_derived(info[l][1]): types[l] = np.broadcast_to(self._types[l], blocks[l].shape)
+        index_levels = [l for l in levels if SymmetricTree.is_index(info[l][1])]
+
+        #the slots of index levels holding child pointers -> values stored directly in an index level (like counters)
+        #have no type, and nothing ever points back to the root level, so a zero type means the slot is a value
+        pointers = {l: (blocks[l] != 0) & (types[l] != 0) for l in index_levels}
+
+        #start with every block alive (except those we were asked to drop)
+        alive = [np.ones(len(blocks[l]), dtype=bool) for l in levels]
+        for l in drop: alive[l] &= ~np.asarray(drop[l], dtype=bool)[:len(alive[l])]
+
+        #blocks that had children to begin with (only these can be removed for running out of children)
+        parents = {l: pointers[l].any(axis=1) for l in index_levels}
+
+        #repeat until nothing else is removed, since removing a block can leave its parent with no children
+        #and removing a parent orphans everything beneath it
+        changed = True
+        while changed:
+
+            #which slots of each index level still point to a live block
+            live = {}
+            for l in index_levels:
+                live[l] = np.zeros(blocks[l].shape, dtype=bool)
+                for t in np.unique(types[l][pointers[l]]):
+                    slots = pointers[l] & (types[l] == t)
+                    live[l][slots] = alive[t][blocks[l][slots].astype(np.int64) - 1]
+
+            #find the blocks reachable from the root through live slots of reachable blocks
+            #(levels can point back into themselves, so keep walking until nothing new is reached)
+            reached = [np.zeros(len(blocks[l]), dtype=bool) for l in levels]
+            reached[0][0] = True
+            walking = True
+            while walking:
+                walking = False
+                for l in index_levels:
+                    slots = live[l] & reached[l][:,None]
+                    for t in np.unique(types[l][slots]):
+                        children = blocks[l][slots & (types[l] == t)].astype(np.int64) - 1
+                        if not reached[t][children].all():
+                            reached[t][children] = True
+                            walking = True
+
+            #a block survives if it is reachable, and it has not lost all of its children
+            survived = [alive[l] & reached[l] for l in levels]
+            for l in index_levels: survived[l] &= ~(parents[l] & ~live[l].any(axis=1))
+            survived[0][0] = True
+
+            #did anything change
+            changed = any((survived[l] != alive[l]).any() for l in levels)
+            alive = survived
+
+        #renumber the surviving blocks of every level densely (block numbers are 1 based, zero is no block)
+        renumber = [np.where(alive[l], np.cumsum(alive[l]), 0) for l in levels]
+
+        #build the compacted shape -> every level is exactly as large as what survived (at least 1 block)
+        shape = np.array(self._shape)
+        for l in levels:
+            shape[l * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_USED] = alive[l].sum()
+            shape[l * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_TOTAL] = max(1, alive[l].sum()) * int(info[l][0])
+        shape[SymmetricTree.MAX_SHAPE_ARRAY_SIZE + SymmetricTree.LOC_LEVEL_GENERATION - 2 * int(shape[-1]) + 1:SymmetricTree.MAX_SHAPE_ARRAY_SIZE + SymmetricTree.LOC_GENERATION + 1] = 0
+
+        #write every level to temporary files first, since the filename may be the files an on-disk tree is using
+        written = []
+        for l in levels:
+
+            #keep only the surviving blocks
+            data = blocks[l][alive[l]]
+
+            #remap child pointers of index levels to the renumbered blocks (pointers to removed blocks are cleared)
+            if SymmetricTree.is_index(info[l][1]):
+                t = types[l][alive[l]]
+                remapped = np.where(pointers[l][alive[l]], 0, data)
+                kept = live[l][alive[l]]
+                for target in np.unique(t[kept]):
+                    slots = kept & (t == target)
+                    remapped[slots] = renumber[target][data[slots].astype(np.int64) - 1]
+                np.save("{}.{}.compact".format(filename, l), remapped.ravel(), False, False)
+                written.append(("{}.{}.compact.npy".format(filename, l), "{}.{}.npy".format(filename, l)))
+
+                #levels that derive their child levels from the shape don't have a type array
+                if SymmetricTree.has_types(info[l][1]):
+                    np.save("{}.{}t.compact".format(filename, l), np.where(kept, t, 0).astype(t.dtype).ravel(), False, False)
+                    written.append(("{}.{}t.compact.npy".format(filename, l), "{}.{}t.npy".format(filename, l)))
+
+            else:
+                np.save("{}.{}.compact".format(filename, l), data.ravel(), False, False)
+                written.append(("{}.{}.compact.npy".format(filename, l), "{}.{}.npy".format(filename, l)))
+
+        #now move the compacted tree into place (replacing any checkpoints of an older save)
+        np.save(filename + ".shape.compact", shape, False, False)
+        written.append((filename + ".shape.compact.npy", filename + ".shape.npy"))
+        for (number, delta) in self._delta_files(filename): os.remove(delta)
+        for (temp, final) in written: os.replace(temp, final)
+
+        #the compacted save renumbers our blocks, so our changes no longer apply to it
+        if self.base != None and SymmetricTree._same_file(filename, self.base): self.base = None
+
+        #return how much each level was compacted
+        return [(len(alive[l]), int(alive[l].sum())) for l in levels]
+
+    #freeze a saved tree (at filename) for playing -> the blocks of a level (like the strategy sums) become normalized rows
+    #stored as dtype, and the dropped levels (with every pointer to them) are removed, so only what a player reads is left
+    #returns how many rows were frozen
+    def freeze(self, filename, level, drop = [], dtype = np.float32):
+
+        #open the saved tree and clear every pointer into the dropped levels (in place)
+        frozen = SymmetricTree(filename = filename, ondisk = True)
+        frozen._clear_pointers(drop)
+
+        #normalize the rows of the level (rows that sum to nothing are uniform)
+        rows = frozen.level_view(level).astype(np.float64)
+        policy = kernels.normalize_rows(rows).astype(dtype).ravel()
+
+        #the level takes the new type, and the dropped levels hold nothing
+        shape = np.array(frozen._shape)
+        shape[level * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_TYPE] = SymmetricTree.level_type(np.dtype(dtype).name)
+        for d in drop:
+            shape[d * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_TOTAL] = 0
+            shape[d * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_USED] = 0
+        types = {d: SymmetricTree.has_types(shape[d * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_TYPE]) for d in drop}
+        frozen.unload()
+        frozen = None
+
+        #write the new files beside the old ones and move them into place
+        written = [(policy, "{}.{}".format(filename, level)), (shape, "{}.shape".format(filename))]
+        for d in drop:
+            written.append((np.zeros((0,), dtype=SymmetricTree.level_dtype(shape[d * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_TYPE])), "{}.{}".format(filename, d)))
+            if types[d]: written.append((np.zeros((0,), dtype=np.uint8), "{}.{}t".format(filename, d)))
+        for (array, name) in written:
+            np.save(name + ".frozen", array, False, False)
+            os.replace(name + ".frozen.npy", name + ".npy")
+
+        #return how many rows we froze
+        return len(rows)
+
+    #clear every pointer into the given levels (so paths into them are simply not found)
+    def _clear_pointers(self, levels):
+        levels = list(levels)
+        for sx in range(int(self._shape[-1])):
+            (width,t,_,_) = self.levelinfo(sx)
+            if not SymmetricTree.is_index(t) or sx in levels: continue
+
+            #derived levels clear the slot positions that lead to the levels, others every entry typed with them
+            if SymmetricTree.is_derived(t): self._arrays[sx].reshape(-1, int(width))[:, np.isin(self._types[sx], levels)] = 0
+            else: self._arrays[sx][np.isin(self._types[sx], levels)] = 0
+
+    #raise if we skipped any levels (see skip)
+    def _check_complete(self):
+        if len(self.skip) > 0: raise ValueError("Levels {} were not loaded, so the tree can't be written".format(sorted(self.skip)))
+
     #load from a file into a namespace
     #or from a namespace into us locally 
     def load(self, filename = None, namespace = None, verbose = False):
@@ -229,33 +818,48 @@ class SymmetricTree:
 
     #open a file for RW operations - this is using
     #a memory mapped numpy array - bascically the same as shared virtual memory
-    def open(self, filename, verbose=False):
+    #readonly -> open the tree read-only (or None to keep the mode we were created with)
+    def open(self, filename, verbose=False, readonly=None):
+
+        #are we opening read-only
+        if readonly != None: self.readonly = readonly
+
+        #a newly opened tree has none of our cached paths or reserved blocks
+        self.clear_cache()
+        self._release_allocator()
+        self._clear_levels()
+        self.filename = filename
+        self.base = filename
+
+        #checkpoints made since the save aren't in its files, so fold them in before we map them
+        if not self.readonly and len(self._delta_files(filename)) > 0: self.consolidate(filename)
 
         #open the memory-mapped shape array
-        self._shape = np.load('{}.shape.npy'.format(filename),mmap_mode ='r+',allow_pickle = False,fix_imports = False)
+        self._shape = np.load('{}.shape.npy'.format(filename),mmap_mode = 'r' if self.readonly else 'r+',allow_pickle = False,fix_imports = False)
 
         #step through all sizess in the shape
         #and open their corresponding array on disk
         for sx in range(self._shape[-1]):
 
-            #get level info
-            (shape,dtype,length,used) = self.levelinfo(sx)
-
-            #open the array
-            self._arrays.append(np.load('{}.{}.npy'.format(filename,sx),mmap_mode ='r+',allow_pickle = False,fix_imports = False))
-
-            #for integer type levels, open the type array
-            #and for floats, add a blank type array (there is no path type stored at the float level)
-            if dtype == 0:
-                self._types.append(np.load('{}.{}t.npy'.format(filename,sx),mmap_mode ='r+',allow_pickle = False,fix_imports = False))
-            else:
-                self._types.append([])
+            #a file saved without room in its header for a longer shape would have to be moved to grow
+            #so move it now, before anything is writing to it (growing then always extends it in place)
+            if not self.readonly and sx not in self.skip:
+                for suffix in ("", "t") if SymmetricTree.has_types(self._shape[sx * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_TYPE]) else ("",):
+                    name = self._level_filename(sx, suffix)
+                    (header, offset, _) = SymmetricTree._file_header(name, self._max_length(sx))
+                    if len(header) != offset:
+                        length = self._read_array_header(name)[1]
+                        SymmetricTree._rewrite_file(name, length, length)
 
+            #open the array (and its type array for integer type levels)
+            self._add_level(*self._map_level(sx, create = False))
 
+        #remember which generation of each level we opened
+        self._sync_generations()
 
     #load from a file (optionally into a namespace)
-    #load from file -> sadly, right now this will take 2x memory because
-    #we don't have a way to load from file into a pre-allocated array
+    #each level file is read straight into the memory of its level (no intermediate copy)
+    #so loading only ever takes as much memory as the tree itself, and levels load concurrently
     def _load_from_file(self, filename, namespace = None, verbose=False):
 
 
@@ -267,53 +871,131 @@ class SymmetricTree:
         console.progress("Loading " + filename,1,1+shape[-1])
 
         #if the shape file has a different # of levels than our shape, we need to recreate our shape
-        if shape[-1] != self._shape[-1]:
+        if self._shape is None or shape[-1] != self._shape[-1]:
             console.writeline("Recreating symmetric tree to hold new shape")
             self.create(shape, namespace)
 
         #now, copy the shape to our new shape
+        #but keep our own level generations, since those name the arrays we actually have
+        generations = self._generations()
         self._shape[:] = shape[:]
+        self._set_generations(generations)
+        self._clear_reserved_blocks()
+
+        #the blocks we are about to load replace anything we have cached or reserved
+        self.clear_cache()
+        self._release_allocator()
 
         #track if any levels are expanded / contracted, and write that out at the end
         level_adjustments = []
 
+        #the files we are going to read -> (level, filename, header offset, length, type array?)
+        reads = []
+
         #now for all our arrays (which are created now that we ran create_from_def):
         for ax in range(len(self._arrays)):
 
-            #load this array using memory map in case its huge
-            a = np.load("{}.{}.npy".format(filename,ax),mmap_mode ='r',allow_pickle = False,fix_imports = False)
+            #skipped levels are never read and hold nothing
+            if ax in self.skip:
+                self._shape[ax * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_TOTAL] = len(self._arrays[ax])
+                self._shape[ax * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_USED] = 0
+                continue
 
-            #copy into appropriate array from memory mapped file
-            self._arrays[ax][:len(a)] = a[:]
+            #read just the header of the saved array to find out how long it is
+            (offset, length, dtype) = self._read_array_header("{}.{}.npy".format(filename,ax))
+            assert dtype == self._arrays[ax].dtype, "Level {} was saved as {} but the tree holds {}".format(ax, dtype, self._arrays[ax].dtype)
+            reads.append((ax, "{}.{}.npy".format(filename,ax), offset, length, False))
 
             #compare our array with the declared length of the loaded array
             if len(self._arrays[ax]) > self._shape[ax * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_TOTAL]:
                 level_adjustments.append("Level {} expanded.  Adjusting shape".format(ax))
-                self._shape[ax * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_TOTAL] = len(self._arrays[ax])
             elif len(self._arrays[ax]) < self._shape[ax * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_TOTAL]:
                 level_adjustments.append("Level {} contracted.  Adjusting shape".format(ax))
-                self._shape[ax * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_TOTAL] = len(self._arrays[ax])
+            self._shape[ax * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_TOTAL] = len(self._arrays[ax])
 
-            #now immediately free up anything that was allocated for the memory mapped array
-            del a
+            #if the saved level holds more than our level, grow our level to hold it
+            if length > len(self._arrays[ax]):
+                level_adjustments.append("Level {} grown to hold {} saved entries".format(ax, length))
+                shape_size = int(self._shape[ax * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_SHAPE])
+                self._grow_level(ax, -(-length // shape_size))
 
             #if integer shape, load a type array (for path types - since we store paths in our int arrays)
-            if self._shape[ax * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_TYPE] == 0:
-                #load this array using memory map in case its huge
-                #then copy its values into our corresponding shared type array
-                #and just like the regular array immediately delete the memory mapped array freeing space
-                t = np.load("{}.{}t.npy".format(filename,ax),mmap_mode ='r',allow_pickle = False,fix_imports = False)
-                self._types[ax][:len(t)] = t[:]
-                del t
-
-            #progress bar for user
-            console.progress("Loading " + filename,2+ax,1+shape[-1])
+            if SymmetricTree.has_types(self._shape[ax * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_TYPE]):
+                (offset, length, dtype) = self._read_array_header("{}.{}t.npy".format(filename,ax))
+                reads.append((ax, "{}.{}t.npy".format(filename,ax), offset, length, True))
+
+        #read every file straight into its level, several levels at a time
+        with ThreadPoolExecutor(max_workers=SymmetricTree.LOAD_THREADS) as pool:
+
+            #start reading every file
+            futures = [
+                pool.submit(self._read_into, name, self._types[ax] if types else self._arrays[ax], offset, length)
+                for (ax, name, offset, length, types) in reads
+            ]
+
+            #progress bar for user as each file finishes (raising any read errors)
+            for fx, future in enumerate(as_completed(futures)):
+                future.result()
+                console.progress("Loading " + filename,2+fx*shape[-1]//len(futures),1+shape[-1])
+
+        #replay any checkpoints made since the save
+        for (number, delta) in self._delta_files(filename):
+            with np.load(delta, allow_pickle = False) as d:
+                for ax in range(len(self._arrays)):
+                    if ax in self.skip: continue
+
+                    #grow the level if it grew after the save
+                    shape = d["shape"]
+                    (width,dtype,_,_) = self.levelinfo(ax)
+                    used = int(shape[ax * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_USED])
+                    if used * int(width) > len(self._arrays[ax]): self._grow_level(ax, used)
+
+                    #write the changed regions and take the used size of the checkpoint
+                    self._apply_regions(self._arrays[ax], d["{}r".format(ax)], d["{}".format(ax)], used * int(width))
+                    if SymmetricTree.has_types(dtype): self._apply_regions(self._types[ax], d["{}r".format(ax)], d["{}t".format(ax)], used * int(width))
+                    self._shape[ax * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_USED] = used
+            level_adjustments.append("Replayed checkpoint {}".format(number))
+
+        #nothing we loaded may point into the levels we skipped
+        if len(self.skip) > 0:
+            self._clear_pointers(self.skip)
+            level_adjustments.append("Skipped levels {}".format(sorted(self.skip)))
+
+        #what we just loaded is what is saved
+        self._clear_dirty()
+        self.base = filename
 
         #now, write out any adjustments made as needed
         console.writeline("")
         for adjustment in level_adjustments:
             console.writeline(adjustment)
 
+    #read the header of a saved .npy array -> returns (offset of data, length, dtype)
+    def _read_array_header(self, filename):
+        with open(filename, "rb") as f:
+            version = np.lib.format.read_magic(f)
+            if version == (1,0): (shape, fortran_order, dtype) = np.lib.format.read_array_header_1_0(f)
+            else: (shape, fortran_order, dtype) = np.lib.format.read_array_header_2_0(f)
+            return (f.tell(), int(np.prod(shape)), dtype)
+
+    #read the data of a saved .npy array straight into the memory of an array (like a shared memory buffer) in large chunks
+    def _read_into(self, filename, array, offset, length):
+
+        #get a byte view of just the part of the array we are reading into
+        view = memoryview(array[:length]).cast("B")
+
+        #read the file in chunks directly into that memory
+        with open(filename, "rb", buffering=0) as f:
+            f.seek(offset)
+            position = 0
+            while position < len(view):
+                read = f.readinto(view[position:position + SymmetricTree.LOAD_CHUNK_SIZE])
+                assert read, "{} ended after {} of {} bytes".format(filename, position, len(view))
+                position += read
+
+        #release our view of the memory (shared memory can't be closed while views of it exist)
+        view.release()
+
     #create a new tree from a shape
     #JBC: 2020-11-05 - reviewed for packed index use
     def _load_from_namespace(self, namespace):
@@ -326,55 +1008,28 @@ class SymmetricTree:
         #but we are not the creator
         self.namespace = namespace
         self.creator = False
+        self.base = None
 
         #clear current data structure
-        _arrays = []
+        self._clear_levels()
 
         #get our shape from shared list
+        #(namespaces created before the shape was 64 bit have a 32 bit shape, which we can tell by its size)
         self._shape_shm = mem.SharedMemory(name = "{}_s".format(namespace))
-        self._shape = np.ndarray((SymmetricTree.MAX_SHAPE_ARRAY_SIZE,),dtype=np.uint32,buffer = self._shape_shm.buf)
-        shape = self._shape
+        shape_dtype = SymmetricTree.SHAPE_DTYPE if self._shape_shm.size >= SymmetricTree.MAX_SHAPE_ARRAY_SIZE * np.dtype(SymmetricTree.SHAPE_DTYPE).itemsize else np.uint32
+        self._shape = np.ndarray((SymmetricTree.MAX_SHAPE_ARRAY_SIZE,),dtype=shape_dtype,buffer = self._shape_shm.buf)
+        self._shape.flags.writeable = not self.readonly
 
         #step through all sizess in the shape
-        #and create an array of max size to hold that shape
-        #plus a few additional values to help manage the array
-        for sx in range(shape[-1]):
-
-            #get array info
-            (shape,dtype,length,used) = self.levelinfo(sx)
-
-            #attached to shared memory within namespace
-            shm = mem.SharedMemory(name = "{}_{}".format(namespace,sx))
-
-            #save reference to the memory manager
-            self._managers.append(shm)
-
-            #create the array using shared memory
-            if dtype == 0:
-                #get the path array as unsigned int
-                path_array = np.ndarray((length,), dtype=np.uint32, buffer=shm.buf)
-
-                #now we need to attach to the type array
-                #which allows us to unpack the paths properly
-                tshm = mem.SharedMemory(name = "{}_{}t".format(namespace,sx))
-                type_array = np.ndarray((length,),dtype=np.uint8,buffer=tshm.buf)
-                self._type_managers.append(tshm)
-                self._types.append(type_array)
-
-            else:
-
-                #path array is float
-                path_array = np.ndarray((length,), dtype=np.float32, buffer=shm.buf)
-
-                #add a placeholder array so that later levels will have their type array index align with their data index
-                self._types.append([]) 
+        #and attach to the shared memory of each level within the namespace
+        #we do not need to set the initial shape value
+        #because we do not own the array, this should alrady be set
+        for sx in range(self._shape[-1]):
+            self._add_level(*self._map_level(sx, create = False))
 
-            #we do not need to set the initial shape value
-            #because we do not own the array, this should alrady be set
+        #remember which generation of each level we attached to
+        self._sync_generations()
 
-            #save that array
-            self._arrays.append(path_array)
-    
     #create a new tree from a shape
     #JBC: 2020-11-05 - reviewed for packed index use
     def create(self, shape, namespace = None, filename = None):
@@ -390,8 +1045,14 @@ class SymmetricTree:
         self.namespace = namespace
         self.creator = True
 
+        #a new tree has none of our cached paths or reserved blocks
+        self.clear_cache()
+        self._release_allocator()
+        self.filename = filename
+        self.base = filename
+
         #clear current data structure
-        self._arrays = []
+        self._clear_levels()
 
         #if in a shared namespace, we need to save off the shape
         #so that other namespaces can access us with just our name
@@ -405,7 +1066,7 @@ class SymmetricTree:
                 #allocate shaed memory for shape array
                 self._shape_shm = mem.SharedMemory(
                         create=True, 
-                        size=SymmetricTree.MAX_SHAPE_ARRAY_SIZE * SymmetricTree.NP_DATUM_SIZE,
+                        size=SymmetricTree.MAX_SHAPE_ARRAY_SIZE * np.dtype(SymmetricTree.SHAPE_DTYPE).itemsize,
                         name = "{}_s".format(namespace)
                 )
 
@@ -427,18 +1088,18 @@ class SymmetricTree:
             #if we got this far, the namespace did not exist and we allocated memory successfully
 
             #create shape array from that memory
-            self._shape = np.ndarray((SymmetricTree.MAX_SHAPE_ARRAY_SIZE,), dtype=np.uint32, buffer=self._shape_shm.buf)
+            self._shape = np.ndarray((SymmetricTree.MAX_SHAPE_ARRAY_SIZE,), dtype=SymmetricTree.SHAPE_DTYPE, buffer=self._shape_shm.buf)
 
         
         elif ondisk:
 
             #create a new shape array on disk (overwriting whatever was there before)
-            self._shape = np.lib.format.open_memmap("{}.shape.npy".format(filename),mode="w+",dtype=np.uint32, shape=(SymmetricTree.MAX_SHAPE_ARRAY_SIZE,))
+            self._shape = np.lib.format.open_memmap("{}.shape.npy".format(filename),mode="w+",dtype=SymmetricTree.SHAPE_DTYPE, shape=(SymmetricTree.MAX_SHAPE_ARRAY_SIZE,))
             
         else:
 
             #create a new shape array without a shared memory buffer reference
-            self._shape = np.ndarray((SymmetricTree.MAX_SHAPE_ARRAY_SIZE,), dtype=np.uint32)
+            self._shape = np.zeros((SymmetricTree.MAX_SHAPE_ARRAY_SIZE,), dtype=SymmetricTree.SHAPE_DTYPE)
 
 
         #if the shape passed is a list, load one way
@@ -451,10 +1112,30 @@ class SymmetricTree:
             #the shape (may) contain tuples with lengths and an int value defining the type
             for c in range(len(shape)):
                 self._shape[c * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_SHAPE] = shape[c][0] #array shape - how many items at a single level
-                self._shape[c * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_TYPE] = shape[c][1] #array type (int, float, etc)
+                self._shape[c * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_TYPE] = SymmetricTree.level_type(shape[c][1]) #array type (int, float, etc - by type or name)
                 self._shape[c * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_TOTAL] = shape[c][2] * shape[c][0] #total available space for array
                 self._shape[c * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_USED] = 0 #initial used size of array is ZERO
 
+            #levels can declare the level of their children (a 4th value) -> either one level for every slot
+            #or a list with the level for each slot position.  these levels derive their child levels from the shape
+            #so they keep a small child map in the shape instead of a type array the size of the level
+            offset = SymmetricTree.LOC_CHILD_MAP
+            for c in range(len(shape)):
+                if len(shape[c]) > 3 and shape[c][3] != None:
+
+                    #one level for every slot, or one for each slot position
+                    children = shape[c][3] if type(shape[c][3]) in (list, tuple) else [shape[c][3]] * shape[c][0]
+                    assert len(children) == shape[c][0], "Level {} declares {} child levels for {} slots".format(c, len(children), shape[c][0])
+                    assert SymmetricTree.is_index(self._shape[c * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_TYPE]), "Level {} declares child levels but is not an index level".format(c)
+
+                    #flag the level and write its child map
+                    self._shape[c * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_TYPE] += SymmetricTree.TYPE_DERIVED
+                    self._shape[offset:offset + len(children)] = children
+                    offset += len(children)
+
+            #make sure the child maps didn't run into the level generations (and reserved blocks) at the end of the shape
+            assert offset <= SymmetricTree.MAX_SHAPE_ARRAY_SIZE + SymmetricTree.LOC_LEVEL_GENERATION - 2 * len(shape) + 1, "Too many child levels declared in symmetric tree shape"
+
             #set filled values and zeros for remaining values
             #self._shape[:len(shape)] = shape[:]
             #self._shape[len(shape):-1] = 0
@@ -464,121 +1145,406 @@ class SymmetricTree:
             #copy in place as both are numpy
             self._shape[:] = shape[:]
 
-        #step through all sizess in the shape
-        #and create an array of max size to hold that shape
-        #plus a few additional values to help manage the array
-        for sx in range(self._shape[-1]):
-
-            #get level info
-            (s,dtype,length,used) = self.levelinfo(sx)
-
-            #if we are creating in a shared memory namespace
-            #we need to allocate that here and set the buffer
-            buffer = None
-            if namespace != None:
-
-                #allocate memory for data array (path or float)
-                shm = mem.SharedMemory(
-                    create=True, 
-                    size=int(length) * SymmetricTree.NP_DATUM_SIZE,
-                    name = "{}_{}".format(namespace,sx)
-                )
-
-                #only allocate memory for type array (just bytes hince the *1) if uint type
-                if dtype == 0:
-                    #allocate memory, save manager and buffer
-                    tshm = mem.SharedMemory(create=True, size=int(length) * 1,name = "{}_{}t".format(namespace,sx))
-                    self._type_managers.append(tshm)
-                    tbuffer = tshm.buf
-                else:
-                    #add a None for type managers so all type arrays align with data arrays
-                    self._type_managers.append(None)
+        #the size planned for each level (before a sparse tree trims it), which sizes its reservation in a namespace
+        self._planned = [int(self.levelinfo(sx)[2]) for sx in range(self._shape[-1])]
 
-                #save reference to the memory manager and buffer for all data arrays
-                self._managers.append(shm)
-                buffer = shm.buf
+        #sparse trees only allocate enough of each level for the blocks in use
+        #the rest of the declared size is grown into as blocks are allocated
+        if self.sparse:
+            for sx in range(self._shape[-1]):
+                (s,_,total,used) = self.levelinfo(sx)
+                blocks = min(int(total) // int(s), max(int(used), SymmetricTree.SPARSE_INITIAL_BLOCKS))
+                self._shape[sx * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_TOTAL] = blocks * int(s)
 
-            #create the array of appropriate type (type is defined in 2nd tuple item)
-            if dtype == 0:
+        #every level we create is a first generation level (it has never been grown)
+        assert self._shape[-1] * SymmetricTree.SHAPE_SIZE <= SymmetricTree.LOC_CHILD_MAP, "Too many levels in symmetric tree shape"
+        self._set_generations([0] * (int(self._shape[-1]) + 1))
+        self._clear_reserved_blocks()
 
-                #set the actual dtype
-                np_type = np.uint32
-
-            else:
+        #step through all sizess in the shape
+        #and create an array of max size to hold that shape (plus a type array for int levels)
+        #JBC 10-21-20 : no longer storing size in data arrays
+        for sx in range(self._shape[-1]):
+            self._add_level(*self._map_level(sx, create = True))
 
-                #set the actual dtype
-                np_type = np.float32
+        #remember which generation of each level we created
+        self._sync_generations()
 
-                #there is no type array here
-                type_array = []
+        #the first array in our tree defaults to size 1 (because there is only 1 level at the top)
+        self._shape[0 + SymmetricTree.LOC_USED] = 1
 
-            #if we are creating on disk, do that here
-            if ondisk:
+    #clear our references to all level arrays and their shared memory managers
+    def _clear_levels(self):
+        self._arrays = []
+        self._types = []
+        self._type_mods = []
+        self._dirty = []
+        self._managers = []
+        self._type_managers = []
+        self._dirty_managers = []
+        self._retired_managers = []
+        self._level_generations = []
+
+    #add a mapped level (data array, type array, dirty map and their shared memory managers) to our level lists
+    def _add_level(self, array, types, dirty, manager, type_manager, dirty_manager):
+        self._arrays.append(array)
+        self._types.append(types)
+        self._type_mods.append(max(1, len(types)))
+        self._dirty.append(dirty)
+        self._managers.append(manager)
+        self._type_managers.append(type_manager)
+        self._dirty_managers.append(dirty_manager)
+
+    #the name of the shared memory segment for a level array (suffix "t" is the type array)
+    #a level never moves to a new segment (it grows within its reservation), so this is the same for every generation
+    def _segment_name(self, sx, suffix = ""):
+        return "{}_{}{}".format(self.namespace, sx, suffix)
+
+    #the most entries a level can ever hold
+    #(trees with 64 bit index levels can point to, and so grow, much larger levels)
+    def _max_length(self, sx):
+        wide = any(self.levelinfo(l)[1] == 3 for l in range(self._shape[-1]))
+        max_size = SymmetricTree.MAX_WIDE_ARRAY_SIZE if wide else SymmetricTree.MAX_INDIVIDUAL_ARRAY_SIZE
+        shape = int(self._shape[sx * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_SHAPE])
+        return max_size // shape * shape
+
+    #how many entries a level we create in a namespace reserves -> its planned size times our reserve (in whole blocks)
+    #but never less than it holds now, or more than its max size
+    def _reservation(self, sx):
+        (shape,_,length,_) = self.levelinfo(sx)
+        planned = max(self._planned[sx] if sx < len(self._planned) else 0, int(length))
+        return min(max(-(-int(planned * self.reserve) // int(shape)) * int(shape), int(length)), self._max_length(sx))
+
+    #the most entries a level can hold -> in a namespace, only as many as its reservation
+    def _capacity(self, sx):
+        if self.namespace == None: return self._max_length(sx)
+        return self._managers[sx].size // np.dtype(SymmetricTree.level_dtype(self.levelinfo(sx)[1])).itemsize
+
+    #a view of the first length entries of the reserved shared memory of a level array
+    def _reserved_view(self, shm, dtype, length):
+        reservation = np.ndarray((shm.size // np.dtype(dtype).itemsize,), dtype=dtype, buffer=shm.buf)
+        reservation.flags.writeable = not self.readonly
+        return reservation[:min(int(length), len(reservation))]
+
+    #the file holding a level array on disk (suffix "t" is the type array)
+    def _level_filename(self, sx, suffix = ""):
+        return "{}.{}{}.npy".format(self.filename, sx, suffix)
+
+    #create or attach the storage for one level array
+    #returns (array, shared memory manager) -> the manager is None unless we are in a namespace
+    #reserved -> how many entries the array can ever hold (the size of its shared memory in a namespace)
+    def _map_array(self, sx, suffix, dtype, length, create, reserved = None):
+
+        #in a shared memory namespace
+        if self.namespace != None:
+
+            #allocate the whole reservation (only the pages we touch take memory) or attach to it
+            name = self._segment_name(sx, suffix)
+            if create:
+                assert int(length) <= int(reserved), "Level {} holds {} entries, more than the {} a shared level can reserve".format(sx, length, reserved)
+                shm = mem.SharedMemory(create=True, size=max(1, int(reserved) * np.dtype(dtype).itemsize), name=name)
+            else: shm = mem.SharedMemory(name=name)
+
+            #the array is the part of the reservation in use (that we can't write to if we are read-only)
+            return (self._reserved_view(shm, dtype, length), shm)
+
+        #on disk as a memory mapped file
+        if self.filename != None:
+            if create: return (np.lib.format.open_memmap(self._level_filename(sx, suffix), mode="w+", dtype=dtype, shape=(length,)), None)
+            return (np.load(self._level_filename(sx, suffix), mmap_mode='r' if self.readonly else 'r+', allow_pickle=False, fix_imports=False), None)
+
+        #otherwise we are creating not in shared memory
+        return (np.zeros((length,), dtype=dtype), None)
+
+    #create or attach all the storage for a level -> the data array, a type array if it is an int (path) level
+    #and the dirty map of the level (which regions of the level have changed since the last save or checkpoint)
+    #returns (array, type array, dirty map, manager, type manager, dirty manager)
+    def _map_level(self, sx, create):
 
-                #create our path array on disk
-                path_array = np.lib.format.open_memmap("{}.{}.npy".format(filename,sx),mode="w+",dtype=np_type, shape=(length,))
+        #get level info
+        (s,dtype,length,used) = self.levelinfo(sx)
+
+        #the actual dtype is defined by the type of the level
+        np_type = SymmetricTree.level_dtype(dtype)
+
+        #skipped levels aren't mapped when opening or attaching (they stay empty)
+        if sx in self.skip and not create:
+            types = np.zeros((0,), dtype=np.uint8) if SymmetricTree.has_types(dtype) else self._child_map(sx) if SymmetricTree.is_derived(dtype) else []
+            return (np.zeros((0,), dtype=np_type), types, np.zeros((0,), dtype=np.uint8), None, None, None)
+
+        #how much a level in a namespace reserves
+        reserved = self._reservation(sx)
+
+        #map the path (or float) array
+        array, manager = self._map_array(sx, "", np_type, length, create, reserved)
+
+        #for integer type levels, map the type array (which allows us to unpack the paths properly)
+        #levels that derive their child levels from the shape use their child map (one entry per slot position) instead
+        #and for floats, add a blank type array (there is no path type stored at the float level)
+        if SymmetricTree.has_types(dtype): types, type_manager = self._map_array(sx, "t", np.uint8, length, create, reserved)
+        elif SymmetricTree.is_derived(dtype): types, type_manager = self._child_map(sx), None
+        else: types, type_manager = [], None
+
+        #map the dirty map -> shared by every process in a namespace, otherwise only tracking our own changes
+        regions = -(-int(length) // SymmetricTree.DIRTY_REGION_SIZE)
+        if self.namespace != None: dirty, dirty_manager = self._map_array(sx, "d", np.uint8, regions, create, -(-reserved // SymmetricTree.DIRTY_REGION_SIZE))
+        else: dirty, dirty_manager = np.zeros((regions,), dtype=np.uint8), None
+
+        #return the mapped level
+        return (array, types, dirty, manager, type_manager, dirty_manager)
+
+    #extend our views of a level in a namespace to the part of its reservation now in use (nothing is mapped again or moved)
+    def _extend_level(self, sx):
+        (_,dtype,length,_) = self.levelinfo(sx)
+        self._arrays[sx] = self._reserved_view(self._managers[sx], SymmetricTree.level_dtype(dtype), length)
+        if SymmetricTree.has_types(dtype):
+            self._types[sx] = self._reserved_view(self._type_managers[sx], np.uint8, length)
+            self._type_mods[sx] = max(1, len(self._types[sx]))
+        self._dirty[sx] = self._reserved_view(self._dirty_managers[sx], np.uint8, -(-int(length) // SymmetricTree.DIRTY_REGION_SIZE))
+
+    #replace a mapped level with a newly mapped one, retiring (but never unlinking) the old shared memory
+    def _replace_level(self, sx, array, types, dirty, manager, type_manager, dirty_manager):
+
+        #the old managers (other processes may still be using them)
+        old = (self._managers[sx], self._type_managers[sx], self._dirty_managers[sx])
+
+        #a dirty map we keep locally would lose our changes, so carry them over
+        if dirty_manager == None:
+            regions = min(len(dirty), len(self._dirty[sx]))
+            dirty[:regions] |= self._dirty[sx][:regions]
+
+        #swap in the new level
+        self._arrays[sx] = array
+        self._types[sx] = types
+        self._type_mods[sx] = max(1, len(types))
+        self._dirty[sx] = dirty
+        self._managers[sx] = manager
+        self._type_managers[sx] = type_manager
+        self._dirty_managers[sx] = dirty_manager
+
+        #we can't close the old shared memory yet -> numpy doesn't hold on to the buffer it was given, so closing it would
+        #leave any views still taken from the old level (like infoset regret references) pointing at unmapped memory
+        #instead keep it mapped until the tree is unloaded (levels grow geometrically, so this is at most the size of the level)
+        self._retired_managers.extend([shm for shm in old if shm != None])
+
+    #close a shared memory manager -> only once no numpy array (or view) still uses its memory
+    def _close_manager(self, shm, unlink = False):
+
+        #unlink first (this always works, even while we still have the memory mapped)
+        if unlink:
+            try: shm.unlink()
+            except FileNotFoundError: pass
+
+        #then close our mapping
+        try: shm.close()
+        except BufferError: pass
+
+    #the generation of a level -> how many times it has been grown
+    def _level_generation(self, sx):
+        return int(self._shape[SymmetricTree.LOC_LEVEL_GENERATION - sx])
+
+    #get the tree generation followed by the generation of every level
+    def _generations(self):
+        return [int(self._shape[SymmetricTree.LOC_GENERATION])] + [self._level_generation(sx) for sx in range(self._shape[-1])]
+
+    #set the tree generation followed by the generation of every level
+    def _set_generations(self, generations):
+        self._shape[SymmetricTree.LOC_GENERATION] = generations[0]
+        for sx in range(len(generations)-1):
+            self._shape[SymmetricTree.LOC_LEVEL_GENERATION - sx] = generations[sx+1]
+
+    #remember the generations of the levels we currently have mapped
+    def _sync_generations(self):
+        self._generation = int(self._shape[SymmetricTree.LOC_GENERATION])
+        self._level_generations = [self._level_generation(sx) for sx in range(self._shape[-1])]
+
+    #re-attach any levels that another process has grown since we mapped them
+    #this is cheap to call (a single compare) when nothing has changed
+    def refresh(self):
+
+        #nothing has changed
+        if self._shape[SymmetricTree.LOC_GENERATION] == self._generation: return
+
+        #re-map only the levels that have a new generation (levels in a namespace just extend into their reservation)
+        for sx in range(self._shape[-1]):
+            if self._level_generation(sx) != self._level_generations[sx]:
+                if self._managers[sx] != None: self._extend_level(sx)
+                else: self._replace_level(sx, *self._map_level(sx, create = False))
 
-                #create our type array if int type
-                if dtype == 0: type_array = np.lib.format.open_memmap("{}.{}t.npy".format(filename,sx),mode="w+",dtype=np.uint8, shape=(length,))
+        #we are now up to date
+        self._sync_generations()
 
-            elif namespace != None:
+    #grow a level (geometrically) so that it can hold at least the given number of blocks
+    #every other process extends (or re-maps) its view of the level when it sees the new generation
+    #NOTE: this must be called while holding the allocator lock when other processes are attached to the tree
+    #the used part of the level never moves while other processes (or views like infoset regret references) may be writing to it
+    #a level in a namespace grows within the memory it reserved up front, and on disk the files grow in place (so the pages
+    #still mapped at the old length are the same pages).  only a local tree (which nothing else writes to) is copied
+    def _grow_level(self, level, blocks):
 
-                #create our path array in shared memory buffer
-                path_array = np.ndarray((length,), dtype=np_type, buffer=buffer)
+        #get level info
+        (shape,dtype,total,used) = self.levelinfo(level)
+        shape, total, used = int(shape), int(total), int(used)
 
-                #create type array if an int type
-                if dtype == 0: type_array = np.ndarray((length,), dtype=np.uint8, buffer=tbuffer)
+        #double the level (or more if needed) but never past the most it can hold
+        new_blocks = min(max(blocks, 2 * (total // shape)), self._capacity(level) // shape)
+        if self.namespace != None: assert new_blocks >= blocks, "Cannot grow level {} to {} blocks - its shared reservation only holds {} (declare a larger size or raise the reserve)".format(level, blocks, new_blocks)
+        assert new_blocks >= blocks, "Cannot grow level {} to {} blocks - maximum array size exceeded".format(level, blocks)
+        length = new_blocks * shape
+        prefix = min(used * shape, total)
 
-            else:
+        #on disk we grow the files themselves
+        if self.namespace == None and self.filename != None:
 
-                #here we are creating not in shared memory
-                path_array = np.ndarray((lengh,),dtype=np_type)
+            #grow the data array and its type array (if an int level)
+            SymmetricTree._grow_file(self._level_filename(level), prefix, length)
+            if SymmetricTree.has_types(dtype): SymmetricTree._grow_file(self._level_filename(level, "t"), prefix, length)
 
-                #create the type array if int type (path)
-                if dtype == 0: type_array = np.ndarray((length,),dtype=np.uint8)
+        #update the shape with our new total before mapping the new level
+        self._shape[level * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_TOTAL] = length
 
-            #set its initialize size and shape values
-            #JBC 10-21-20 : no longer storing size in data arrays
-            #path_array[-2] = s
+        #in a namespace the memory is already there, so we only extend our views of it
+        if self.namespace != None: self._extend_level(level)
 
-            #save that array and typpe array references
-            self._arrays.append(path_array)
-            self._types.append(type_array)
+        else:
 
-        #the first array in our tree defaults to size 1 (because there is only 1 level at the top)
-        self._shape[0 + SymmetricTree.LOC_USED] = 1
+            #map the new level (on disk this re-opens the grown files)
+            (array, types, dirty, manager, type_manager, dirty_manager) = self._map_level(level, create = self.filename == None)
+
+            #copy the used portion of a local level into the new storage (on disk the file already holds it)
+            if self.filename == None:
+                array[:prefix] = self._arrays[level][:prefix]
+                if SymmetricTree.has_types(dtype): types[:prefix] = self._types[level][:prefix]
+
+            #carry over the dirty map of the level, and swap in the new level
+            dirty[:len(self._dirty[level])] = self._dirty[level]
+            self._replace_level(level, array, types, dirty, manager, type_manager, dirty_manager)
+
+        #publish the new generation to every process attached to the tree
+        self._shape[SymmetricTree.LOC_LEVEL_GENERATION - level] = self._level_generation(level) + 1
+        self._shape[SymmetricTree.LOC_GENERATION] += 1
+        self._sync_generations()
+
+        #let the user know
+        console.writeline("Grew level {} to {} entries".format(level, length))
+
+    #the npy header a level file would have at a new length -> (header, offset of the data now, dtype)
+    #the header can only be rewritten in place if it is exactly as long as the current one
+    @staticmethod
+    def _file_header(filename, length):
+
+        #read the current header
+        with open(filename, "rb") as f:
+            version = np.lib.format.read_magic(f)
+            if version == (1,0): (_, fortran_order, dtype) = np.lib.format.read_array_header_1_0(f)
+            else: (_, fortran_order, dtype) = np.lib.format.read_array_header_2_0(f)
+            offset = f.tell()
+
+        #write the new header into a buffer
+        header = io.BytesIO()
+        d = {"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": fortran_order, "shape": (length,)}
+        if version == (1,0): np.lib.format.write_array_header_1_0(header, d)
+        else: np.lib.format.write_array_header_2_0(header, d)
+        return (header.getvalue(), offset, dtype)
+
+    #grow a level file on disk in place to the given length
+    #the npy header leaves room for the shape to grow, so normally we just rewrite the header and extend the file
+    @staticmethod
+    def _grow_file(filename, prefix, length):
+
+        #if the header fits, overwrite it and extend the file (the new space is sparse and zero filled)
+        (header, offset, dtype) = SymmetricTree._file_header(filename, length)
+        if len(header) == offset:
+            with open(filename, "r+b") as f:
+                f.write(header)
+                f.truncate(offset + length * dtype.itemsize)
+            return
+
+        #otherwise the file has to be rewritten (open makes room in the header of any file saved without it
+        #so this never happens while a tree is being written)
+        SymmetricTree._rewrite_file(filename, prefix, length)
+
+    #write a new level file with the used prefix of a level file and move it over the old one
+    #(numpy leaves room in the header of the new file for its shape to grow)
+    @staticmethod
+    def _rewrite_file(filename, prefix, length):
+        old = np.load(filename, mmap_mode='r', allow_pickle=False, fix_imports=False)
+        new = np.lib.format.open_memmap(filename + ".grow", mode="w+", dtype=old.dtype, shape=(length,))
+        new[:prefix] = old[:prefix]
+        new.flush()
+        del old, new
+        os.replace(filename + ".grow", filename)
 
     #allocate space for a new index
     #JBC: 2020-11-05 - reviewed for packed index use
     def _alloc_path(self, path):
 
-        #get the array referenced by the path
-        arr = self._arrays[path[1]]
+        #the allocator hands out blocks safely across every process attached to this tree
+        return self.allocator().alloc(path[1])
 
-        #get level info
-        (shape,_,total,used) = self.levelinfo(path[1])
+    #point a slot of an index level to a newly allocated block for the next tuple of a path
+    #allocating can grow this very level, so this returns our current (array, type array) for the level
+    #and whether we linked a new block (False if another process linked the slot first, then we use their block)
+    def _link(self, level, real_index, child):
+
+        #levels that derive their child levels from the shape only need the path to agree with the shape
+        derived = SymmetricTree.is_derived(self._shape[level * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_TYPE])
+        if derived and self._types[level][real_index % self._type_mods[level]] != child[1]:
+            raise ValueError("Level {} slot {} has child level {} but the path expects level {}".format(
+                level, real_index % self._type_mods[level], self._types[level][real_index % self._type_mods[level]], child[1]))
 
-        #have we exceeding maximum array size for this array?
-        assert ( used + 1 ) * shape <= total, "Cannot allocate space for path {} - MAX_INDIVIDUAL_ARRAY_SIZE exceeded".format(path)
+        #two processes can both find the slot empty, so we check it again and link it while holding the lock of the slot
+        return self.allocator().linking(level, real_index, self._link_locked, level, real_index, child, derived)
 
-        #is this new path going to overflow the storage value in our array?
-        assert (used + 1 ) <= 4294967295 , "Cannot allocate space for path {} - new size value {}+1 will overflow maxint".format(path,used)
+    #link a slot of an index level (must be called while holding its link lock) -> see _link
+    def _link_locked(self, level, real_index, child, derived):
 
-        #add a new item to the array
-        self._shape[path[1] * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_USED] += 1
+        #another process may have linked the slot (or grown the level) since we looked
+        self.refresh()
+        arr = self._arrays[level]
+        typ = self._types[level]
+        if arr[real_index] != 0: return (arr, typ, False)
 
-        #return that index (multiplied by segment size for this array)
-        return self._shape[path[1] * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_USED]
+        #allocate the block, then get our array references
+        block = self._alloc_path(child)
+        arr = self._arrays[level]
+        typ = self._types[level]
+
+        #make sure the block fits in the index type of this level
+        if block > np.iinfo(arr.dtype).max:
+            raise OverflowError("Block {} of level {} does not fit in the {} index level {}".format(block, child[1], arr.dtype, level))
+
+        #update the value of data and value of type (each in their own arrays)
+        arr[real_index] = block
+        if not derived: typ[real_index] = child[1]
+        self._mark_dirty(level, real_index)
+        return (arr, typ, True)
 
     #set a path
     #JBC: 2020-11-05 - reviewed for packed index use
     def set(self, path, value = None, mathop = None):
 
+        #skipped levels were never loaded
+        if len(path) > 0 and path[-1][1] in self.skip: raise ValueError("Level {} was skipped, so it can't be set".format(path[-1][1]))
+
+        #make sure we see any levels grown by other processes
+        self.refresh()
+
         #step through the path
         index = 0
         dtype = 0
         not_found = False
-        for px in range(len(path)):
+        start = 0
+
+        #if the block holding our leaf is cached, start at the leaf instead of the root
+        if self._cache != None and len(path) > 1:
+            key = tuple(path[:-1])
+            block = self._cache_lookup(key)
+            if block != None:
+                index = block[0]
+                start = len(path) - 1
+
+        for px in range(start, len(path)):
             #get the path tuple
             p = path[px]
 
@@ -586,7 +1552,13 @@ class SymmetricTree:
             #the "type" is actually just the array we are using
             arr = self._arrays[p[1]]
             typ = self._types[p[1]]
-            arr_size = self._shape[p[1] * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_SHAPE]
+            arr_size = int(self._shape[p[1] * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_SHAPE])
+
+            #a block allocated by another process can be past the end of our mapping of a level it has since grown
+            if (index-1) * arr_size + p[0] >= len(arr):
+                self.refresh()
+                arr = self._arrays[p[1]]
+                typ = self._types[p[1]]
 
             #JBC: 2020-11-05 - moved shape from index (packed) to its own array
             ##index contains both index and which shape type we are
@@ -597,14 +1569,10 @@ class SymmetricTree:
             real_index =  (index-1) * arr_size + p[0]
 
             #make sure real index does not overflow array size
-            if real_index > self._shape[p[1] * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_TOTAL]:
-
-                #this is an issue - save the array
-                #and end
+            #levels grow as blocks are allocated, so this means the path itself is invalid
+            if real_index >= self._shape[p[1] * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_TOTAL]:
                 console.error("Error, Path {} - Index for {} <{}> Overflow".format(path,p,real_index))
-                console.writeline("Saving symmetric tree to temporary file path and aborting...")
-                self.save("OVERFLOWN_TREE")
-                assert False, "Index over flow"
+                raise IndexError("Path {} overflows level {}".format(path, p[1]))
 
             #if we are on the last path, just set the value
             #we are done
@@ -613,6 +1581,12 @@ class SymmetricTree:
                 #allocate path (just to track the leaf array size)
                 #if not_found: self._alloc_path(p)
 
+                #remember the block holding this leaf for next time
+                if self._cache != None and start == 0 and px > 0: self._cache_store(key, index, p[1])
+
+                #this region of the level has changed since our last checkpoint
+                self._mark_dirty(p[1], real_index, len(value) if type(value) in (list,np.ndarray) else 1)
+
                 #figure out second index - note if we are updating
                 #just one value, this will be the same as our first index
                 #which is fine
@@ -654,12 +1628,13 @@ class SymmetricTree:
                 if arr[real_index] == 0: 
 
                     #update the value of data and value of type (each in their own arrays)
-                    arr[real_index] = self._alloc_path(path[px+1])
-                    typ[real_index] = path[px+1][1]
+                    #allocating can grow this very level, so get our array references again
+                    (arr, typ, _) = self._link(p[1], real_index, path[px+1])
                     not_found = True
 
                 #now get the next index (we don't care about the type here)
-                index = arr[real_index]
+                #(as a python int, since 64 bit unsigned numpy values do not mix well with python ints)
+                index = int(arr[real_index])
 
 
     #unpack a path (no longer unpacking value here)
@@ -676,8 +1651,8 @@ class SymmetricTree:
 
         #JBC: 2020-11-05 - no longer packing shape into index
         #index_shape = index % self._shape[-1]
-        index_size = self._shape[index_shape * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_SHAPE]
-        index_start = ( index - 1 ) * index_size
+        index_size = int(self._shape[index_shape * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_SHAPE])
+        index_start = ( int(index) - 1 ) * index_size
 
         #return that as a tuple
         return (
@@ -688,21 +1663,297 @@ class SymmetricTree:
         )
                 
     #get child paths given a path
+    #each child is (slot, level, index, starting index, size, child level) -> the slot and level make up its path tuple
+    #the block is read as a whole, so listing children only walks the tree once (to the block the path points to)
     def children(self, path = []) :
-        #locate parent if path is defined
-        child_value, starting_index, child_length, child_shape = self.unpack(path)
-        
-        #get all children
-        children = []
-        for i in range(starting_index,starting_index+child_length):
-            if self._arrays[child_shape][i] != 0: 
-                children.append(
-                    (i - starting_index, child_shape) + 
-                    self.unpack(path + [(i - starting_index, child_shape)])
-                )
+        #locate the block the path points to
+        start = self._path_block(path)
+        if start == None: return []
+
+        #read every child pointer of the block at once
+        (block, level) = start
+        (_, slots, levels, blocks) = self._expand(level, np.array([block], dtype=np.int64))
+        widths = self._level_widths()[levels]
 
         #return that list
-        return children
+        return list(zip(slots.tolist(), [level] * len(slots), blocks.tolist(), ((blocks - 1) * widths).tolist(), widths.tolist(), levels.tolist()))
+
+    #the width (shape) of every level as an array
+    def _level_widths(self):
+        return self._shape[SymmetricTree.LOC_SHAPE:int(self._shape[-1]) * SymmetricTree.SHAPE_SIZE:SymmetricTree.SHAPE_SIZE].astype(np.int64)
+
+    #the block (and its level) a path points to -> the root is block zero of level zero, None if the path doesn't exist
+    def _path_block(self, path):
+        if path == []: return (0, 0)
+        (index, level) = self.get(path, include_type = True)
+        if index == None or index == 0: return None
+        return (int(index), int(level))
+
+    #the real index of every slot of blocks of a level (one row per block)
+    #the root block is block zero, addressed from the end of its level
+    def _block_grid(self, level, blocks):
+        starts = (np.asarray(blocks, dtype=np.int64) - 1) * int(self._shape[level * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_SHAPE])
+        starts[starts < 0] += len(self._arrays[level])
+        return starts[:, None] + np.arange(int(self._shape[level * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_SHAPE]))
+
+    #expand blocks of a level into their children with numpy instead of stepping through every slot
+    #returns (rows, slots, child levels, child blocks) for every child pointer that is set, where rows are positions in blocks
+    #value levels have no children, so expanding them returns nothing
+    def _expand(self, level, blocks):
+
+        #empty results
+        empty = np.zeros((0,), dtype=np.int64)
+        (width, dtype, _, _) = self.levelinfo(level)
+        width = int(width)
+        if not SymmetricTree.is_index(dtype) or len(blocks) == 0: return (empty, empty, empty, empty)
+
+        #make sure we see any levels grown by other processes
+        self.refresh()
+        arr = self._arrays[level]
+        typ = self._types[level]
+
+        #the real index of every slot of every block
+        grid = self._block_grid(level, blocks)
+
+        #gather the blocks as rows and keep the slots that point somewhere
+        values = arr[grid]
+        (rows, slots) = np.nonzero(values)
+        children = values[rows, slots].astype(np.int64)
+
+        #the child level of each pointer comes from the child map of a derived level or the type array of the level
+        if SymmetricTree.is_derived(dtype): levels = np.asarray(typ[slots], dtype=np.int64)
+        else:
+
+            #values stored directly in an index level (like counters) have no type, and nothing points back to the root level
+            #so a zero type means the slot is a value, not a child
+            levels = np.asarray(typ[grid[rows, slots]], dtype=np.int64)
+            keep = levels != 0
+            (rows, slots, children, levels) = (rows[keep], slots[keep], children[keep], levels[keep])
+
+        #return our children
+        return (rows, slots, levels, children)
+
+    #walk a subtree one frontier (depth) at a time with numpy masks over whole blocks
+    #yields (levels, blocks, parents, slots) arrays for each frontier, starting with the node at path itself
+    #parents are rows of the previous frontier, so paths can be rebuilt by following them back up
+    #depth limits how many frontiers below the path are yielded (None for all of them)
+    def frontiers(self, path = [], depth = None):
+
+        #find the block our path points to
+        start = self._path_block(path)
+        if start == None: return
+
+        #the first frontier is just our starting block
+        (block, level) = start
+        levels = np.array([level], dtype=np.int64)
+        blocks = np.array([block], dtype=np.int64)
+        yield (levels, blocks, np.array([-1], dtype=np.int64), np.array([-1], dtype=np.int64))
+
+        #step down one frontier at a time
+        frontier = 0
+        while depth == None or frontier < depth:
+
+            #expand the blocks of each level in the frontier (in chunks so wide frontiers don't need huge gathers)
+            parts = []
+            for l in np.unique(levels).tolist():
+                rows = np.flatnonzero(levels == l)
+                for c in range(0, len(rows), SymmetricTree.FRONTIER_CHUNK):
+                    chunk = rows[c:c + SymmetricTree.FRONTIER_CHUNK]
+                    (r, slots, child_levels, child_blocks) = self._expand(l, blocks[chunk])
+                    if len(r) > 0: parts.append((child_levels, child_blocks, chunk[r], slots))
+
+            #nothing left to expand
+            if len(parts) == 0: return
+
+            #this is our next frontier
+            (levels, blocks, parents, slots) = [np.concatenate(part) for part in zip(*parts)]
+            frontier += 1
+            yield (levels, blocks, parents, slots)
+
+    #lazily walk a subtree depth first, yielding (path, level, block) for every node below path
+    #each block's children are read at once, and nothing is read until the walk gets there
+    #depth limits how far below path we walk (None for the whole subtree)
+    def walk(self, path = [], depth = None):
+
+        #find the block our path points to
+        start = self._path_block(path)
+        if start == None: return
+
+        #walk with a stack of nodes to expand
+        stack = [(list(path), start[1], start[0])]
+        while len(stack) > 0:
+            (node_path, level, block) = stack.pop()
+
+            #yield every node but the one we started at
+            if len(node_path) > len(path): yield (node_path, level, block)
+            if depth != None and len(node_path) - len(path) >= depth: continue
+
+            #push our children so the first one is walked next
+            (_, slots, levels, blocks) = self._expand(level, np.array([block], dtype=np.int64))
+            for c in range(len(slots) - 1, -1, -1):
+                stack.append((node_path + [(int(slots[c]), level)], int(levels[c]), int(blocks[c])))
+
+    #merge another tree with the same shape into this one, matching nodes by their path instead of their block
+    #paths only in the other tree are added to ours, and the blocks of leaf levels are summed
+    #leaves are the levels that are summed (every value level by default), the rest are followed as index levels
+    #both trees are walked together a frontier (chunk) at a time, so the other tree can be opened on disk and never loaded
+    #returns how many blocks of each level were summed
+    def merge(self, other, leaves = None):
+
+        #the trees must have the same shape
+        levels = int(self._shape[-1])
+        if int(other._shape[-1]) != levels or (self._level_widths() != other._level_widths()).any():
+            raise ValueError("Cannot merge trees with different shapes")
+        self._check_complete()
+        if leaves == None: leaves = [l for l in range(levels) if not SymmetricTree.is_index(self._shape[l * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_TYPE])]
+        merged = [0] * levels
+
+        #the blocks still to merge -> (level, our blocks, their blocks) starting from both roots
+        pending = [(0, np.zeros((1,), dtype=np.int64), np.zeros((1,), dtype=np.int64))]
+        while len(pending) > 0:
+            (level, ours, theirs) = pending.pop()
+
+            #merge a chunk of the blocks at a time
+            if len(ours) > SymmetricTree.FRONTIER_CHUNK:
+                pending.append((level, ours[SymmetricTree.FRONTIER_CHUNK:], theirs[SymmetricTree.FRONTIER_CHUNK:]))
+                (ours, theirs) = (ours[:SymmetricTree.FRONTIER_CHUNK], theirs[:SymmetricTree.FRONTIER_CHUNK])
+
+            #make sure we see any levels grown by other processes
+            self.refresh()
+            dtype = self._shape[level * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_TYPE]
+
+            #sum the blocks of leaf levels
+            if level in leaves:
+                grid = self._block_grid(level, ours)
+                self._arrays[level][grid] += other._arrays[level][other._block_grid(level, theirs)]
+                self._dirty[level][np.unique(grid // SymmetricTree.DIRTY_REGION_SIZE)] = 1
+                merged[level] += len(ours)
+                continue
+
+            #their children, and ours in the same slots
+            (rows, slots, child_levels, children) = other._expand(level, theirs)
+            if len(rows) == 0: continue
+            index = self._block_grid(level, ours[rows])[np.arange(len(rows)), slots]
+            ours_children = self._arrays[level][index].astype(np.int64)
+            ours_levels = np.asarray(self._types[level], dtype=np.int64)[slots if SymmetricTree.is_derived(dtype) else index % self._type_mods[level]]
+
+            #a slot that points to different levels in each tree can't be merged
+            clash = (ours_children > 0) & (ours_levels != child_levels)
+            if clash.any():
+                raise ValueError("Level {} slot {} points to level {} in one tree and level {} in the other".format(
+                    level, slots[clash][0], ours_levels[clash][0], child_levels[clash][0]))
+
+            #add the children we don't have yet, a run of new blocks for each level they are in
+            missing = ours_children == 0
+            for n in np.unique(child_levels[missing]):
+                rows_n = missing & (child_levels == n)
+                blocks = self._alloc_blocks(n, int(rows_n.sum()))
+                if blocks[-1] > np.iinfo(self._arrays[level].dtype).max:
+                    raise OverflowError("Block {} of level {} does not fit in the {} index level {}".format(blocks[-1], n, self._arrays[level].dtype, level))
+                self._arrays[level][index[rows_n]] = blocks
+                if SymmetricTree.has_types(dtype): self._types[level][index[rows_n]] = n
+                self._dirty[level][index[rows_n] // SymmetricTree.DIRTY_REGION_SIZE] = 1
+                ours_children[rows_n] = blocks
+
+            #merge the children next, level by level
+            for n in np.unique(child_levels):
+                pending.append((int(n), ours_children[child_levels == n], children[child_levels == n]))
+
+        #return how many blocks we summed
+        return merged
+
+    #resolve the leaf blocks of a block (like the regrets, strategy and stats of an infoset) with a single walk
+    #path leads to the block (a block of level), and leaves are the (slot, leaf level) of each leaf block we want from it
+    #returns ([a view of each whole leaf block, or None if it doesn't exist], [True for each leaf block we created])
+    #when creating, every missing block on the way (and every missing leaf block) is allocated
+    def resolve_leaves(self, path, level, leaves, create = False):
+
+        #make sure we see any levels grown by other processes
+        self.refresh()
+
+        #the block itself may be cached (then we don't walk at all)
+        key = tuple(path)
+        block = self._cache_lookup(key) if self._cache != None and len(path) > 0 else None
+        if block == None:
+            block = self._resolve_block(path, level, create)
+            if block == None: return ([None] * len(leaves), [False] * len(leaves))
+            if self._cache != None and len(path) > 0: self._cache_store(key, block[0], block[1])
+        (index, found) = block
+        if found != level: return ([None] * len(leaves), [False] * len(leaves))
+
+        #step through each leaf of the block
+        width = int(self._shape[level * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_SHAPE])
+        views = []
+        created = [False] * len(leaves)
+        for (lx, (slot, leaf)) in enumerate(leaves):
+
+            #skipped levels were never loaded
+            if leaf in self.skip:
+                views.append(None)
+                continue
+
+            #find the leaf block (allocating it if we are creating)
+            real_index = (index-1) * width + slot
+            (arr, typ) = (self._arrays[level], self._types[level])
+            if arr[real_index] == 0:
+                if not create:
+                    views.append(None)
+                    continue
+                (arr, typ, created[lx]) = self._link(level, real_index, (slot, leaf))
+            elif typ[real_index % self._type_mods[level]] != leaf:
+                views.append(None)
+                continue
+
+            #a view of the whole leaf block (which the caller writes through, so we treat it as changed)
+            leaf_width = int(self._shape[leaf * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_SHAPE])
+            start = (int(arr[real_index]) - 1) * leaf_width
+            if start + leaf_width > len(self._arrays[leaf]): self.refresh()
+            self._mark_dirty(leaf, start, leaf_width)
+            views.append(self._arrays[leaf][start:start + leaf_width])
+
+        #return the leaf blocks
+        return (views, created)
+
+    #walk a path to the block it leads to (a block of level) -> returns (block, level of the block) or None if it doesn't exist
+    #the root block (an empty path) is block zero
+    def _resolve_block(self, path, level, create = False):
+
+        #start at the root, or at the block holding the last tuple of the path if it is cached
+        (index, index_shape) = (0, 0)
+        start = 0
+        if self._cache != None and len(path) > 1:
+            block = self._cache_lookup(tuple(path[:-1]))
+            if block != None:
+                (index, index_shape) = block
+                start = len(path) - 1
+
+        #step through the path
+        for px in range(start, len(path)):
+            (slot, sx) = path[px]
+            if px > 0 and index_shape != sx: return None
+
+            #find the slot of this tuple (in a level that may have grown since we mapped it)
+            real_index = (index-1) * int(self._shape[sx * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_SHAPE]) + slot
+            if real_index >= len(self._arrays[sx]): self.refresh()
+            (arr, typ) = (self._arrays[sx], self._types[sx])
+
+            #the block holding the last tuple is what we cache
+            if px == len(path) - 1: holder = (index, index_shape)
+
+            #allocate the next block if it is missing (and we are creating)
+            if arr[real_index] == 0:
+                if not create: return None
+                (arr, typ, _) = self._link(sx, real_index, path[px+1] if px < len(path) - 1 else (0, level))
+
+            #move to the next block (as a python int, since 64 bit unsigned numpy values do not mix well with python ints)
+            index = int(arr[real_index])
+            index_shape = int(typ[real_index % self._type_mods[sx]])
+
+        #remember the block holding the last tuple for next time
+        if self._cache != None and start == 0 and len(path) > 1: self._cache_store(tuple(path[:-1]), *holder)
+
+        #return the block the path leads to
+        return (index, index_shape)
 
     #get child paths given a path
     def child(self, path, child_index) :
@@ -733,11 +1984,27 @@ class SymmetricTree:
             else:
                 return default
 
+        #skipped levels were never loaded, so nothing in them is found (or created)
+        if path[-1][1] in self.skip: return (default,0) if include_type else default
+
+        #make sure we see any levels grown by other processes
+        self.refresh()
+
         #step through the path
         not_found = False
         index = 0 #root path only ever has 1 item in it so index starts at zero
         index_shape = 0 #path root is always 0
-        for px in range(len(path)):
+        start = 0
+
+        #if the block holding our leaf is cached, start at the leaf instead of the root
+        if self._cache != None and len(path) > 1:
+            key = tuple(path[:-1])
+            block = self._cache_lookup(key)
+            if block != None:
+                (index, index_shape) = block
+                start = len(path) - 1
+
+        for px in range(start, len(path)):
             #get the path tuple
             p = path[px]
 
@@ -745,7 +2012,13 @@ class SymmetricTree:
             #the "type" is actually just the array we are using
             arr = self._arrays[p[1]]
             typ = self._types[p[1]]
-            arr_size = self._shape[p[1] * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_SHAPE]
+            arr_size = int(self._shape[p[1] * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_SHAPE])
+
+            #a block allocated by another process can be past the end of our mapping of a level it has since grown
+            if (index-1) * arr_size + p[0] >= len(arr):
+                self.refresh()
+                arr = self._arrays[p[1]]
+                typ = self._types[p[1]]
 
             #JBC: 2020-11-05 - no longer packing type into the index value
             #index contains both index and which shape type we are
@@ -774,6 +2047,9 @@ class SymmetricTree:
             #we are done
             if px == len(path)-1:
 
+                #remember the block holding this leaf for next time
+                if self._cache != None and start == 0 and px > 0: self._cache_store(key, index, index_shape)
+
                 #if it wasn't found, update to default
                 if not_found: 
                     #set default only if it's not none
@@ -782,6 +2058,9 @@ class SymmetricTree:
                         #if we are not saving, just return default
                         if not set_default: return default
 
+                        #this region of the level has changed since our last checkpoint
+                        self._mark_dirty(p[1], real_index, len(default) if type(default) in (list,np.ndarray) else items)
+
                         #set an array value from default
                         if type(default) in (list,np.ndarray):
                             #incoming deafult is an array, set it at location
@@ -805,13 +2084,15 @@ class SymmetricTree:
                     #get value at index, array reference, index, and type)
                     #if we are returning type long with data
                     if include_type:
-                        return ( arr[real_index] , typ[real_index] )
+                        return ( arr[real_index] , typ[real_index % self._type_mods[p[1]]] )
                     else: 
                         return arr[real_index]
 
                 else:
                     #get a range at index -> note that we are effectively returning a reference
                     #so the caller needs to handle that appropriately
+                    #since the caller can write through that reference, we treat the range as changed
+                    self._mark_dirty(p[1], real_index, items)
                     return arr[real_index:real_index+items]
 
             else:
@@ -834,11 +2115,219 @@ class SymmetricTree:
                     #there is nothing to return, but make a path
                     #because we are going to set the default
                     #JBC: 2020-11-05 - no longer packing type
-                    arr[real_index] = self._alloc_path(path[px+1]) #* self._shape[-1] + path[px+1][1]
-                    typ[real_index] = path[px+1][1]
+                    #allocating can grow this very level, so get our array references again
+                    (arr, typ, _) = self._link(p[1], real_index, path[px+1]) #* self._shape[-1] + path[px+1][1]
 
                     not_found = True
                     
                 #now get the next index
-                index = arr[real_index]
-                index_shape = typ[real_index]
+                #(as a python int, since 64 bit unsigned numpy values do not mix well with python ints)
+                index = int(arr[real_index])
+                index_shape = typ[real_index % self._type_mods[p[1]]]
+
+    #link a new block into each of a batch of slots of an index level (must be called while holding every link lock)
+    #slots another process linked first keep their block, the rest get a run of new blocks in each of their next levels
+    def _link_many(self, level, slots, next_levels, derived):
+
+        #another process may have linked some of the slots (or grown the level) since we looked
+        self.refresh()
+        empty = self._arrays[level][slots] == 0
+        (slots, next_levels) = (slots[empty], next_levels[empty])
+
+        #allocate new blocks in each of the next levels
+        for n in np.unique(next_levels):
+            new_slots = slots[next_levels == n]
+            new_blocks = self._alloc_blocks(n, len(new_slots))
+            if new_blocks[-1] > np.iinfo(self._arrays[level].dtype).max:
+                raise OverflowError("Block {} of level {} does not fit in the {} index level {}".format(new_blocks[-1], n, self._arrays[level].dtype, level))
+            self._arrays[level][new_slots] = new_blocks
+            if not derived: self._types[level][new_slots] = n
+            self._dirty[level][new_slots // SymmetricTree.DIRTY_REGION_SIZE] = 1
+
+    #allocate a contiguous run of new blocks in a level and return their (1 based) indexes
+    #this is the batched version of _alloc_path used by the vectorized path resolution below
+    def _alloc_blocks(self, level, count):
+
+        #the allocator hands out a contiguous run of blocks
+        start = self.allocator().alloc(level, count)
+
+        #return the indexes of those new blocks
+        return np.arange(start, start + count, dtype=np.int64)
+
+    #split a batch of paths into a 2d index array and a 2d level array
+    #paths can either be a 3d array (paths x tuples x (index,level)) or a 2d array of indexes
+    #with the levels passed separately (one level for each column, shared by every path)
+    def _batch_paths(self, paths, levels = None):
+
+        #a 3d array carries its own levels in the second member of each tuple
+        paths = np.asarray(paths, dtype=np.int64)
+        if paths.ndim == 3:
+            return paths[:,:,0], paths[:,:,1]
+
+        #otherwise the levels are shared by every path in the batch
+        assert levels is not None, "Levels are required when paths are passed as a 2d array of indexes"
+        levels = np.broadcast_to(np.asarray(levels, dtype=np.int64), paths.shape)
+
+        #return the index and level arrays
+        return paths, levels
+
+    #resolve a batch of paths to their offsets within the leaf level array
+    #every path in the batch must be the same length, and paths that do not exist are returned as -1
+    #if create is set, any missing paths are allocated (the batched version of get with set_default)
+    def resolve_many(self, paths, levels = None, create = False):
+
+        #make sure we see any levels grown by other processes
+        self.refresh()
+
+        #get our index and level arrays
+        indexes, levels = self._batch_paths(paths, levels)
+        (count, depth) = indexes.shape
+
+        #every path starts at the root block (level 0 only ever has 1 block)
+        block = np.ones(count, dtype=np.int64)
+        block_level = levels[:,0].copy()
+        found = np.ones(count, dtype=bool)
+
+        #paths into skipped levels are never found (or created)
+        if len(self.skip) > 0: found &= ~np.isin(levels[:,-1], list(self.skip))
+
+        #the width of each level so we can calculate real indexes for a whole column at once
+        widths = np.array([self._shape[l * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_SHAPE] for l in range(self._shape[-1])], dtype=np.int64)
+
+        #step through the paths one column at a time
+        for px in range(depth):
+
+            #get the level of every path at this column
+            level = levels[:,px]
+
+            #the level we landed in must match the level the path expects
+            #if it doesn't this path is not found (just like get)
+            found &= (block_level == level)
+
+            #calculate real index in array for every path
+            real_index = (block - 1) * widths[level] + indexes[:,px]
+
+            #blocks allocated by other processes can be past the end of our mapping of a level they have since grown
+            if count > 0 and (real_index >= np.array([len(a) for a in self._arrays])[level]).any(): self.refresh()
+
+            #if we are on the last column, we are done
+            if px == depth - 1:
+                return np.where(found, real_index, -1)
+
+            #read the next block (and its level) from each level referenced in this column
+            child = np.zeros(count, dtype=np.int64)
+            child_level = np.zeros(count, dtype=np.int64)
+            for l in np.unique(level[found]):
+                rows = found & (level == l)
+                child[rows] = self._arrays[l][real_index[rows]]
+                child_level[rows] = self._types[l][real_index[rows] % self._type_mods[l]]
+
+            #find any paths that do not exist yet
+            missing = found & (child == 0)
+            if missing.any():
+
+                #if we are not creating, these paths are simply not found
+                if not create:
+                    found &= ~missing
+
+                else:
+
+                    #allocate blocks for every missing path, level by level
+                    for l in np.unique(level[missing]):
+
+                        #several paths in the batch can share the same missing slot
+                        #so only allocate each unique slot once
+                        rows = missing & (level == l)
+
+                        #levels that derive their child levels from the shape only allocate paths that agree with the shape
+                        #(the rest are not found, just like get)
+                        derived = SymmetricTree.is_derived(self._shape[l * SymmetricTree.SHAPE_SIZE + SymmetricTree.LOC_TYPE])
+                        if derived:
+                            rows &= levels[:,px+1] == self._types[l][real_index % self._type_mods[l]]
+                            if not rows.any(): continue
+
+                        slots, first = np.unique(real_index[rows], return_index=True)
+                        next_levels = levels[:,px+1][rows][first]
+
+                        #allocate new blocks in each of the next levels (under every link lock, so no _link races us)
+                        self.allocator().locked(self._link_many, l, slots, next_levels, derived, stripe = -1)
+
+                        #now read back the blocks we just allocated
+                        child[rows] = self._arrays[l][real_index[rows]]
+                        child_level[rows] = self._types[l][real_index[rows] % self._type_mods[l]]
+
+            #move down to the next level
+            block = child
+            block_level = child_level
+
+        #an empty path resolves to nothing
+        return np.full(count, -1, dtype=np.int64)
+
+    #get a batch of paths - returns an array of values (or a 2d array of values if items > 1)
+    #paths that are not found return the default value
+    def get_many(self, paths, levels = None, default = 0, items = 1):
+
+        #resolve the paths to leaf offsets
+        offsets = self.resolve_many(paths, levels)
+        _, levels = self._batch_paths(paths, levels)
+        leaf_levels = levels[:,-1]
+
+        #start with all defaults (using the dtype of the first leaf level)
+        dtype = self._arrays[leaf_levels[0]].dtype if len(leaf_levels) > 0 else np.float32
+        values = np.full((len(offsets),) if items <= 1 else (len(offsets),items), default, dtype=dtype)
+
+        #gather values from each leaf level referenced
+        found = offsets >= 0
+        for l in np.unique(leaf_levels[found]):
+            rows = found & (leaf_levels == l)
+            if items <= 1:
+                values[rows] = self._arrays[l][offsets[rows]]
+            else:
+                values[rows] = self._arrays[l][offsets[rows][:,None] + np.arange(items)]
+
+        #return those values
+        return values
+
+    #set a batch of paths - creating any paths that do not exist yet
+    #values is an array with one value per path (or a 2d array with one row of values per path)
+    #note that math operations are unbuffered so paths repeated in the batch are all applied
+    def set_many(self, paths, values, levels = None, mathop = None):
+
+        #skipped levels were never loaded
+        if len(self.skip) > 0 and np.isin(self._batch_paths(paths, levels)[1][:,-1], list(self.skip)).any():
+            raise ValueError("Levels {} were skipped, so they can't be set".format(sorted(self.skip)))
+
+        #resolve the paths to leaf offsets - creating them as needed
+        offsets = self.resolve_many(paths, levels, create = True)
+        _, levels = self._batch_paths(paths, levels)
+        leaf_levels = levels[:,-1]
+
+        #paths that still don't resolve (like paths that disagree with a derived level) have nowhere to be written
+        if (offsets < 0).any():
+            raise ValueError("{} of {} paths could not be resolved, so they can't be set".format(int((offsets < 0).sum()), len(offsets)))
+
+        #a single value is applied to every path
+        values = np.asarray(values)
+        if values.ndim == 0: values = np.full(len(offsets), values)
+
+        #if we are setting rows of values, expand our offsets to cover each row
+        if values.ndim == 2: offsets = offsets[:,None] + np.arange(values.shape[1])
+
+        #handle different math operators for each leaf level referenced
+        for l in np.unique(leaf_levels):
+            rows = leaf_levels == l
+            arr = self._arrays[l]
+
+            #these regions of the level have changed since our last checkpoint
+            self._dirty[l][offsets[rows] // SymmetricTree.DIRTY_REGION_SIZE] = 1
+
+            if mathop == None:
+                arr[offsets[rows]] = values[rows]
+            elif mathop == SymmetricTree.MATH_ADD:
+                np.add.at(arr, offsets[rows], values[rows])
+            elif mathop == SymmetricTree.MATH_MULT:
+                np.multiply.at(arr, offsets[rows], values[rows])
+            elif mathop == SymmetricTree.MATH_DIV:
+                np.divide.at(arr, offsets[rows], values[rows])
+            elif mathop == SymmetricTree.MATH_SUB:
+                np.subtract.at(arr, offsets[rows], values[rows])
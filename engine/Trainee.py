@@ -13,9 +13,9 @@ class Trainee(Player):
     abstractor:GameAbstractor = None
 
     #we are configured via the same signature as Callidus
-    def configure(self, regretman:RegretManager, argmax = True):
+    def configure(self, regretman:RegretManager, argmax = True, sample = False):
 
-        #we don't actually need the argmax value, just matching signature of Callidus configure
+        #we don't actually need the argmax or sample values, just matching signature of Callidus configure
 
         #we just need the abstractor
         self.abstractor = regretman.game_abstractor
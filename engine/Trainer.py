@@ -7,15 +7,19 @@ import random
 import numpy as np
 import time
 import multiprocessing
+import os
+import contextlib
 import games
 from games import Game
 import engine.FastCopy as fastcopy
+import engine.Kernels as kernels
 from engine.Signaling import Signaling
 from engine.Callidus import Callidus
 from engine.Regrets import RegretManager
 from engine.Regrets import StrategyManager
 from engine.Regrets import InformationSet
 from engine.Trainee import Trainee
+from engine.Analyzer import Analyzer
 from engine.Traceable import Traceable
 from engine.GameStateAbstractor import GameStateAbstractor
 
@@ -51,8 +55,26 @@ class Trainer (Traceable):
     #we do not continue to train strategies with an average strategy below this
     strategyThreshold:float = 0.01 
 
+    #how we walk the actions of the trainee (opponents and chance are always sampled as the game steps them)
+    #full -> every action above the threshold at every node, and again from every step of the game
+    #external -> every action above the threshold at every node, once for each round (the path we take is the one we sampled)
+    #while the opponents play an action sampled from their current strategy -> the values we walk back are then already
+    #weighted by how likely the opponents were to reach them, so regrets are updated without weighting (see iterate)
+    #outcome -> one sampled action at every node (with explore of it spread over every valid action), once for each round
+    SAMPLING = ("full", "external", "outcome")
+    sampling = "full"
+    explore = 0.6
+
+    #the actions we walked and the actions regret-based pruning skipped in this process (see InformationSet.prune)
+    walked = 0
+    pruned = 0
+
+    #the counters each core adds to while training -> infoset reads, infoset writes, actions walked and actions pruned
+    COUNTERS = 4
+
     #iterate through the action tree
-    def iterate(self, gameState:dict, actions:dict, reachProbability:float, depth:int = 0):
+    #sampleProbability is the probability our sampling reached this node with (the updates of sampled nodes are weighted by its inverse)
+    def iterate(self, gameState:dict, actions:dict, reachProbability:float, depth:int = 0, sampleProbability:float = 1.0):
 
         #if the round is finished
         #get the utility and return
@@ -79,29 +101,49 @@ class Trainer (Traceable):
 
         #get our current strategy from the information set
         #this will update the strategy sum and then return the newly updated average strategy
-        strategy = infoSet.get_strategy(reachProbability)
+        #(sampled nodes are only reached some of the time, so their updates count for every time they are not)
+        weight = reachProbability / sampleProbability
+        strategy = infoSet.get_strategy(weight)
 
         #create a strategy manager for that strategy, to help compute regrets, etc
         #the strategy manager needs to know the # of action sets in order to compute regrets
         stratMan = StrategyManager(np.copy(strategy), self.game.abstractor.action_sets())
 
         #zero out strategies that are not possible
+        valid = np.ones(len(actions))
         for c in range(len(actions)):
             if not self.game.validAction(gameState, actions[c]):
                 strategy[c] = 0
+                valid[c] = 0
 
         #recompute strategy based on valid actions
-        if sum(strategy) != 0: strategy /= sum(strategy)
-        else:
-            bestActionIndex = 0
+        kernels.normalize(strategy, uniform = False)
 
+        #regret-based pruning skips the actions whose regret is deeply negative (outcome sampling only walks one action anyway)
+        pruned = infoSet.prune() if self.sampling != "outcome" else None
+
+        #outcome sampling walks one action -> sampled from our strategy mixed with exploring every valid action
+        #(sample holds how likely each action was to be sampled)
+        sampled = None
+        if self.sampling == "outcome":
+            sample = valid * (self.explore / max(valid.sum(), 1)) + strategy * (1 - self.explore)
+            kernels.normalize(sample)
+            sampled = random.choices(range(len(sample)), weights=sample, k=1)[0]
 
         #for each of the possible actions
         for c in range(len(actions)):
         
             #if this is a valid action we should iterate it
             #skip node if very low reach probability
-            if strategy[c] > self.strategyThreshold:
+            #(when sampling outcomes we only iterate the action we sampled, and the rest keep their strategy)
+            if sampled != None and c != sampled:
+                if valid[c] == 0: stratMan.strategy[c] = 0
+                continue
+
+            #(actions we pruned are skipped the same way)
+            if pruned is not None and pruned[c] and strategy[c] > self.strategyThreshold: Trainer.pruned += 1
+            if (strategy[c] > self.strategyThreshold and (pruned is None or not pruned[c])) or c == sampled:
+                Trainer.walked += 1
 
                 #compute new reach probability after this action
                 newReachProbability = reachProbability * strategy[c]
@@ -122,7 +164,9 @@ class Trainer (Traceable):
 
                 #get all possible next actions from state
                 #and call iterate with those            
-                utility, actionState = self.iterate(workingState, validActions, newReachProbability, depth+1)
+                #(a sampled action continues with the probability we sampled it)
+                childSample = sampleProbability * sample[c] if sampled != None else sampleProbability
+                utility, actionState = self.iterate(workingState, validActions, newReachProbability, depth+1, childSample)
 
                 #save action state
                 #JBC: 9/13/21 -> instead of returning final action state, return the current working state
@@ -130,10 +174,13 @@ class Trainer (Traceable):
                 #(because the outer training loop will call each step (which iterates that step and all further steps)
 
                 #actionStates[c] = actionState
-                actionStates[c] = workingState
+                #(when we walk each round once, the state we return is the end of the round we sampled)
+                actionStates[c] = workingState if self.sampling == "full" else actionState
 
                 #record utility in strategy manager
                 #JBC: 11/9/20 -> utility should NOT be multiplied by -1 because higher is better
+                #(a sampled action's utility is weighted by how unlikely it was to be sampled, so each action's value is unbiased)
+                if c == sampled: utility /= sample[c]
                 stratMan.set_counterfactual_value(c, utility)
 
             else:
@@ -156,7 +203,8 @@ class Trainer (Traceable):
         #JBC: 09/11/21 -> moved this outside of the action loop since it should update only once for all strategies
         #not update 3 times, once for each strategy
         #let the strat manager update the info set based on current reach probability
-        stratMan.update_regrets( infoSet , reachProbability)
+        #(with external sampling the opponents were sampled on their own strategy, so the sampled values need no weight)
+        stratMan.update_regrets( infoSet , 1.0 if self.sampling == "external" else weight)
 
         #now that we have looped through all actions - get the average strategy from the infoset / or from the current iteration
         #we have a setting that lets us decide if we should use the average strategy or active strategy
@@ -167,15 +215,16 @@ class Trainer (Traceable):
 
         #recalculate strategy against current (stratMan) strategy, to remove invalid actions
         #then renormalize them
-        strategy *= np.where(stratMan.strategy > 0, 1, stratMan.strategy)
-        if sum(strategy) != 0: strategy /= sum(strategy)
+        strategy[stratMan.strategy <= 0] = 0
+        kernels.normalize(strategy, uniform = False)
         
         #use argmax to pick an action from our strategy
         #bestActionIndex = np.argmax(strategy)
 
         #pick a random action from the strategy
         #but weight based on the strategy
-        bestActionIndex = random.choices(range(len(strategy)), weights=strategy, k=1)[0]
+        #(when sampling outcomes, the action we sampled is the only one we walked)
+        bestActionIndex = random.choices(range(len(strategy)), weights=strategy, k=1)[0] if sampled == None else sampled
 
         #set the trainee action to the best action we've found
         self.trainee.setNextAction(actions[bestActionIndex])
@@ -196,6 +245,11 @@ class Trainer (Traceable):
         #during poker training i always used average strategy, but testing out commodity training with active
         self.utilizeActiveStrategy = settings.get("utilizeActiveStrategy",False)
 
+        #how we walk the actions of the trainee (see SAMPLING) and how much outcome sampling explores
+        self.sampling = settings.get("sampling","full")
+        self.explore = settings.get("explore",0.6)
+        if self.sampling not in Trainer.SAMPLING: raise ValueError("Unknown sampling {} (use {})".format(self.sampling, ", ".join(Trainer.SAMPLING)))
+
         #all things about tracing
         seed = settings.get("randomSeed",0)
         self.argmax = settings.get("argmax",True)
@@ -207,8 +261,10 @@ class Trainer (Traceable):
         #if trace depth is -1 that means we are tracing all depths
         if self.traceDepth == -1: self.traceDepth = 1000
 
-        #seed the random number generator if a seed was provided
-        if seed != 0: random.seed(seed)
+        #seed the random number generators if a seed was provided (the games and the sampling of infoset stats)
+        if seed != 0:
+            random.seed(seed)
+            InformationSet.STATS_RANDOM.seed(seed)
 
     #iterate the game
     def traingame(self, game, gameState, signaling, step, default_strategy):
@@ -258,7 +314,8 @@ class Trainer (Traceable):
     #this allows the train function to kick off multiple processes during an epoch
     #training on different "steps" of the epoch (although the steps happen simultaneously)
     #identity -> the identity of this trainer in the buffer (passed by name)
-    def trainsteps(self, identity, buffer, steps, regretfile, settings:{}):
+    #counters -> shared counters of every core (COUNTERS per core) that we add our infoset reads and writes (and actions walked and pruned) to
+    def trainsteps(self, identity, buffer, steps, regretfile, settings:{}, counters = None):
 
         #configure based on given settings
         self.configure(settings)
@@ -295,7 +352,8 @@ class Trainer (Traceable):
         #create players - they will all be callidus for our purpose
         #then configure them all using the same regret manager
         players = [Trainee("p0",game)] + [Callidus("p{}".format(p),game) for p in range(1,game.seats)]
-        [c.configure(regretman, self.argmax) for c in players]
+        #(with external sampling the opponents sample their actions from their current strategy)
+        [c.configure(regretman, self.argmax, self.sampling == "external") for c in players]
 
         #the first player is our trainee
         self.trainee = players[0]
@@ -331,6 +389,9 @@ class Trainer (Traceable):
                 #acknowledge epoch start signal
                 #print("SLAVE {}: received epoch start signal - {}".format(identity,steps))
 
+                #the infoset reads and writes (and the actions walked and pruned) we have made so far
+                made = (InformationSet.reads_made, InformationSet.writes_made, Trainer.walked, Trainer.pruned)
+
                 #continue for our specified number of work units
                 for s in range(1,steps+1):
 
@@ -338,6 +399,9 @@ class Trainer (Traceable):
                     self.epoch = signaling.GetRegister(0)
                     self.step = signaling.GetRegister(1)
 
+                    #the iteration of this game (for update rules that weigh or discount each iteration)
+                    InformationSet.iteration = (self.epoch - 1) * steps + s
+
                     #reseting the game will shift player positions as well
                     gameState = self.game.reset(gameState)
 
@@ -366,6 +430,16 @@ class Trainer (Traceable):
                         #just run the game
                         gameState = self.traingame(game,gameState,signaling,s,regretman.get_default_strategy())
                         
+                #count the nodes we added in the used counts of the tree (before the master saves or evaluates it)
+                regretman.symm_tree.publish()
+
+                #add the reads and writes (and the actions walked and pruned) of this epoch to our counters (before the master sees we are done)
+                if counters != None:
+                    counters[identity * Trainer.COUNTERS] += InformationSet.reads_made - made[0]
+                    counters[identity * Trainer.COUNTERS + 1] += InformationSet.writes_made - made[1]
+                    counters[identity * Trainer.COUNTERS + 2] += Trainer.walked - made[2]
+                    counters[identity * Trainer.COUNTERS + 3] += Trainer.pruned - made[3]
+
                 #communicate that we are done with all work units
                 signaling.SetSignal(steps * game.rounds)
 
@@ -381,6 +455,19 @@ class Trainer (Traceable):
 
         #end of slave -> here we can do shutdown operations
 
+    #evaluate the nash value of a point-in-time snapshot of the regrets (run in its own process while training goes on)
+    #snapshot -> the regrets frozen by the master at the end of the epoch (training keeps writing to the live regrets while we simulate)
+    #the simulations go to nash.txt and only the result is written to the console
+    def evaluate(self, epoch, game:Game, snapshot:RegretManager, settings:{}):
+
+        #simulate quietly so we don't write over the training progress
+        with open(os.devnull, "w") as quiet, contextlib.redirect_stdout(quiet):
+            (control, actual) = Analyzer().nash(game, snapshot, settings)
+
+        #report the edge callidus had at that epoch
+        console.writeline("")
+        console.writeline("EVALUATION: Epoch {} Nash Edge: {:.2f}% Win Ratio, {:.2f} Utility".format(epoch, (actual[3] - control[3]) * 100, actual[4] - control[4]))
+
     #train a regret tree on a game
     def train(self, game:Game, regretman:RegretManager, settings:{}):
 
@@ -402,12 +489,26 @@ class Trainer (Traceable):
         resetEvery = settings.get("resetEvery",0)
         resetEvery = epochs + 1 if resetEvery == 0 else resetEvery
 
+        #checkpoint every N epochs (zero never checkpoints)
+        checkpointEvery = settings.get("checkpointEvery",0)
+
+        #checkpoint the regrets as they are before training (a full save if there is none yet)
+        #so regrets that can't checkpoint to the regret file fail now instead of after the first epochs
+        if checkpointEvery > 0: regretman.checkpoint(regretfile)
+
+        #evaluate nash every N epochs on a snapshot of the regrets, in the background (zero never evaluates)
+        nashEvery = settings.get("nashEvery",0)
+        evaluation = None
+
         #if cores is zero, we use all cores
         if cores == 0: cores = multiprocessing.cpu_count()
 
         #create our signaling object
         signaling = Signaling(slaves=cores, registers=2)
 
+        #the infoset reads and writes of each core (which don't need the stats level of every infoset) and the actions each walked and pruned
+        counters = multiprocessing.Array("q", Trainer.COUNTERS * cores, lock=False)
+
         #start all our training processes (if we have more than 1)
         processes = []
         workunits = int ( epochSize / cores)
@@ -415,7 +516,7 @@ class Trainer (Traceable):
         if cores > 1: 
             for c in range(0,cores):
                 console.progress("Registering Cores",c,cores)
-                p = multiprocessing.Process(target=self.trainsteps, args=(c,signaling.Name(),workunits,regretfile, settings,))
+                p = multiprocessing.Process(target=self.trainsteps, args=(c,signaling.Name(),workunits,regretfile, settings, counters,))
                 p.start()
                 processes.append(p)
         else:
@@ -452,11 +553,23 @@ class Trainer (Traceable):
                 #if we are training with 1 core only, then we don't sleep, we just call "trainsteps" on ourselves
                 #we would only train on 1 core if we are actually debugging, otherwise its always better to train on many cores
                 if cores == 1:
-                    self.trainsteps(0,signaling.Name(),workunits,regretfile, settings)
+                    self.trainsteps(0,signaling.Name(),workunits,regretfile, settings, counters)
                 else:
                     #we still have something going on
                     time.sleep(1)
 
+            #the reads and writes made over every infoset so far
+            regretman.aggregate_reads = sum(counters[0::Trainer.COUNTERS])
+            regretman.aggregate_writes = sum(counters[1::Trainer.COUNTERS])
+            regretman.aggregate_walked = sum(counters[2::Trainer.COUNTERS])
+            regretman.aggregate_pruned = sum(counters[3::Trainer.COUNTERS])
+
+            #show how much walking regret-based pruning has saved
+            if regretman.aggregate_pruned > 0:
+                console.writeline("")
+                console.writeline("MASTER: Pruned {} of {} Actions ({:.2f}%)".format(regretman.aggregate_pruned, regretman.aggregate_walked + regretman.aggregate_pruned,
+                                  regretman.aggregate_pruned / (regretman.aggregate_walked + regretman.aggregate_pruned) * 100))
+
             #after the first epoch, analyze the game state gathered in game state abstractor
             #if epoch == 1: self.stateAbstractor.abstractStates()
 
@@ -464,7 +577,27 @@ class Trainer (Traceable):
             if epoch == resetAfter or ( epoch % resetEvery == 0):
                 console.writeline("")
                 console.writeline("MASTER: Reseting Regrets...")
-                regretman.symm_tree._arrays[RegretManager.STRAT_PATH].fill(1/actionsets)
+                regretman.symm_tree.fill_level(RegretManager.STRAT_PATH, 1/actionsets)
+
+            #checkpoint the regrets (only the parts of the tree that changed since the last checkpoint are written)
+            if checkpointEvery > 0 and epoch % checkpointEvery == 0:
+                console.writeline("")
+                console.writeline("MASTER: Checkpointing Regrets...")
+                regretman.checkpoint(regretfile)
+
+            #start a nash evaluation of the regrets as they are now (unless the last one is still running)
+            if nashEvery > 0 and epoch % nashEvery == 0:
+                if evaluation != None and evaluation.is_alive():
+                    console.writeline("")
+                    console.writeline("MASTER: Skipping Evaluation (the last one is still running)...")
+                else:
+
+                    #snapshot the regrets before we signal the next epoch (which starts writing to them again)
+                    #the evaluation gets the frozen copy, so we don't need to hold on to it
+                    snapshot = regretman.snapshot()
+                    evaluation = multiprocessing.Process(target=self.evaluate, args=(epoch, game, snapshot, settings,))
+                    evaluation.start()
+                    snapshot = None
 
             #now that we are done with the epoch, make some updates
             console.writeline()
@@ -476,3 +609,6 @@ class Trainer (Traceable):
             #now, wait for all OUTCOMM buffers to be reset to 0
             signaling.WaitForSignal(SIGNAL_SLAVE_READY)
             signaling.SetSignal(SIGNAL_EPOCH_READY)
+
+        #wait for the last evaluation to finish before the regrets go away
+        if evaluation != None: evaluation.join()